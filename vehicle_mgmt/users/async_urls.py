@@ -0,0 +1,15 @@
+from django.urls import path
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# THE ROUTES OF users/urls.py WITH LOGIN AND REGISTER SWAPPED FOR THEIR ASYNC VERSIONS
+ASYNC_VIEWS = {
+    "register": async_views.register,
+    "login": async_views.login,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
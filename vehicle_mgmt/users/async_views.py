@@ -0,0 +1,56 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth import aauthenticate, alogin
+from django.shortcuts import redirect, render
+
+from .forms import AsyncRegistrationForm, CustomLoginForm
+from .views import create_pending_user
+
+logger = logging.getLogger(__name__)
+
+# NATIVE ASYNC VERSIONS OF THE LOGIN AND REGISTER PAGES, ROUTED BY users/async_urls.py
+# WHEN VEHICLE_ASYNC_VIEWS IS ON. Their password hashes run on the hashing pool
+# (users/hashing.py) instead of the event loop; otherwise they behave as the
+# views in users/views.py.
+
+
+# REGISTER: VALIDATE, HASH ON THE POOL, THEN THE SAME SAVE AS THE SYNC VIEW
+async def register(request):
+    # REPLACE THE LAZY USER SO TEMPLATES AND CONTEXT PROCESSORS DON'T QUERY FROM ASYNC CODE
+    request.user = await request.auser()
+    if request.method == "POST":
+        form = AsyncRegistrationForm(request.POST)
+        if await form.ais_valid():
+            try:
+                user = await sync_to_async(create_pending_user)(form)
+                messages.success(request, f"Registration successful! OTP sent to {user.email}. Please verify to activate your account.")
+                return redirect("verify_otp", username=user.username)
+            except Exception as e:
+                logger.error(f"Registration error: {e}")
+                messages.error(request, "Registration failed. Please try again.")
+        else:
+            messages.error(request, "Please correct the errors below.")
+    else:
+        form = AsyncRegistrationForm()
+    return render(request, "users/register.html", {"form": form})
+
+
+# LOGIN: THE BACKEND'S aauthenticate() LOOKS THE USER UP AND CHECKS THE PASSWORD ON THE POOL
+async def login(request):
+    request.user = await request.auser()
+    form = CustomLoginForm(request.POST or None)
+    if request.method == "POST" and form.is_valid():
+        user = await aauthenticate(
+            request, username=form.cleaned_data.get("login"), password=form.cleaned_data.get("password")
+        )
+        if user is not None:
+            await alogin(request, user)
+            messages.success(request, f"Welcome back, {user.username}!")
+            return redirect("vehicle_list")
+        elif getattr(request, "inactive_login", False):
+            messages.error(request, "Your account is not activated. Please check your email for OTP verification.")
+        else:
+            messages.error(request, "Invalid username/email or password.")
+    return render(request, "users/login.html", {"form": form})
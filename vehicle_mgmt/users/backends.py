@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .hashing import password_hashing
+
+UserModel = get_user_model()
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """
+    Log in with a username or an email address (any case), in one query.
+
+    The user is looked up by username or by lower(email), which the
+    user_email_ci_unique index covers, so a login is one indexed read
+    followed by the password check. An inactive user with the right
+    password isn't logged in; the request is flagged
+    (request.inactive_login) so the login page can say why.
+
+    aauthenticate() (used by the async login view) does the same with the
+    password check on the hashing pool (users/hashing.py), and upgrades a
+    hash made with an older hasher or iteration count when it matches.
+    """
+
+    def _login_users(self, login):
+        lookup = Q(username=login)
+        if "@" in login:
+            # SAME CONDITION AS THE PARTIAL INDEX, SO SQLITE AND POSTGRESQL CAN USE IT
+            lookup |= Q(email_lower=login.lower()) & ~Q(email="")
+        return UserModel._default_manager.alias(email_lower=Lower("email")).filter(lookup)[:2]
+
+    def _pick_login_user(self, users, login):
+        # A USERNAME THAT IS SOMEONE ELSE'S EMAIL ADDRESS BELONGS TO THE USERNAME
+        return next((user for user in users if user.username == login), users[0] if users else None)
+
+    def get_login_user(self, login):
+        """The user whose username (preferred) or email is `login`, or None"""
+        return self._pick_login_user(list(self._login_users(login)), login)
+
+    async def aget_login_user(self, login):
+        return self._pick_login_user([user async for user in self._login_users(login)], login)
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = self.get_login_user(username)
+        if user is None:
+            # HASH ANYWAY SO A MISSING ACCOUNT TAKES AS LONG AS A WRONG PASSWORD
+            UserModel().set_password(password)
+            return None
+        if not user.check_password(password):
+            return None
+        if not self.user_can_authenticate(user):
+            if request is not None:
+                request.inactive_login = True
+            return None
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = await self.aget_login_user(username)
+        # A MISSING USER STILL COSTS ONE HASH (SEE authenticate())
+        is_correct, upgraded = await password_hashing.check_password(
+            password, user.password if user is not None else None
+        )
+        if not is_correct:
+            return None
+        if upgraded is not None:
+            user.password = upgraded
+            await user.asave(update_fields=["password"])
+        if not self.user_can_authenticate(user):
+            if request is not None:
+                request.inactive_login = True
+            return None
+        return user
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.checks import Tags, Warning, register
+from django.db import connections, router
+
+
+# RUN BY migrate AND `check --database <alias>`: A DATABASE OTP CACHE NEEDS THE TABLE createcachetable MAKES
+@register(Tags.database)
+def check_otp_cache_table(app_configs, databases=None, **kwargs):
+    cache = caches[settings.OTP_CACHE_ALIAS]
+    if not isinstance(cache, DatabaseCache):
+        return []
+    warnings = []
+    for alias in databases or []:
+        if not router.allow_migrate_model(alias, cache.cache_model_class):
+            continue
+        if cache._table not in connections[alias].introspection.table_names():
+            warnings.append(Warning(
+                f"The OTP cache table '{cache._table}' does not exist in the '{alias}' database.",
+                hint="Run `python manage.py createcachetable` (after every change of OTP_CACHE_BACKEND or "
+                     "OTP_CACHE_LOCATION); until then registration codes can't be stored.",
+                obj=settings.OTP_CACHE_ALIAS,
+                id="users.W001",
+            ))
+    return warnings
@@ -1,11 +1,15 @@
+from asgiref.sync import sync_to_async
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
+from django.db.models.functions import Lower
+from .hashing import password_hashing
 from .models import CustomUser
 
 class CustomUserRegistrationForm(UserCreationForm):
     email = forms.EmailField(
         required=True,
+        max_length=254,
         widget=forms.EmailInput(attrs={
             'class': 'form-control',
             'placeholder': 'Enter your email address'
@@ -42,10 +46,15 @@ class CustomUserRegistrationForm(UserCreationForm):
 
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if CustomUser.objects.filter(email=email).exists():
+        # WHATEVER THE CASE, AS THE user_email_ci_unique INDEX ENFORCES
+        if CustomUser.objects.alias(email_lower=Lower("email")).filter(email_lower=email.lower()).exists():
             raise ValidationError("A user with this email already exists.")
         return email
 
+    def _get_validation_exclusions(self):
+        # clean_email() HAS CHECKED user_email_ci_unique WITH A FIELD ERROR; DON'T QUERY IT AGAIN
+        return super()._get_validation_exclusions() | {"email"}
+
     def save(self, commit=True):
         user = super().save(commit=False)
         user.email = self.cleaned_data["email"]
@@ -55,6 +64,27 @@ class CustomUserRegistrationForm(UserCreationForm):
         return user
 
 
+class AsyncRegistrationForm(CustomUserRegistrationForm):
+    """CustomUserRegistrationForm for async views: ais_valid() also hashes the password on the hashing pool"""
+
+    password_hash = None
+
+    async def ais_valid(self):
+        # THE USERNAME AND EMAIL CHECKS QUERY THE DATABASE
+        if not await sync_to_async(self.is_valid)():
+            return False
+        self.password_hash = await password_hashing.make_password(self.cleaned_data["password1"])
+        return True
+
+    def set_password_and_save(self, user, password_field_name="password1", commit=True):
+        user.password = self.password_hash
+        # AS set_password() DOES, SO THE PASSWORD VALIDATORS ARE TOLD OF THE CHANGE ON save()
+        user._password = self.cleaned_data[password_field_name]
+        if commit:
+            user.save()
+        return user
+
+
 class CustomLoginForm(forms.Form):
     login = forms.CharField(
         label="Username or Email", 
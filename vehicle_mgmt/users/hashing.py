@@ -0,0 +1,78 @@
+import asyncio
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+
+# PASSWORD HASHING OFF THE EVENT LOOP
+#
+# One PBKDF2 hash (Django's default hasher, PASSWORD_HASHERS[0]) is the most
+# CPU the login and register pages spend. Django's async auth helpers still
+# hash on the event loop, stalling every other request of an ASGI worker for
+# as long. The async views (users/async_views.py) hash here instead: on
+# PASSWORD_HASHING_WORKERS threads per process, so at most that many hashes
+# run at once and later ones queue. hashlib, bcrypt and argon2 release the
+# GIL while hashing, so the threads use as many cores as there are workers.
+
+
+class PasswordHashingPool:
+    """A bounded thread pool for password hashes, started on first use in each process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        # A FORKED WORKER INHERITS THE EXECUTOR BUT NOT ITS THREADS
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix="password-hashing"
+                )
+                self._pid = os.getpid()
+                atexit.register(self.shutdown)
+        return self._executor
+
+    async def run(self, function, *args):
+        """await function(*args) on the pool"""
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), function, *args)
+
+    async def make_password(self, password):
+        """The hash of password with the preferred hasher"""
+        return await self.run(make_password, password)
+
+    async def check_password(self, password, encoded):
+        """
+        (password matches, replacement hash or None).
+
+        The replacement is set when the password is right but was hashed
+        with an older hasher or fewer iterations than the preferred hasher
+        uses now; store it to upgrade the user's hash. A missing hash
+        (encoded None) still costs one hash, so it can't be told from a
+        wrong password by timing.
+        """
+        return await self.run(_check_password, password, encoded)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _check_password(password, encoded):
+    if encoded is None:
+        make_password(password)
+        return False, None
+    # verify_password() RUNS A DUMMY HASH ITSELF WHEN encoded IS UNUSABLE
+    is_correct, must_update = verify_password(password, encoded)
+    return is_correct, make_password(password) if is_correct and must_update else None
+
+
+password_hashing = PasswordHashingPool()
@@ -0,0 +1,208 @@
+import atexit
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import close_old_connections, connection, transaction
+
+from .otp import FAILED, RETRYING, SENT, get_otp_store
+
+logger = logging.getLogger(__name__)
+
+
+class MailPool:
+    """
+    Background delivery of registration emails.
+
+    send() queues a message once the current transaction commits, so the
+    request never waits on SMTP and never holds its transaction open for
+    it. OTP_EMAIL_WORKERS daemon threads send the queue; each keeps its
+    mail connection open between messages and closes it after
+    OTP_EMAIL_IDLE_SECONDS without work. A failed send is retried up to
+    OTP_EMAIL_MAX_RETRIES times, OTP_EMAIL_RETRY_DELAY seconds later and
+    doubling the wait each time; waiting retries are kept on a timer heap,
+    so a worker moves on to the next message meanwhile. The outcome is
+    kept in the OTP store for the verify page to poll.
+
+    When the queue is full the committing thread makes one attempt itself
+    and marks the code failed if it doesn't go through. With
+    OTP_EMAIL_WORKERS = 0 the committing thread sends every message, with
+    the retries (the test runner does this). Threads start on first use in
+    each process, and the queue is drained at interpreter exit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._stopping = threading.Event()
+        # MESSAGES QUEUED, BEING SENT OR WAITING FOR A RETRY (flush() WAITS FOR 0)
+        self._state = threading.Condition()
+        self._pending = 0
+        # (DUE monotonic TIME, SEQUENCE, MESSAGE, USERNAME, ATTEMPT) OF THE RETRIES WAITING
+        self._retries = []
+        self._sequence = itertools.count()
+
+    def _alive(self):
+        return self._pid == os.getpid() and any(thread.is_alive() for thread in self._threads)
+
+    def _ensure_started(self):
+        if self._alive():
+            return
+        with self._lock:
+            if self._alive():
+                return
+            self._queue = queue.Queue(maxsize=settings.OTP_EMAIL_QUEUE_SIZE)
+            self._stopping.clear()
+            self._pid = os.getpid()
+            with self._state:
+                self._pending = 0
+                self._retries = []
+            self._threads = [
+                threading.Thread(target=self._run, name=f"otp-mailer-{number}", daemon=True)
+                for number in range(settings.OTP_EMAIL_WORKERS)
+            ]
+            for thread in self._threads:
+                thread.start()
+            atexit.register(self.stop)
+
+    def send(self, message, username):
+        """Send an EmailMessage for username's code once the current transaction commits"""
+        transaction.on_commit(lambda: self._enqueue(message, username))
+
+    def _enqueue(self, message, username):
+        if not settings.OTP_EMAIL_WORKERS:
+            self._deliver_inline(message, username)
+            return
+        self._ensure_started()
+        with self._state:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((message, username, 0))
+        except queue.Full:
+            self._finished()
+            # A FULL QUEUE MEANS MAIL IS FAILING OR FAR BEHIND: ONE TRY HERE, NO RETRIES IN THE REQUEST
+            logger.warning("OTP email queue full, sending to %s in the request", username)
+            _close(self._attempt(None, message, username, attempt=0, retries=0)[0])
+
+    def _attempt(self, mail_connection, message, username, attempt, retries):
+        """One try: (connection to reuse or None, whether to retry)"""
+        store = get_otp_store()
+        try:
+            if mail_connection is None:
+                mail_connection = get_connection(fail_silently=False)
+                mail_connection.open()
+            mail_connection.send_messages([message])
+        except Exception as error:
+            _close(mail_connection)
+            if attempt >= retries:
+                logger.error("Failed to send OTP email to %s: %s", ", ".join(message.to), error)
+                store.set_delivery(username, FAILED)
+                return None, False
+            store.set_delivery(username, RETRYING)
+            return None, True
+        store.set_delivery(username, SENT)
+        return mail_connection, False
+
+    def _retry_delay(self, attempt):
+        return settings.OTP_EMAIL_RETRY_DELAY * 2 ** attempt
+
+    def _deliver_inline(self, message, username):
+        retries = settings.OTP_EMAIL_MAX_RETRIES
+        for attempt in range(retries + 1):
+            mail_connection, retry = self._attempt(None, message, username, attempt, retries)
+            _close(mail_connection)
+            if not retry:
+                return
+            time.sleep(self._retry_delay(attempt))
+
+    def _schedule_retry(self, message, username, attempt):
+        due = time.monotonic() + self._retry_delay(attempt - 1)
+        with self._state:
+            heapq.heappush(self._retries, (due, next(self._sequence), message, username, attempt))
+
+    def _requeue_due_retries(self):
+        """Move retries whose time has come (all of them once stopping) back onto the queue"""
+        now = time.monotonic()
+        with self._state:
+            while self._retries and (self._retries[0][0] <= now or self._stopping.is_set()):
+                due, sequence, message, username, attempt = self._retries[0]
+                try:
+                    self._queue.put_nowait((message, username, attempt))
+                except queue.Full:
+                    return
+                heapq.heappop(self._retries)
+
+    def _wait_time(self):
+        """How long a worker may wait for the queue: at most a second (to notice stop()) or until the next retry"""
+        with self._state:
+            if self._retries:
+                return min(1, max(0.01, self._retries[0][0] - time.monotonic()))
+        return 1
+
+    def _finished(self):
+        with self._state:
+            self._pending -= 1
+            self._state.notify_all()
+
+    def _run(self):
+        mail_connection = None
+        idle_since = time.monotonic()
+        while not (self._stopping.is_set() and self._pending == 0):
+            self._requeue_due_retries()
+            try:
+                message, username, attempt = self._queue.get(timeout=self._wait_time())
+            except queue.Empty:
+                if time.monotonic() - idle_since >= settings.OTP_EMAIL_IDLE_SECONDS:
+                    mail_connection = _close(mail_connection)
+                continue
+            close_old_connections()
+            retry = False
+            try:
+                mail_connection, retry = self._attempt(
+                    mail_connection, message, username, attempt, settings.OTP_EMAIL_MAX_RETRIES
+                )
+            except Exception:
+                logger.exception("Could not record the OTP email status of %s", username)
+            finally:
+                idle_since = time.monotonic()
+                if retry:
+                    self._schedule_retry(message, username, attempt + 1)
+                else:
+                    self._finished()
+        _close(mail_connection)
+        connection.close()
+
+    def flush(self):
+        """Block until every queued message has been sent or given up on (retries included)"""
+        if self._queue is not None and self._alive():
+            with self._state:
+                while self._pending and self._alive():
+                    self._state.wait(1)
+
+    def stop(self, timeout=10):
+        """Send what is queued, retrying waiting messages now, and stop the threads (registered with atexit)"""
+        if not self._alive():
+            return
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+def _close(mail_connection):
+    if mail_connection is not None:
+        try:
+            mail_connection.close()
+        except Exception:
+            pass
+    return None
+
+
+otp_mailer = MailPool()
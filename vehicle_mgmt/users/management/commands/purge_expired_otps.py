@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.otp import get_otp_store
+
+
+class Command(BaseCommand):
+    help = "Delete expired registration codes from the OTP store (run periodically, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        count = get_otp_store().purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} expired OTP entries."))
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-17 08:10
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def refuse_case_insensitive_duplicates(apps, schema_editor):
+    """
+    Stop, naming the accounts, when emails differing only in case exist.
+
+    The registration form used to compare emails case-sensitively, so
+    A@x.com and a@x.com may both be registered. Which account keeps the
+    address is for an administrator to decide; the index can be added once
+    they are merged or changed.
+    """
+    CustomUser = apps.get_model("users", "CustomUser")
+    users = (
+        CustomUser.objects.using(schema_editor.connection.alias)
+        .exclude(email="")
+        .annotate(email_lower=Lower("email"))
+    )
+    duplicates = list(
+        users.values("email_lower").annotate(count=Count("pk")).filter(count__gt=1)
+        .order_by("email_lower").values_list("email_lower", flat=True)
+    )
+    if not duplicates:
+        return
+    accounts = {}
+    clashing = users.filter(email_lower__in=duplicates).order_by("username")
+    for username, email in clashing.values_list("username", "email"):
+        accounts.setdefault(email.lower(), []).append(f"{username} <{email}>")
+    raise RuntimeError(
+        "Cannot add user_email_ci_unique: these accounts share an email address apart from case. "
+        "Change or merge them, then migrate again.\n"
+        + "\n".join(f"  {email}: {', '.join(accounts[email])}" for email in duplicates)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(refuse_case_insensitive_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), condition=models.Q(('email', ''), _negated=True), name='user_email_ci_unique', violation_error_message='A user with this email already exists.'),
+        ),
+    ]
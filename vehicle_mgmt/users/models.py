@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
 # Create your models here.
 
@@ -11,5 +12,16 @@ class CustomUser(AbstractUser):
     ]
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="user")
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # ONE ACCOUNT PER EMAIL WHATEVER ITS CASE; ALSO THE INDEX LOGIN LOOKS EMAILS UP BY (users/backends.py)
+            models.UniqueConstraint(
+                Lower("email"),
+                condition=~models.Q(email=""),
+                name="user_email_ci_unique",
+                violation_error_message="A user with this email already exists.",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.role})"
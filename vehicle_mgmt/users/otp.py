@@ -0,0 +1,175 @@
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connections, router
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+# PENDING REGISTRATION CODES
+#
+# register stores a code per username; verify_otp checks it. Codes expire
+# OTP_TTL_SECONDS after they were sent and allow OTP_MAX_ATTEMPTS tries.
+# settings.OTP_STORE names the store class; the default keeps codes in the
+# settings.OTP_CACHE_ALIAS cache, which every worker must share (the
+# database cache by default, Redis or Memcached in larger deployments).
+
+# DELIVERY STATUS OF A CODE'S EMAIL (users/mailer.py), POLLED BY THE VERIFY PAGE
+QUEUED = "queued"
+RETRYING = "retrying"
+SENT = "sent"
+FAILED = "failed"
+
+
+class OTPStore:
+    """
+    Where pending codes live.
+
+    Subclasses implement every method below; claim_attempt must be atomic
+    across workers.
+    """
+
+    def save(self, username, otp, email):
+        """Store a new code for username (replacing any earlier one and its attempts)"""
+        raise NotImplementedError
+
+    def get(self, username):
+        """{"otp", "email", "expires_at"} of username's code, or None once it expired"""
+        raise NotImplementedError
+
+    def claim_attempt(self, username):
+        """Use up one try: its number (1-based), or None when every try is used"""
+        raise NotImplementedError
+
+    def attempts(self, username):
+        """Tries used so far"""
+        raise NotImplementedError
+
+    def set_delivery(self, username, status):
+        """Record how sending username's code went (see users/mailer.py)"""
+        raise NotImplementedError
+
+    def delivery(self, username):
+        """The recorded delivery status; "queued" while a live code has none, None without a code"""
+        raise NotImplementedError
+
+    def delete(self, username):
+        raise NotImplementedError
+
+    def purge_expired(self):
+        """Remove expired entries the backend doesn't drop by itself; returns how many"""
+        raise NotImplementedError
+
+
+class CacheOTPStore(OTPStore):
+    """
+    Codes in a Django cache, expiring with the cache timeout.
+
+    Each try is a separate key added with cache.add(): add() only succeeds
+    for one caller (an INSERT on the primary key in the database cache,
+    SET NX in Redis), so concurrent guesses can't share a try.
+    """
+
+    def __init__(self, alias=None):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        # caches[] HANDS EACH THREAD ITS OWN CONNECTION, SO LOOK IT UP PER CALL
+        return caches[self.alias or settings.OTP_CACHE_ALIAS]
+
+    def _key(self, username):
+        return f"otp:{username}"
+
+    def _attempt_keys(self, username):
+        return [f"otp:{username}:attempt:{number}" for number in range(1, settings.OTP_MAX_ATTEMPTS + 1)]
+
+    def save(self, username, otp, email):
+        ttl = settings.OTP_TTL_SECONDS
+        self.cache.delete_many([self._delivery_key(username), *self._attempt_keys(username)])
+        self.cache.set(
+            self._key(username), {"otp": str(otp), "email": email, "expires_at": time.time() + ttl}, ttl
+        )
+
+    def get(self, username):
+        entry = self.cache.get(self._key(username))
+        # THE DATABASE AND FILE CACHES KEEP WHOLE SECONDS; DON'T OUTLIVE THE PROMISE
+        if entry is None or entry["expires_at"] <= time.time():
+            return None
+        return entry
+
+    def claim_attempt(self, username):
+        # TRIES LIVE NO LONGER THAN THE CODE; save() CLEARS THEM FOR A NEW ONE
+        for number, key in enumerate(self._attempt_keys(username), start=1):
+            if self.cache.add(key, True, settings.OTP_TTL_SECONDS):
+                return number
+        return None
+
+    def attempts(self, username):
+        return len(self.cache.get_many(self._attempt_keys(username)))
+
+    def _delivery_key(self, username):
+        return f"otp:{username}:delivery"
+
+    def set_delivery(self, username, status):
+        self.cache.set(self._delivery_key(username), status, settings.OTP_TTL_SECONDS)
+
+    def delivery(self, username):
+        # NOTHING IS WRITTEN WHEN A CODE IS QUEUED: NO STATUS YET MEANS "queued"
+        values = self.cache.get_many([self._key(username), self._delivery_key(username)])
+        if self._delivery_key(username) in values:
+            return values[self._delivery_key(username)]
+        return QUEUED if self._key(username) in values else None
+
+    def delete(self, username):
+        self.cache.delete_many(
+            [self._key(username), self._delivery_key(username), *self._attempt_keys(username)]
+        )
+
+    def purge_expired(self):
+        # OTHER BACKENDS (LOCMEM, REDIS, MEMCACHED) EXPIRE ENTRIES THEMSELVES
+        if isinstance(self.cache, DatabaseCache):
+            return _purge_database_cache(self.cache)
+        if isinstance(self.cache, FileBasedCache):
+            return _purge_file_cache(self.cache)
+        return 0
+
+
+def _purge_database_cache(cache):
+    db = router.db_for_write(cache.cache_model_class)
+    connection = connections[db]
+    table = connection.ops.quote_name(cache._table)
+    now = timezone.now().replace(microsecond=0)
+    if not settings.USE_TZ:
+        now = now.replace(tzinfo=None)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {connection.ops.quote_name('expires')} < %s",
+            [connection.ops.adapt_datetimefield_value(now)],
+        )
+        return cursor.rowcount
+
+
+def _purge_file_cache(cache):
+    purged = 0
+    for path in cache._list_cache_files():
+        try:
+            with open(path, "rb") as handle:
+                # _is_expired() DELETES THE FILE WHEN IT IS
+                purged += cache._is_expired(handle)
+        except FileNotFoundError:
+            pass
+    return purged
+
+
+@lru_cache
+def _load_store(path):
+    return import_string(path)()
+
+
+def get_otp_store():
+    """The configured store (settings.OTP_STORE), one instance per class"""
+    return _load_store(settings.OTP_STORE)
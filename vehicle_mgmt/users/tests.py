@@ -1,12 +1,33 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, AsyncClient, RequestFactory
+from django.contrib.auth import authenticate
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
 from django.contrib.auth import get_user_model
-from django.urls import reverse
+from django.urls import resolve, reverse
 from django.core import mail
 from django.contrib.messages import get_messages
 from .models import CustomUser
 from .forms import CustomUserRegistrationForm, CustomLoginForm
-from .views import otp_storage
+from .otp import CacheOTPStore, get_otp_store
+from .mailer import MailPool
+from .hashing import PasswordHashingPool
+from .checks import check_otp_cache_table
 from django.conf import settings
+from django.core.cache import caches
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import override_settings
+from io import StringIO
+from inspect import iscoroutinefunction
+from unittest import mock
+import asyncio
+import smtplib
+import tempfile
+import threading
+import time
 
 User = get_user_model()
 
@@ -80,8 +101,8 @@ class UserRegistrationViewTest(TestCase):
         """Set up test client and URLs"""
         self.client = Client()
         self.register_url = reverse('register')
-        # Clear otp_storage before each test
-        otp_storage.clear()
+        # Clear the OTP store before each test
+        caches[settings.OTP_CACHE_ALIAS].clear()
         
     def test_register_view_get_request(self):
         """Test GET request to register view"""
@@ -113,7 +134,7 @@ class UserRegistrationViewTest(TestCase):
         self.assertEqual(user.email, 'newreguser@test.com')
         
         # Check OTP was stored
-        self.assertIn('newreguser', otp_storage)
+        self.assertIsNotNone(get_otp_store().get('newreguser'))
         
         # Check redirect to OTP verification
         self.assertRedirects(response, reverse('verify_otp', kwargs={'username': 'newreguser'}))
@@ -276,7 +297,7 @@ class OTPVerificationViewTest(TestCase):
         self.client = Client()
         
         # Clear and set up OTP storage
-        otp_storage.clear()
+        caches[settings.OTP_CACHE_ALIAS].clear()
         
         # Create test user
         self.test_user = CustomUser.objects.create_user(
@@ -290,17 +311,13 @@ class OTPVerificationViewTest(TestCase):
         
         # Add OTP to storage (simulate registration process)
         self.test_otp = 123456
-        otp_storage['otp_test_user'] = {
-            'otp': self.test_otp,
-            'attempts': 0,
-            'email': 'otptest@test.com'
-        }
+        get_otp_store().save('otp_test_user', self.test_otp, 'otptest@test.com')
         
         self.verify_url = reverse('verify_otp', kwargs={'username': 'otp_test_user'})
 
     def tearDown(self):
         """Clean up OTP storage after each test"""
-        otp_storage.clear()
+        caches[settings.OTP_CACHE_ALIAS].clear()
 
     def test_verify_otp_view_get_request(self):
         """Test GET request to OTP verification view"""
@@ -323,7 +340,7 @@ class OTPVerificationViewTest(TestCase):
         self.assertTrue(self.test_user.is_active)
         
         # Check OTP is removed from storage
-        self.assertNotIn('otp_test_user', otp_storage)
+        self.assertIsNone(get_otp_store().get('otp_test_user'))
 
     def test_invalid_otp_verification(self):
         """Test invalid OTP increments attempts"""
@@ -334,12 +351,168 @@ class OTPVerificationViewTest(TestCase):
         self.assertEqual(response.status_code, 200)  # Stays on verification page
         
         # Check attempt was incremented
-        self.assertEqual(otp_storage['otp_test_user']['attempts'], 1)
+        self.assertEqual(get_otp_store().attempts('otp_test_user'), 1)
         
         # Check user is still inactive
         self.test_user.refresh_from_db()
         self.assertFalse(self.test_user.is_active)
 
+    def test_too_many_attempts(self):
+        """Test the code is dropped once every try is used"""
+        for remaining in (2, 1, 0):
+            response = self.client.post(self.verify_url, {'otp': '999999'})
+            self.assertContains(response, f'{remaining} attempts remaining')
+
+        response = self.client.post(self.verify_url, {'otp': str(self.test_otp)})
+        self.assertRedirects(response, reverse('register'))
+        self.assertIsNone(get_otp_store().get('otp_test_user'))
+        self.test_user.refresh_from_db()
+        self.assertFalse(self.test_user.is_active)
+
+    def test_expired_otp(self):
+        """Test a code is refused once OTP_TTL_SECONDS have passed"""
+        later = time.time() + settings.OTP_TTL_SECONDS + 1
+        with mock.patch('users.otp.time.time', return_value=later):
+            response = self.client.post(self.verify_url, {'otp': str(self.test_otp)})
+
+        self.assertRedirects(response, reverse('register'))
+        self.test_user.refresh_from_db()
+        self.assertFalse(self.test_user.is_active)
+
+class OTPStoreTest(TestCase):
+    """Test the cache-backed OTP store on the database and file caches"""
+
+    def setUp(self):
+        """Start from an empty store"""
+        self.store = CacheOTPStore()
+        self.store.cache.clear()
+
+    def test_attempts_are_claimed_once(self):
+        """Test each try number is handed out once, and a new code resets them"""
+        self.store.save('claim_user', 123456, 'claim@test.com')
+        claims = [self.store.claim_attempt('claim_user') for _ in range(settings.OTP_MAX_ATTEMPTS + 2)]
+        self.assertEqual(claims, [1, 2, 3, None, None])
+
+        # A NEW CODE STARTS WITH EVERY TRY AVAILABLE
+        self.store.save('claim_user', 654321, 'claim@test.com')
+        self.assertEqual(self.store.attempts('claim_user'), 0)
+        self.assertEqual(self.store.get('claim_user')['otp'], '654321')
+
+    def test_purge_expired_database_cache(self):
+        """Test the purge command deletes expired rows and keeps live ones"""
+        self.store.save('live_user', 111111, 'live@test.com')
+        self.store.cache.set('otp:stale_user', {'otp': '1', 'email': '', 'expires_at': 0}, -1)
+
+        out = StringIO()
+        call_command('purge_expired_otps', stdout=out)
+
+        self.assertIn('Purged 1 expired OTP entries', out.getvalue())
+        self.assertIsNotNone(self.store.get('live_user'))
+
+    def test_purge_expired_file_cache(self):
+        """Test purging works on the file-based cache as well"""
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            with override_settings(CACHES={**settings.CACHES, 'otp': file_cache}):
+                self.store.save('live_user', 111111, 'live@test.com')
+                self.store.cache.set('otp:stale_user', {'otp': '1', 'email': '', 'expires_at': 0}, 1)
+                with mock.patch('django.core.cache.backends.filebased.time.time', return_value=time.time() + 2):
+                    self.assertEqual(self.store.purge_expired(), 1)
+                self.assertIsNotNone(self.store.get('live_user'))
+
+    def test_missing_cache_table_check(self):
+        """Test the database check warns until createcachetable has made the OTP cache table"""
+        self.assertEqual(check_otp_cache_table(None, databases=['default']), [])
+
+        missing = {**settings.CACHES['otp'], 'LOCATION': 'missing_otp_cache'}
+        with override_settings(CACHES={**settings.CACHES, 'otp': missing}):
+            self.assertEqual(check_otp_cache_table(None), [])
+            warnings = check_otp_cache_table(None, databases=['default'])
+        self.assertEqual([warning.id for warning in warnings], ['users.W001'])
+        self.assertIn('missing_otp_cache', warnings[0].msg)
+
+class UsernameOrEmailBackendTest(TestCase):
+    """Test the one-query username-or-email backend and the case-insensitive email index"""
+
+    def setUp(self):
+        """Create an active and an inactive user"""
+        self.factory = RequestFactory()
+        self.user = CustomUser.objects.create_user(
+            username='backend_user', email='Backend.User@Test.com', password='backendpass123'
+        )
+        self.inactive_user = CustomUser.objects.create_user(
+            username='backend_inactive', email='inactive@test.com', password='backendpass123', is_active=False
+        )
+
+    def test_email_in_any_case_in_one_query(self):
+        """Test an email login ignores case and reads the user once"""
+        with self.assertNumQueries(1):
+            user = authenticate(self.factory.post('/'), username='backend.user@test.COM', password='backendpass123')
+        self.assertEqual(user, self.user)
+        self.assertEqual(authenticate(username='backend_user', password='backendpass123'), self.user)
+        self.assertIsNone(authenticate(username='backend_user', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody@test.com', password='backendpass123'))
+
+    def test_username_wins_over_someone_elses_email(self):
+        """Test a username that is another account's email logs in as that username"""
+        other = CustomUser.objects.create_user(
+            username='backend.user@test.com', email='other@test.com', password='otherpass123'
+        )
+        self.assertEqual(authenticate(username='backend.user@test.com', password='otherpass123'), other)
+
+    def test_inactive_user_is_flagged(self):
+        """Test an inactive account with the right password isn't logged in but is reported"""
+        request = self.factory.post('/')
+        self.assertIsNone(authenticate(request, username='inactive@test.com', password='backendpass123'))
+        self.assertTrue(request.inactive_login)
+
+        request = self.factory.post('/')
+        self.assertIsNone(authenticate(request, username='inactive@test.com', password='wrong'))
+        self.assertFalse(hasattr(request, 'inactive_login'))
+
+    def test_email_unique_ignoring_case(self):
+        """Test the index rejects an email differing only in case, but allows many blank emails"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CustomUser.objects.create_user(username='backend_copy', email='backend.user@test.com')
+        CustomUser.objects.create_user(username='no_email_1')
+        CustomUser.objects.create_user(username='no_email_2')
+
+        form = CustomUserRegistrationForm(data={
+            'username': 'backend_copy', 'email': 'BACKEND.USER@test.com', 'role': 'user',
+            'password1': 'complexpass123', 'password2': 'complexpass123',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('email', form.errors)
+
+class EmailIndexMigrationTest(TransactionTestCase):
+    """Test the migration adding user_email_ci_unique stops on emails that differ only in case"""
+
+    before = [('users', '0001_initial')]
+    after = [('users', '0002_email_ci_unique')]
+
+    def tearDown(self):
+        """Leave the schema migrated"""
+        call_command('migrate', 'users', verbosity=0)
+
+    def test_duplicates_are_named(self):
+        """Test the migration names the clashing accounts and applies once they are fixed"""
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        User = executor.loader.project_state(self.before).apps.get_model('users', 'CustomUser')
+        User.objects.create(username='dup_upper', email='Dup@Test.com')
+        User.objects.create(username='dup_lower', email='dup@test.com')
+        User.objects.create(username='no_email_a')
+        User.objects.create(username='no_email_b')
+
+        executor = MigrationExecutor(connection)
+        with self.assertRaisesMessage(RuntimeError, 'dup@test.com: dup_lower <dup@test.com>, dup_upper <Dup@Test.com>'):
+            executor.migrate(self.after)
+
+        User.objects.filter(username='dup_upper').update(email='other@test.com')
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+
+
 class UserLogoutViewTest(TestCase):
     """Test user logout functionality using OOP"""
     
@@ -486,3 +659,260 @@ class UserAccessControlTest(TestCase):
         # Both should be successful (user remains authenticated)
         self.assertEqual(response1.status_code, 200)
         self.assertEqual(response2.status_code, 200)
+
+
+class FlakyEmailBackend(LocMemEmailBackend):
+    """Locmem backend that fails the next `failures` sends and counts opened connections"""
+    lock = threading.Lock()
+    failures = 0
+    opened = 0
+    # SET TO AN EVENT TO HOLD THE MAILER THREADS' SENDS UNTIL IT IS SET
+    hold = None
+
+    def open(self):
+        with self.lock:
+            FlakyEmailBackend.opened += 1
+
+    def send_messages(self, messages):
+        if FlakyEmailBackend.hold is not None and threading.current_thread().name.startswith('otp-mailer'):
+            FlakyEmailBackend.hold.wait(5)
+        with self.lock:
+            if FlakyEmailBackend.failures:
+                FlakyEmailBackend.failures -= 1
+                raise smtplib.SMTPServerDisconnected('connection dropped')
+        return super().send_messages(messages)
+
+
+# A LOCAL-MEMORY OTP CACHE: MAILER THREADS MUST NOT WRITE TO THE TEST DATABASE
+@override_settings(
+    CACHES={**settings.CACHES, 'otp': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'otp-tests'}},
+    EMAIL_BACKEND='users.tests.FlakyEmailBackend',
+    OTP_EMAIL_RETRY_DELAY=0.01,
+    OTP_EMAIL_MAX_RETRIES=2,
+)
+class OTPEmailDeliveryTest(TestCase):
+    """Test OTP emails are sent after commit by the mailer, with retries and a pollable status"""
+
+    def setUp(self):
+        """Start from an empty store and a backend that works"""
+        get_otp_store().cache.clear()
+        FlakyEmailBackend.failures = 0
+        FlakyEmailBackend.opened = 0
+        FlakyEmailBackend.hold = None
+        self.registration = {
+            'username': 'mail_user', 'email': 'mailuser@test.com', 'role': 'user',
+            'password1': 'complexpass123', 'password2': 'complexpass123',
+        }
+
+    def status(self, username='mail_user'):
+        return self.client.get(reverse('otp_delivery_status', args=[username])).json()['status']
+
+    def message(self, number):
+        return EmailMessage('Code', f'code {number}', 'noreply@test.com', [f'user{number}@test.com'])
+
+    def test_email_is_sent_after_commit(self):
+        """Test registering only queues the email; it goes out once the transaction commits"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('register'), self.registration)
+        self.assertRedirects(response, reverse('verify_otp', kwargs={'username': 'mail_user'}))
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(self.status(), 'queued')
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(get_otp_store().get('mail_user')['otp'], mail.outbox[0].body)
+        self.assertEqual(self.status(), 'sent')
+
+    def test_status_without_a_code(self):
+        """Test polling for an unknown or used-up code reports it expired"""
+        self.assertEqual(self.status('nobody'), 'expired')
+
+    def test_worker_pool_retries_and_reuses_connections(self):
+        """Test the worker threads retry failed sends and keep their connection between messages"""
+        pool = MailPool()
+        self.addCleanup(pool.stop)
+        FlakyEmailBackend.failures = 1
+        with self.settings(OTP_EMAIL_WORKERS=2):
+            for number in range(6):
+                get_otp_store().save(f'pool_user{number}', 100000 + number, f'user{number}@test.com')
+                pool._enqueue(self.message(number), f'pool_user{number}')
+            pool.flush()
+
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual({get_otp_store().delivery(f'pool_user{number}') for number in range(6)}, {'sent'})
+        # ONE CONNECTION PER THREAD, PLUS ONE REOPENED AFTER THE FAILURE
+        self.assertLessEqual(FlakyEmailBackend.opened, 3)
+
+    def test_retry_waits_without_holding_up_the_queue(self):
+        """Test a worker sends the next message while a failed one waits for its retry"""
+        pool = MailPool()
+        FlakyEmailBackend.failures = 1
+        with self.settings(OTP_EMAIL_WORKERS=1, OTP_EMAIL_RETRY_DELAY=60):
+            for number in range(2):
+                get_otp_store().save(f'pool_user{number}', 100000 + number, f'user{number}@test.com')
+                pool._enqueue(self.message(number), f'pool_user{number}')
+            deadline = time.monotonic() + 5
+            while not mail.outbox and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual([message.to for message in mail.outbox], [['user1@test.com']])
+            self.assertEqual(get_otp_store().delivery('pool_user0'), 'retrying')
+
+            # STOPPING TRIES THE WAITING RETRY STRAIGHT AWAY
+            pool.stop()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(get_otp_store().delivery('pool_user0'), 'sent')
+
+    def test_full_queue_sends_once_from_the_request(self):
+        """Test an overflowing message gets one try in the request, with no retry sleeps"""
+        pool = MailPool()
+        self.addCleanup(pool.stop)
+        FlakyEmailBackend.hold = threading.Event()
+        self.addCleanup(FlakyEmailBackend.hold.set)
+        with self.settings(OTP_EMAIL_WORKERS=1, OTP_EMAIL_QUEUE_SIZE=1, OTP_EMAIL_RETRY_DELAY=60):
+            for number in range(3):
+                get_otp_store().save(f'pool_user{number}', 100000 + number, f'user{number}@test.com')
+            # THE WORKER HOLDS THE FIRST MESSAGE, THE SECOND FILLS THE QUEUE
+            pool._enqueue(self.message(0), 'pool_user0')
+            while not pool._queue.empty():
+                time.sleep(0.01)
+            pool._enqueue(self.message(1), 'pool_user1')
+
+            FlakyEmailBackend.failures = 1
+            started = time.monotonic()
+            with self.assertLogs('users.mailer', 'WARNING'):
+                pool._enqueue(self.message(2), 'pool_user2')
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertEqual(get_otp_store().delivery('pool_user2'), 'failed')
+
+            FlakyEmailBackend.hold.set()
+            pool.flush()
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['user0@test.com', 'user1@test.com'])
+
+    def test_gives_up_after_the_retries(self):
+        """Test a message that keeps failing is logged and marked failed"""
+        get_otp_store().save('mail_user', 123456, 'mailuser@test.com')
+        FlakyEmailBackend.failures = 3
+        with self.assertLogs('users.mailer', 'ERROR'):
+            MailPool()._enqueue(self.message(0), 'mail_user')
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(self.status(), 'failed')
+
+
+
+@override_settings(ROOT_URLCONF='vehicle_mgmt.async_urls')
+class AsyncLoginRegisterViewsTest(TestCase):
+    """Test the async login and register views hash on the hashing pool and behave as the sync ones"""
+
+    def setUp(self):
+        """Create an active and an inactive user"""
+        get_otp_store().cache.clear()
+        self.client = AsyncClient()
+        self.user = CustomUser.objects.create_user(
+            username='async_login_user', email='AsyncLogin@test.com', password='asyncpass123', is_active=True
+        )
+        CustomUser.objects.create_user(
+            username='async_inactive', email='asyncinactive@test.com', password='asyncpass123', is_active=False
+        )
+
+    def messages(self, response):
+        return [str(message) for message in get_messages(response.asgi_request)]
+
+    async def test_routes_use_async_views(self):
+        """Test the async urlconf routes login and register to coroutine views"""
+        for name in ('login', 'register'):
+            self.assertTrue(iscoroutinefunction(resolve(reverse(name)).func))
+        self.assertFalse(iscoroutinefunction(resolve(reverse('logout')).func))
+
+    async def test_login(self):
+        """Test a login by email logs the user in; wrong or inactive logins say why"""
+        response = await self.client.post(reverse('login'), {'login': 'asynclogin@test.com', 'password': 'asyncpass123'})
+        self.assertRedirects(response, reverse('vehicle_list'), fetch_redirect_response=False)
+        self.assertEqual(int(await self.client.session.aget('_auth_user_id')), self.user.pk)
+
+        response = await AsyncClient().post(reverse('login'), {'login': 'async_login_user', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Invalid username/email or password.', self.messages(response))
+
+        response = await AsyncClient().post(reverse('login'), {'login': 'async_inactive', 'password': 'asyncpass123'})
+        self.assertIn(
+            'Your account is not activated. Please check your email for OTP verification.', self.messages(response)
+        )
+
+    async def test_login_upgrades_an_old_hash(self):
+        """Test a hash with fewer iterations than the hasher's is replaced on the next login"""
+        hasher = PBKDF2PasswordHasher()
+        self.user.password = hasher.encode('asyncpass123', hasher.salt(), iterations=1000)
+        await self.user.asave(update_fields=['password'])
+
+        response = await self.client.post(reverse('login'), {'login': 'async_login_user', 'password': 'asyncpass123'})
+        self.assertRedirects(response, reverse('vehicle_list'), fetch_redirect_response=False)
+        await self.user.arefresh_from_db()
+        self.assertEqual(hasher.decode(self.user.password)['iterations'], hasher.iterations)
+        self.assertTrue(self.user.check_password('asyncpass123'))
+
+    def test_register(self):
+        """Test registering saves an inactive user with a usable hash and sends the OTP"""
+        registration = {
+            'username': 'async_new_user', 'email': 'asyncnew@test.com', 'role': 'user',
+            'password1': 'complexpass123', 'password2': 'complexpass123',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = async_to_sync(self.client.post)(reverse('register'), registration)
+        self.assertRedirects(response, reverse('verify_otp', kwargs={'username': 'async_new_user'}),
+                             fetch_redirect_response=False)
+        user = CustomUser.objects.get(username='async_new_user')
+        self.assertFalse(user.is_active)
+        self.assertTrue(user.check_password('complexpass123'))
+        self.assertEqual(len(mail.outbox), 1)
+
+        response = async_to_sync(self.client.post)(reverse('register'), registration)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('username', response.context['form'].errors)
+
+
+class PasswordHashingPoolTest(TestCase):
+    """Test the hashing pool runs hashes off the event loop, at most PASSWORD_HASHING_WORKERS at once"""
+
+    async def test_concurrency_limit(self):
+        """Test no more hashes run at once than there are workers"""
+        pool = PasswordHashingPool()
+        self.addCleanup(pool.shutdown)
+        lock = threading.Lock()
+        running = []
+        peak = 0
+
+        def hash_slowly(number):
+            nonlocal peak
+            with lock:
+                running.append(number)
+                peak = max(peak, len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(number)
+            return number
+
+        with self.settings(PASSWORD_HASHING_WORKERS=2):
+            results = await asyncio.gather(*(pool.run(hash_slowly, number) for number in range(6)))
+        self.assertEqual(results, list(range(6)))
+        self.assertEqual(peak, 2)
+
+    async def test_event_loop_keeps_running(self):
+        """Test other coroutines run while a password is hashed"""
+        pool = PasswordHashingPool()
+        self.addCleanup(pool.shutdown)
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        encoded = await pool.make_password('hashpass123')
+        ticker.cancel()
+        self.assertGreater(ticks, 1)
+        self.assertEqual(await pool.check_password('hashpass123', encoded), (True, None))
+        self.assertEqual(await pool.check_password('wrong', encoded), (False, None))
+        self.assertEqual(await pool.check_password('hashpass123', None), (False, None))
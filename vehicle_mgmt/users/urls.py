@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path("register/", views.register, name="register"),
     path("verify-otp/<str:username>/", views.verify_otp, name="verify_otp"),
+    path("verify-otp/<str:username>/status/", views.otp_delivery_status, name="otp_delivery_status"),
     path("login/", views.login, name="login"),
     path("logout/", views.logout_view, name="logout"),
 ]
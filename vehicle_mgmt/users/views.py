@@ -1,48 +1,34 @@
 from django.shortcuts import render, redirect
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
 from django.contrib.auth import authenticate, login as auth_login , logout
 from django.contrib import messages
 from django.db import transaction
-from django.db.models import Q
 from django.contrib.auth.decorators import login_required
 import random
 import logging
 from django.conf import settings
 from .forms import CustomUserRegistrationForm, CustomLoginForm
 from .models import CustomUser
+from .mailer import otp_mailer
+from .otp import get_otp_store
+from vehicle_mgmt.query_budgets import query_budget
 
 logger = logging.getLogger(__name__)
-# TEMPORARY STORING THE OTP'S (BETTER USE CACHE /REDIS IN REAL APPS)
-otp_storage = {}
 
 # Your existing register function...
+# WITH THE DEFAULT DATABASE CACHE, STORING THE OTP IS 6 OF THE POST'S QUERIES (SEE users/otp.py)
+@query_budget(get=0, post=12)
 def register(request):
     if request.method == "POST":
         form = CustomUserRegistrationForm(request.POST)
         if form.is_valid():
             try:
-                with transaction.atomic():
-                    user = form.save(commit=False)
-                    user.is_active = False  # DEACTIVATE UNTIL OTP IS VERIFIED
-                    user.save()
+                user = create_pending_user(form)
+                messages.success(request, f"Registration successful! OTP sent to {user.email}. Please verify to activate your account.")
+                return redirect("verify_otp", username=user.username)
 
-                    # GENERATE OTP 
-                    otp = random.randint(100000, 999999)
-                    otp_storage[user.username] = {
-                        'otp': otp,
-                        'attempts': 0,
-                        'email': user.email  # Store email for verification
-                    }
-
-                    # SEND OTP VIA EMAIL
-                    email_sent = send_otp_email(user, otp)
-                    
-                    if email_sent:
-                        messages.success(request, f"Registration successful! OTP sent to {user.email}. Please verify to activate your account.")
-                        return redirect("verify_otp", username=user.username)
-                    else:
-                        messages.error(request, "Registration completed, but failed to send OTP email. Please contact support.")
-                        
             except Exception as e:
                 logger.error(f"Registration error: {e}")
                 messages.error(request, "Registration failed. Please try again.")
@@ -53,36 +39,52 @@ def register(request):
     
     return render(request, "users/register.html", {"form": form})
 
+def create_pending_user(form):
+    """Save a valid registration form as an inactive user and send the OTP that activates it"""
+    with transaction.atomic():
+        user = form.save(commit=False)
+        user.is_active = False  # DEACTIVATE UNTIL OTP IS VERIFIED
+        user.save()
+
+        # GENERATE OTP 
+        otp = random.randint(100000, 999999)
+        get_otp_store().save(user.username, otp, user.email)
+
+        # SEND OTP VIA EMAIL (IN THE BACKGROUND, ONCE THIS TRANSACTION COMMITS)
+        send_otp_email(user, otp)
+    return user
+
 # ADD THIS MISSING verify_otp FUNCTION:
+# READING THE OTP, CLAIMING A TRY AND DROPPING THE CODE ARE 7 QUERIES ON THE DATABASE CACHE
+@query_budget(get=0, post=9)
 def verify_otp(request, username):
     if request.method == "POST":
         entered_otp = request.POST.get("otp")
-        
-        if username in otp_storage:
-            stored_data = otp_storage[username]
-            stored_otp = stored_data['otp']
-            attempts = stored_data.get('attempts', 0)
-            
-            if attempts >= 3:
+        store = get_otp_store()
+        stored_data = store.get(username)
+
+        if stored_data is not None:
+            # EVERY TRY USES ONE UP, ATOMICALLY, SO PARALLEL GUESSES CAN'T GET EXTRA ONES
+            attempt = store.claim_attempt(username)
+
+            if attempt is None:
                 messages.error(request, "Too many failed attempts. Please register again.")
-                del otp_storage[username]
+                store.delete(username)
                 return redirect("register")
-            
-            if str(stored_otp) == entered_otp:
+
+            if stored_data['otp'] == entered_otp:
                 try:
                     user = CustomUser.objects.get(username=username)
                     user.is_active = True
                     user.save()
-                    del otp_storage[username]  # REMOVE OTP FROM STORAGE
+                    store.delete(username)  # REMOVE OTP FROM STORAGE
                     messages.success(request, "Your account has been activated successfully! Please login.")
                     return redirect("login")
                 except CustomUser.DoesNotExist:
                     messages.error(request, "User not found.")
                     return redirect("register")
             else:
-                # Increment attempts
-                otp_storage[username]['attempts'] = attempts + 1
-                remaining_attempts = 3 - (attempts + 1)
+                remaining_attempts = settings.OTP_MAX_ATTEMPTS - attempt
                 messages.error(request, f"Invalid OTP. {remaining_attempts} attempts remaining.")
         else:
             messages.error(request, "OTP expired or invalid. Please register again.")
@@ -91,30 +93,23 @@ def verify_otp(request, username):
     return render(request, "users/verify_otp.html", {"username": username})
 
 # ADD THIS MISSING login FUNCTION:
+# POST: ONE INDEXED USER LOOKUP (users/backends.py), THEN THE SESSION AND LAST-LOGIN WRITES
+@query_budget(get=0, post=9)
 def login(request):
     form = CustomLoginForm(request.POST or None)
     if request.method == "POST" and form.is_valid():
         login_input = form.cleaned_data.get("login")  # username or email
         password = form.cleaned_data.get("password")
 
-        try:
-            user_obj = CustomUser.objects.get(Q(username=login_input) | Q(email=login_input))
-            
-            # Check if user exists but is inactive
-            if not user_obj.is_active:
-                messages.error(request, "Your account is not activated. Please check your email for OTP verification.")
-                return render(request, "users/login.html", {"form": form})
-            
-            # Now authenticate the active user
-            user = authenticate(request, username=user_obj.username, password=password)
-            
-        except CustomUser.DoesNotExist:
-            user = None
+        # ONE QUERY: USERNAME OR EMAIL, PASSWORD AND is_active ARE CHECKED BY THE BACKEND
+        user = authenticate(request, username=login_input, password=password)
 
         if user is not None:
             auth_login(request, user)
             messages.success(request, f"Welcome back, {user.username}!")
             return redirect("vehicle_list")  # Redirect after login
+        elif getattr(request, "inactive_login", False):
+            messages.error(request, "Your account is not activated. Please check your email for OTP verification.")
         else:
             messages.error(request, "Invalid username/email or password.")
 
@@ -122,17 +117,16 @@ def login(request):
 
 # Your existing send_otp_email function...
 def send_otp_email(user, otp):
-    """Send OTP email with better formatting and error handling"""
-    try:
-        subject = "Vehicle Management System - Account Verification"
-        message = f"""
+    """Queue the OTP email; users/mailer.py sends it after commit, retrying on failure"""
+    subject = "Vehicle Management System - Account Verification"
+    message = f"""
 Hello {user.username},
 
 Welcome to Vehicle Management System!
 
 Your account verification code is: {otp}
 
-Please enter this code to activate your account. This code is valid for 10 minutes.
+Please enter this code to activate your account. This code is valid for {settings.OTP_TTL_SECONDS // 60} minutes.
 
 Account Details:
 - Username: {user.username}
@@ -144,20 +138,21 @@ If you didn't create this account, please ignore this email.
 Best regards,
 Vehicle Management Team
         """
-        
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send OTP email to {user.email}: {e}")
-        return False
+
+    otp_mailer.send(
+        EmailMessage(subject=subject, body=message, from_email=settings.EMAIL_HOST_USER, to=[user.email]),
+        user.username,
+    )
+
+
+# POLLED BY THE VERIFY PAGE UNTIL THE EMAIL IS SENT OR GIVEN UP ON
+@query_budget(1)
+@require_GET
+def otp_delivery_status(request, username):
+    return JsonResponse({"status": get_otp_store().delivery(username) or "expired"})
 
 
+@query_budget(4)
 @login_required
 def logout_view(request):
     """Custom logout view with success message"""
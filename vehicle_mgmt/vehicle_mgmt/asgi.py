@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vehicle_mgmt.settings')
+# Serve the vehicle pages with the async views (vehicle_mgmt/async_urls.py)
+os.environ.setdefault('VEHICLE_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
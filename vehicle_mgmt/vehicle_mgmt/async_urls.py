@@ -0,0 +1,15 @@
+"""
+URL configuration used when VEHICLE_ASYNC_VIEWS is on (see asgi.py).
+
+Same routes as vehicle_mgmt/urls.py, with the vehicle pages, login and
+register served by the native async views in vehicles/async_views.py and
+users/async_views.py.
+"""
+from django.urls import path,include
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path("vehicles/", include("vehicles.async_urls")),  # Vehicle app (async views)
+    path("users/", include("users.async_urls")),  # Login and register (async views)
+    *[pattern for pattern in sync_urlpatterns if str(pattern.pattern) not in ("vehicles/", "users/")],
+]
@@ -0,0 +1,49 @@
+from importlib import import_module
+
+from django.urls import URLPattern, URLResolver
+
+# PER-VIEW QUERY BUDGETS
+#
+# Every view routed by the URL confs below declares the most SQL queries one
+# request may run, with @query_budget on the function or the view class.
+# QueryBudgetTest (vehicles/tests.py, added to full runs by
+# vehicle_mgmt/runner.py) requests every route on a small and a larger data
+# set and fails when a route has no budget, goes over it, or runs more
+# queries on the larger data set than on the small one.
+BUDGETED_URLCONFS = ("vehicles.urls", "users.urls")
+
+
+def query_budget(limit=None, **per_method):
+    """
+    Declare the query budget of a view.
+
+    query_budget(5) applies to every HTTP method; query_budget(get=5, post=9)
+    sets one per method (a bare limit is then the fallback).
+    """
+    budgets = {method.upper(): count for method, count in per_method.items()}
+    if limit is not None:
+        budgets["*"] = limit
+
+    def decorator(view):
+        view.query_budgets = budgets
+        return view
+    return decorator
+
+
+def budget_for(view, method):
+    """The budget of a view (function or as_view() callable) for an HTTP method, or None"""
+    budgets = getattr(getattr(view, "view_class", view), "query_budgets", None) or {}
+    return budgets.get(method.upper(), budgets.get("*"))
+
+
+def budgeted_routes(urlconfs=BUDGETED_URLCONFS):
+    """{url name: view} for every named route of the URL confs"""
+    routes = {}
+    patterns = [pattern for urlconf in urlconfs for pattern in import_module(urlconf).urlpatterns]
+    while patterns:
+        pattern = patterns.pop(0)
+        if isinstance(pattern, URLResolver):
+            patterns.extend(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            routes[pattern.name] = pattern.callback
+    return routes
@@ -0,0 +1,110 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+
+# PRIMARY / REPLICA ROUTING
+#
+# Reads of the routed apps go to a random alias from settings.DATABASE_REPLICAS,
+# everything else (and every write) to "default". Once a request writes, it is
+# pinned to the primary for the rest of the request, and replica_pin_middleware
+# keeps its session pinned for DATABASE_REPLICA_STICKY_SECONDS so the next pages
+# read the user's own writes even while the replicas are behind.
+ROUTED_APPS = {"vehicles", "users"}
+SESSION_KEY = "_db_primary_until"
+PRIMARY = "default"
+
+_pinned = ContextVar("db_pinned_to_primary", default=False)
+# ONE REPLICA PER REQUEST: ITS READS SEE ONE COPY OF THE DATA AND SHARE ONE CONNECTION'S PAGE CACHE
+_replica = ContextVar("db_request_replica", default=None)
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def pinned_to_primary():
+    return _pinned.get()
+
+
+@contextmanager
+def writes_without_pinning():
+    """Writes in the block leave the request (and its session) as pinned as it was"""
+    token = _pinned.set(_pinned.get())
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS:
+            return None
+        replicas = settings.DATABASE_REPLICAS
+        # INSIDE A TRANSACTION ON THE PRIMARY, READ WHAT THE TRANSACTION SEES
+        if not replicas or _pinned.get() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        replica = _replica.get()
+        if replica not in replicas:
+            replica = random.choice(replicas)
+            _replica.set(replica)
+        return replica
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in ROUTED_APPS:
+            _pinned.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # REPLICAS HOLD THE SAME DATA AS THE PRIMARY
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # REPLICAS ARE COPIES OF THE PRIMARY, NEVER MIGRATED ON THEIR OWN
+        return db == PRIMARY
+
+
+def _session_pinned(session):
+    return session is not None and session.get(SESSION_KEY, 0) > time.time()
+
+
+def _should_remember_pin(session):
+    return _pinned.get() and session is not None and settings.DATABASE_REPLICAS
+
+
+# READ-YOUR-WRITES ACROSS REQUESTS: A SESSION THAT JUST WROTE STAYS ON THE PRIMARY FOR A WHILE
+@sync_and_async_middleware
+def replica_pin_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            session = getattr(request, "session", None)
+            pinned = session is not None and await session.aget(SESSION_KEY, 0) > time.time()
+            token, replica_token = _pinned.set(pinned), _replica.set(None)
+            try:
+                response = await get_response(request)
+                if _should_remember_pin(session):
+                    await session.aset(SESSION_KEY, time.time() + settings.DATABASE_REPLICA_STICKY_SECONDS)
+            finally:
+                _pinned.reset(token)
+                _replica.reset(replica_token)
+            return response
+    else:
+        def middleware(request):
+            session = getattr(request, "session", None)
+            token, replica_token = _pinned.set(_session_pinned(session)), _replica.set(None)
+            try:
+                response = get_response(request)
+                if _should_remember_pin(session):
+                    session[SESSION_KEY] = time.time() + settings.DATABASE_REPLICA_STICKY_SECONDS
+            finally:
+                _pinned.reset(token)
+                _replica.reset(replica_token)
+            return response
+    return middleware
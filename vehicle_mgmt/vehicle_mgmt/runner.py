@@ -0,0 +1,58 @@
+import argparse
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# THE BUDGET CHECK (vehicles/tests.py) IS TAGGED, SO A LABEL LIKE "vehicles" ONLY RUNS IT WHEN ASKED TO
+QUERY_BUDGET_TAG = "query_budgets"
+QUERY_BUDGET_TEST = "vehicles.tests.QueryBudgetTest"
+
+
+class VehicleTestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that adds the per-route query budget check (QueryBudgetTest) to full runs.
+
+    Like Django swapping in the locmem mail backend, it also sends OTP mail
+    from the committing thread (OTP_EMAIL_WORKERS = 0), writes the audit log
+    in the request (VEHICLE_AUDIT_WRITE_BEHIND = False) and loads the
+    typeahead index in the request (VEHICLE_TYPEAHEAD_BACKGROUND_BUILD =
+    False): background threads can't see the test's transaction. Tests of
+    those threads turn them back on themselves.
+    """
+
+    def __init__(self, query_budgets=None, **kwargs):
+        super().__init__(**kwargs)
+        self.query_budgets = query_budgets
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--query-budgets",
+            action=argparse.BooleanOptionalAction,
+            default=None,
+            help="Check every route against its query budget (default: only when the whole suite runs).",
+        )
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._overrides = override_settings(
+            OTP_EMAIL_WORKERS=0,
+            VEHICLE_AUDIT_WRITE_BEHIND=False,
+            VEHICLE_TYPEAHEAD_BACKGROUND_BUILD=False,
+        )
+        self._overrides.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._overrides.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def build_suite(self, test_labels=None, **kwargs):
+        check_budgets = self.query_budgets
+        if check_budgets is None:
+            check_budgets = not test_labels or any(label.startswith(QUERY_BUDGET_TEST) for label in test_labels)
+        if not check_budgets:
+            self.exclude_tags = {*self.exclude_tags, QUERY_BUDGET_TAG}
+        elif test_labels:
+            test_labels = [*test_labels, QUERY_BUDGET_TEST]
+        return super().build_suite(test_labels, **kwargs)
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os 
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,19 +45,27 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'vehicles.middleware.request_metrics_middleware',
+    'vehicles.middleware.slow_query_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'vehicle_mgmt.replicas.replica_pin_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'vehicles.middleware.audit_user_middleware',
+    'vehicles.middleware.request_profiling_middleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'vehicle_mgmt.urls'
+# asgi.py turns VEHICLE_ASYNC_VIEWS on so the vehicle pages run as native async views
+VEHICLE_ASYNC_VIEWS = config("VEHICLE_ASYNC_VIEWS", default=False, cast=bool)
+ROOT_URLCONF = 'vehicle_mgmt.async_urls' if VEHICLE_ASYNC_VIEWS else 'vehicle_mgmt.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # THE DJANGO BACKEND WITH RENDER TIMES ADDED TO THE REQUEST METRICS
+        'BACKEND': 'vehicles.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,13 +85,94 @@ WSGI_APPLICATION = 'vehicle_mgmt.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite tuning, run on every new connection (OPTIONS init_command). WAL lets readers
+# carry on while one writer commits; busy_timeout makes a writer wait for the lock
+# instead of failing with "database is locked".
+# (busy_timeout FIRST: SWITCHING journal_mode NEEDS A LOCK OTHER WORKERS MAY HOLD)
+SQLITE_PRAGMAS = {
+    'busy_timeout': config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int),  # milliseconds
+    'journal_mode': config("SQLITE_JOURNAL_MODE", default="wal"),
+    'synchronous': config("SQLITE_SYNCHRONOUS", default="normal"),
+    'cache_size': config("SQLITE_CACHE_SIZE", default=-64000, cast=int),  # negative = KiB
+    'mmap_size': config("SQLITE_MMAP_SIZE", default=128 * 1024 * 1024, cast=int),
+    'temp_store': config("SQLITE_TEMP_STORE", default="memory"),
+}
+SQLITE_OPTIONS = {
+    'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+    # BEGIN IMMEDIATE: TAKE THE WRITE LOCK UP FRONT, WHERE busy_timeout CAN WAIT FOR IT
+    'transaction_mode': config("SQLITE_TRANSACTION_MODE", default="IMMEDIATE"),
+}
+# Persistent connections (checked before reuse). Async views run the ORM on a thread
+# pool, where connections can't be reused safely, so they stay per request under ASGI.
+DB_CONN_MAX_AGE = config("DB_CONN_MAX_AGE", default=0 if VEHICLE_ASYNC_VIEWS else 600, cast=int)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas: comma-separated SQLite files refreshed from the primary with
+# `python manage.py sync_sqlite_replicas`. Reads of vehicles / users go to them,
+# writes to default (vehicle_mgmt/replicas.py). Tests mirror them onto default.
+SQLITE_REPLICA_FILES = config("SQLITE_REPLICA_FILES", default="", cast=Csv())
+for number, replica_file in enumerate(SQLITE_REPLICA_FILES, start=1):
+    DATABASES[f'replica_{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / replica_file,
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['vehicle_mgmt.replicas.PrimaryReplicaRouter']
+# SECONDS A SESSION KEEPS READING FROM THE PRIMARY AFTER IT WROTE (READ-YOUR-WRITES)
+DATABASE_REPLICA_STICKY_SECONDS = config("DATABASE_REPLICA_STICKY_SECONDS", default=10, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The local-memory default is per process; point CACHE_BACKEND / CACHE_LOCATION at a
+# shared cache (Redis, Memcached) when running more than one worker so invalidation
+# reaches every process.
+
+CACHES = {
+    'default': {
+        'BACKEND': config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        'LOCATION': config("CACHE_LOCATION", default="vehicle-mgmt"),
+    },
+    # PENDING REGISTRATION CODES (users/otp.py): MUST BE SHARED BY EVERY WORKER. THE DATABASE
+    # CACHE WORKS ANYWHERE THE DATABASE DOES; CREATE ITS TABLE WITH `manage.py createcachetable`
+    # AFTER migrate (users/checks.py WARNS WHILE IT IS MISSING)
+    'otp': {
+        'BACKEND': config("OTP_CACHE_BACKEND", default="django.core.cache.backends.db.DatabaseCache"),
+        'LOCATION': config("OTP_CACHE_LOCATION", default="otp_cache"),
+        # EXPIRED CODES ARE CULLED BEFORE LIVE ONES; KEEP LIVE ONES UNTIL THEY EXPIRE
+        'OPTIONS': {'MAX_ENTRIES': config("OTP_CACHE_MAX_ENTRIES", default=1_000_000, cast=int)},
+    },
+}
+
+# OTP_STORE KEEPS THE CODES (users/otp.py); THEY EXPIRE AFTER OTP_TTL_SECONDS AND ALLOW
+# OTP_MAX_ATTEMPTS TRIES. `manage.py purge_expired_otps` CLEARS OUT EXPIRED ONES
+OTP_STORE = config("OTP_STORE", default="users.otp.CacheOTPStore")
+OTP_CACHE_ALIAS = "otp"
+OTP_TTL_SECONDS = config("OTP_TTL_SECONDS", default=60 * 10, cast=int)
+OTP_MAX_ATTEMPTS = config("OTP_MAX_ATTEMPTS", default=3, cast=int)
+
+# OTP EMAILS ARE SENT AFTER COMMIT BY OTP_EMAIL_WORKERS BACKGROUND THREADS PER PROCESS (users/mailer.py;
+# 0 SENDS FROM THE REQUEST). EACH THREAD REUSES ITS SMTP CONNECTION UNTIL IDLE FOR
+# OTP_EMAIL_IDLE_SECONDS; FAILED SENDS ARE RETRIED AFTER OTP_EMAIL_RETRY_DELAY, 2x, 4x... SECONDS
+OTP_EMAIL_WORKERS = config("OTP_EMAIL_WORKERS", default=2, cast=int)
+OTP_EMAIL_QUEUE_SIZE = config("OTP_EMAIL_QUEUE_SIZE", default=1000, cast=int)
+OTP_EMAIL_MAX_RETRIES = config("OTP_EMAIL_MAX_RETRIES", default=4, cast=int)
+OTP_EMAIL_RETRY_DELAY = config("OTP_EMAIL_RETRY_DELAY", default=1.0, cast=float)
+OTP_EMAIL_IDLE_SECONDS = config("OTP_EMAIL_IDLE_SECONDS", default=30.0, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,6 +217,11 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = "users.CustomUser"
+# USERNAME OR EMAIL (ANY CASE) IN ONE INDEXED QUERY; PERMISSIONS AS ModelBackend
+AUTHENTICATION_BACKENDS = ["users.backends.UsernameOrEmailBackend"]
+# THE ASYNC LOGIN AND REGISTER VIEWS HASH PASSWORDS ON A POOL OF PASSWORD_HASHING_WORKERS
+# THREADS PER PROCESS (users/hashing.py): AT MOST THAT MANY HASHES RUN AT ONCE, THE REST QUEUE
+PASSWORD_HASHING_WORKERS = config("PASSWORD_HASHING_WORKERS", default=os.cpu_count() or 1, cast=int)
 
 
 
@@ -139,6 +233,82 @@ LOGIN_URL = '/users/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Vehicle list pagination (keyset / cursor based)
+VEHICLE_LIST_PAGE_SIZE = config("VEHICLE_LIST_PAGE_SIZE", default=25, cast=int)
+VEHICLE_LIST_MAX_PAGE_SIZE = config("VEHICLE_LIST_MAX_PAGE_SIZE", default=100, cast=int)
+
+# Read fleet stats from the maintained per-type counters instead of counting rows
+VEHICLE_STATS_USE_COUNTERS = config("VEHICLE_STATS_USE_COUNTERS", default=True, cast=bool)
+
+# Vehicle list caching: rendered rows and assembled pages (seconds, 0 disables)
+VEHICLE_ROW_CACHE_TIMEOUT = config("VEHICLE_ROW_CACHE_TIMEOUT", default=60 * 60 * 24, cast=int)
+VEHICLE_PAGE_CACHE_TIMEOUT = config("VEHICLE_PAGE_CACHE_TIMEOUT", default=60 * 5, cast=int)
+
+# Plate / model typeahead: per-worker in-memory prefix index (vehicles/typeahead.py)
+VEHICLE_TYPEAHEAD_MAX_VEHICLES = config("VEHICLE_TYPEAHEAD_MAX_VEHICLES", default=200_000, cast=int)
+VEHICLE_TYPEAHEAD_MAX_AGE = config("VEHICLE_TYPEAHEAD_MAX_AGE", default=60 * 5, cast=int)
+# Load / reload it on a background thread, serving the old index (or the database) meanwhile
+VEHICLE_TYPEAHEAD_BACKGROUND_BUILD = config("VEHICLE_TYPEAHEAD_BACKGROUND_BUILD", default=True, cast=bool)
+
+# Vehicle audit log: queued in memory and written by a background thread (vehicles/audit.py)
+VEHICLE_AUDIT_WRITE_BEHIND = config("VEHICLE_AUDIT_WRITE_BEHIND", default=True, cast=bool)
+VEHICLE_AUDIT_QUEUE_SIZE = config("VEHICLE_AUDIT_QUEUE_SIZE", default=10_000, cast=int)
+VEHICLE_AUDIT_QUEUE_POLICY = config("VEHICLE_AUDIT_QUEUE_POLICY", default="sync")  # sync, block or drop
+VEHICLE_AUDIT_BLOCK_TIMEOUT = config("VEHICLE_AUDIT_BLOCK_TIMEOUT", default=1.0, cast=float)
+VEHICLE_AUDIT_BATCH_SIZE = config("VEHICLE_AUDIT_BATCH_SIZE", default=500, cast=int)
+VEHICLE_AUDIT_FLUSH_INTERVAL = config("VEHICLE_AUDIT_FLUSH_INTERVAL", default=1.0, cast=float)
+
+# Delta sync feed (/vehicles/api/changes/): rows younger than the settle window wait for the
+# next call; tombstones older than the retention period are pruned and force a full resync
+VEHICLE_SYNC_SETTLE_SECONDS = config("VEHICLE_SYNC_SETTLE_SECONDS", default=2.0, cast=float)
+VEHICLE_SYNC_TOMBSTONE_DAYS = config("VEHICLE_SYNC_TOMBSTONE_DAYS", default=90, cast=int)
+
+# REQUEST METRICS (vehicles/metrics.py), SERVED AT /metrics TO ADMINS IN PROMETHEUS TEXT FORMAT.
+# Each worker keeps its own counts; with VEHICLE_METRICS_MULTIPROCESS_FILE set (a path every
+# worker can write), workers add their counts to that file at most every
+# VEHICLE_METRICS_FLUSH_INTERVAL seconds and /metrics reports the total of all of them
+VEHICLE_METRICS_ENABLED = config("VEHICLE_METRICS_ENABLED", default=True, cast=bool)
+VEHICLE_METRICS_MULTIPROCESS_FILE = config("VEHICLE_METRICS_MULTIPROCESS_FILE", default="")
+VEHICLE_METRICS_FLUSH_INTERVAL = config("VEHICLE_METRICS_FLUSH_INTERVAL", default=5.0, cast=float)
+
+# SLOW-QUERY LOG (vehicles/slow_queries.py): QUERIES TAKING VEHICLE_SLOW_QUERY_MS OR MORE (0 TURNS IT
+# OFF) ARE KEPT IN A PER-PROCESS RING BUFFER SHOWN IN THE ADMIN (Vehicles > Slow queries) AND LOGGED
+# TO "vehicles.slow_queries"; VEHICLE_SLOW_QUERY_LOG_FILE SENDS THAT LOG TO A ROTATING FILE
+VEHICLE_SLOW_QUERY_MS = config("VEHICLE_SLOW_QUERY_MS", default=100.0, cast=float)
+VEHICLE_SLOW_QUERY_BUFFER_SIZE = config("VEHICLE_SLOW_QUERY_BUFFER_SIZE", default=200, cast=int)
+VEHICLE_SLOW_QUERY_LOG_FILE = config("VEHICLE_SLOW_QUERY_LOG_FILE", default="")
+
+# REQUEST PROFILING (vehicles/profiling.py): A SUPERADMIN ADDS ?profile=1 OR "X-Profile: 1" TO RUN A
+# REQUEST UNDER cProfile; VEHICLE_PROFILE_SAMPLE_EVERY = N ALSO PROFILES EVERY NTH REQUEST (0 = NEVER).
+# Profiles are stored as RequestProfile rows, browsed and compared in the admin; the
+# prune_request_profiles command (run daily) deletes those older than VEHICLE_PROFILE_KEEP_DAYS
+VEHICLE_PROFILE_SAMPLE_EVERY = config("VEHICLE_PROFILE_SAMPLE_EVERY", default=0, cast=int)
+VEHICLE_PROFILE_MAX_QUERIES = config("VEHICLE_PROFILE_MAX_QUERIES", default=500, cast=int)
+VEHICLE_PROFILE_KEEP_DAYS = config("VEHICLE_PROFILE_KEEP_DAYS", default=7, cast=int)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        # WITHOUT A FILE THE LOG STAYS IN THE ADMIN'S RING BUFFER (A LOGGER WITH NO HANDLER FALLS BACK TO STDERR)
+        "slow_query_file": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": VEHICLE_SLOW_QUERY_LOG_FILE,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "delay": True,
+        } if VEHICLE_SLOW_QUERY_LOG_FILE else {
+            "class": "logging.NullHandler",
+        },
+    },
+    "loggers": {
+        "vehicles.slow_queries": {
+            "handlers": ["slow_query_file"],
+            "level": "WARNING",
+        },
+    },
+}
+
 # For real email (use Gmail or SMTP)
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = config("EMAIL_HOST", default="smtp.gmail.com")
@@ -146,4 +316,9 @@ EMAIL_PORT = config("EMAIL_PORT", default=587, cast=int)
 EMAIL_USE_TLS = config("EMAIL_USE_TLS", default=True, cast=bool)
 EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
+# SECONDS BEFORE A STALLED SMTP SERVER FAILS THE SEND (AND THE MAILER RETRIES)
+EMAIL_TIMEOUT = config("EMAIL_TIMEOUT", default=10, cast=int)
  # use App Password, not your Gmail password
+
+# TEST RUNNER: FULL RUNS ALSO CHECK EVERY ROUTE AGAINST ITS @query_budget (SEE vehicle_mgmt/query_budgets.py)
+TEST_RUNNER = "vehicle_mgmt.runner.VehicleTestRunner"
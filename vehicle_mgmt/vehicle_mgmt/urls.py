@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path,include
 from . import views
+from vehicles.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,4 +25,5 @@ urlpatterns = [
     path("about/", views.about, name="about"),  # About page
     path("vehicles/", include("vehicles.urls")),  # Vehicle app
     path("users/", include("users.urls")),  # for login and logout 
+    path("metrics", MetricsView.as_view(), name="metrics"),  # Prometheus metrics (admins)
 ]
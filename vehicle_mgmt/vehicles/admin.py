@@ -1,12 +1,231 @@
-from django.contrib import admin
-from .models import  Vehicle
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from .models import  Vehicle, VehicleChange, RequestProfile
+from .forms import VehicleForm
+from .filters import VEHICLE_ORDERINGS
+from .search import search_vehicles
+from .exports import export_response
+from .bulk import bulk_delete_vehicles, bulk_update_vehicles
+from .slow_queries import slow_query_log
+from .profiling import diff_stats, is_superadmin, load_stats
 from django.contrib.auth.admin import UserAdmin
 
 # Register your models here.
 
 
+class VehicleTypeFilter(admin.SimpleListFilter):
+    """Filter by type through ?type=, the same parameter the vehicle list uses"""
+    title = "vehicle type"
+    parameter_name = "type"
+
+    def lookups(self, request, model_admin):
+        return Vehicle.VEHICLE_TYPES
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(vehicle_type=self.value())
+        return queryset
+
+
+class VehicleOrderingFilter(admin.SimpleListFilter):
+    """
+    Accept ?ordering= with the vehicle list's indexed orderings.
+
+    Filtering is a no-op: VehicleAdmin.get_ordering() reads the value, this
+    filter only makes the changelist accept the parameter and lists choices.
+    """
+    title = "ordering"
+    parameter_name = "ordering"
+
+    def lookups(self, request, model_admin):
+        return [(key, key.replace("_", " ")) for key in VEHICLE_ORDERINGS]
+
+    def queryset(self, request, queryset):
+        return queryset
+
+
+def set_type_action(vehicle_type, label):
+    """Admin action moving the selected vehicles to one type with a single UPDATE"""
+    def action(modeladmin, request, queryset):
+        count = bulk_update_vehicles(queryset, {"vehicle_type": vehicle_type})
+        modeladmin.message_user(request, f"Set {count} vehicles to {label}.", messages.SUCCESS)
+
+    action.__name__ = f"set_type_{vehicle_type.lower()}"
+    return admin.action(description=f"Set type to {label}", permissions=["change"])(action)
+
+
 @admin.register(Vehicle)
 class VehicleAdmin(admin.ModelAdmin):
+    form = VehicleForm  # SAME NORMALIZED-PLATE DUPLICATE CHECK AS THE APP
     list_display = ("vehicle_number", "vehicle_type", "vehicle_model", "created_at")
-    search_fields = ("vehicle_number", "vehicle_model")
-    list_filter = ("vehicle_type",)
+    search_fields = ("vehicle_number", "vehicle_model", "vehicle_description")
+    list_filter = (VehicleTypeFilter, VehicleOrderingFilter)
+    ordering = ("-created_at", "-id")
+    actions = ("export_csv", "export_ndjson") + tuple(
+        set_type_action(vehicle_type, label) for vehicle_type, label in Vehicle.VEHICLE_TYPES
+    )
+
+    def get_ordering(self, request):
+        ordering = VEHICLE_ORDERINGS.get(request.GET.get("ordering", ""))
+        return ordering or super().get_ordering(request)
+
+    def delete_queryset(self, request, queryset):
+        # "DELETE SELECTED" AS ONE TRANSACTION WITHOUT A SIGNAL ROUND TRIP PER ROW
+        bulk_delete_vehicles(queryset)
+
+    def get_search_results(self, request, queryset, search_term):
+        # USE THE FULL-TEXT INDEX INSTEAD OF AN icontains SCAN PER SEARCH FIELD
+        if not search_term.strip():
+            return queryset, False
+        return search_vehicles(search_term, queryset), False
+
+    def get_urls(self):
+        return [
+            path("slow-queries/", self.admin_site.admin_view(self.slow_queries_view), name="vehicles_slow_queries"),
+        ] + super().get_urls()
+
+    def slow_queries_view(self, request):
+        """This worker's slow-query ring buffer (SQL and parameters, so superusers only)"""
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        if request.method == "POST":
+            slow_query_log.clear()
+            self.message_user(request, "Cleared the slow-query log.", messages.SUCCESS)
+            return redirect("admin:vehicles_slow_queries")
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Slow queries",
+            "opts": self.model._meta,
+            "records": slow_query_log.records(),
+            "threshold_ms": settings.VEHICLE_SLOW_QUERY_MS,
+            "buffer_size": settings.VEHICLE_SLOW_QUERY_BUFFER_SIZE,
+        }
+        return TemplateResponse(request, "admin/vehicles/slow_queries.html", context)
+
+    @admin.action(description="Export selected vehicles as CSV")
+    def export_csv(self, request, queryset):
+        return export_response(queryset, "csv")
+
+    @admin.action(description="Export selected vehicles as NDJSON")
+    def export_ndjson(self, request, queryset):
+        return export_response(queryset, "ndjson")
+
+
+@admin.register(VehicleChange)
+class VehicleChangeAdmin(admin.ModelAdmin):
+    """The audit log is append-only: browsable here, never edited"""
+    list_display = ("vehicle_number", "action", "username", "changed_at")
+    list_filter = ("action",)
+    search_fields = ("vehicle_number", "username")
+    ordering = ("-changed_at", "-id")
+    date_hierarchy = "changed_at"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Stored request profiles: superadmins browse, download and compare them"""
+    list_display = ("created_at", "method", "path", "view_name", "status_code",
+                    "duration_ms", "query_count", "sampled", "user")
+    list_filter = ("sampled", "method", "view_name")
+    search_fields = ("path", "view_name")
+    date_hierarchy = "created_at"
+    list_select_related = ("user",)
+    fields = ("created_at", "user", "method", "path", "view_name", "status_code", "sampled",
+              "duration_ms", "query_count", "query_ms", "pstats_file", "hot_functions", "sql")
+    readonly_fields = fields
+    actions = ("compare_profiles",)
+
+    # THE PROFILES HOLD SQL PARAMETERS, SO ONLY SUPERADMINS SEE THEM
+    def has_module_permission(self, request):
+        return is_superadmin(request.user)
+
+    def has_view_permission(self, request, obj=None):
+        return is_superadmin(request.user)
+
+    def has_delete_permission(self, request, obj=None):
+        return is_superadmin(request.user)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        # THE LIST NEVER NEEDS THE PSTATS BLOB
+        return super().get_queryset(request).defer("stats", "queries", "summary")
+
+    @admin.display(description="pstats file")
+    def pstats_file(self, obj):
+        url = reverse("admin:vehicles_requestprofile_pstats", args=[obj.pk])
+        return format_html('<a href="{}">profile-{}.prof</a>', url, obj.pk)
+
+    @admin.display(description="Hot functions")
+    def hot_functions(self, obj):
+        return format_html("<pre>{}</pre>", obj.summary)
+
+    @admin.display(description="SQL")
+    def sql(self, obj):
+        rows = format_html_join(
+            "", "<tr><td>{}</td><td>{}</td><td><code>{}</code></td></tr>",
+            ((query["ms"], query["alias"], query["sql"]) for query in obj.queries),
+        )
+        return format_html("<table><tr><th>ms</th><th>Database</th><th>Query</th></tr>{}</table>", rows)
+
+    def get_urls(self):
+        return [
+            path("<int:pk>/pstats/", self.admin_site.admin_view(self.pstats_view),
+                 name="vehicles_requestprofile_pstats"),
+            path("compare/", self.admin_site.admin_view(self.compare_view),
+                 name="vehicles_requestprofile_compare"),
+        ] + super().get_urls()
+
+    def pstats_view(self, request, pk):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(bytes(profile.stats), content_type="application/octet-stream")
+        response["Content-Disposition"] = f'attachment; filename="profile-{profile.pk}.prof"'
+        return response
+
+    def compare_view(self, request):
+        """Per-function time differences of ?before= and ?after="""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        ids = [request.GET.get(key, "") for key in ("before", "after")]
+        if not all(value.isdigit() for value in ids):
+            raise Http404("Pass the ids of two profiles as ?before= and ?after=.")
+        before, after = (get_object_or_404(RequestProfile, pk=value) for value in ids)
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Compare profiles",
+            "opts": self.model._meta,
+            "before": before,
+            "after": after,
+            "rows": diff_stats(load_stats(before.stats), load_stats(after.stats)),
+        }
+        return TemplateResponse(request, "admin/vehicles/requestprofile/compare.html", context)
+
+    @admin.action(description="Compare the two selected profiles")
+    def compare_profiles(self, request, queryset):
+        profiles = list(queryset.order_by("created_at", "id").values_list("pk", flat=True)[:3])
+        if len(profiles) != 2:
+            self.message_user(request, "Select exactly two profiles to compare.", messages.WARNING)
+            return None
+        url = reverse("admin:vehicles_requestprofile_compare")
+        return redirect(f"{url}?before={profiles[0]}&after={profiles[1]}")
@@ -0,0 +1,280 @@
+import hashlib
+import json
+
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date, parse_etags
+from django.views import View
+
+from vehicle_mgmt.query_budgets import query_budget
+
+from .filters import filter_vehicles, ordering_from_request
+from .forms import VehicleForm
+from .models import Vehicle, normalize_vehicle_number
+from .pagination import KeysetPaginator, page_size_from_request
+from .sync import SyncCursorError, SyncCursorExpired, vehicle_changes
+from .views import RoleRequiredMixin
+
+# FIELDS THE API EXPOSES, IN OUTPUT ORDER. ?fields= PICKS A SUBSET (id IS ALWAYS SENT)
+API_FIELDS = (
+    "id",
+    "vehicle_number",
+    "vehicle_type",
+    "vehicle_model",
+    "vehicle_description",
+    "created_at",
+    "updated_at",
+)
+WRITABLE_FIELDS = VehicleForm._meta.fields
+
+
+def fields_from_request(request):
+    requested = request.GET.get("fields")
+    if not requested:
+        return API_FIELDS
+    names = {name.strip() for name in requested.split(",")}
+    return tuple(name for name in API_FIELDS if name in names or name == "id")
+
+
+def serialize_vehicle(vehicle, fields=API_FIELDS):
+    data = {}
+    for name in fields:
+        value = getattr(vehicle, name)
+        data[name] = value.isoformat() if hasattr(value, "isoformat") else value
+    return data
+
+
+def _version(*parts):
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def _conditional(request, etag, last_modified):
+    """304 / 412 when the client's validators allow it, else None (mirrors @condition)"""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        _set_validators(request, response, etag, last_modified)
+    return response
+
+
+def _set_validators(request, response, etag, last_modified):
+    if request.method in ("GET", "HEAD", "POST", "PUT", "PATCH"):
+        response.headers.setdefault("ETag", etag)
+        if last_modified:
+            response.headers.setdefault("Last-Modified", http_date(last_modified.timestamp()))
+    return response
+
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _error(status, message, **extra):
+    return JsonResponse({"error": message, **extra}, status=status)
+
+
+# "<VERSION>.<FIELD SET>": EACH ?fields= REPRESENTATION HAS ITS OWN ETAG, AND ANY OF THEM
+# NAMES THE VERSION A WRITE'S If-Match EXPECTS (SEE write_etag)
+def vehicle_etag(vehicle, fields=API_FIELDS):
+    return quote_etag(f"{_version(vehicle.pk, vehicle.updated_at)}.{_version(fields)}")
+
+
+def write_etag(request, vehicle):
+    """The vehicle's ETag as the client's If-Match spells it when the version matches, else the full one"""
+    version = _version(vehicle.pk, vehicle.updated_at)
+    for etag in parse_etags(request.META.get("HTTP_IF_MATCH", "")):
+        # If-Match COMPARES STRONGLY: WEAK (W/"...") ETAGS NEVER MATCH
+        if etag.startswith('"') and etag.strip('"').partition(".")[0] == version:
+            return etag
+    return vehicle_etag(vehicle)
+
+
+def vehicle_response(request, vehicle, fields=API_FIELDS, status=200):
+    response = JsonResponse(serialize_vehicle(vehicle, fields), status=status)
+    return _set_validators(request, response, vehicle_etag(vehicle, fields), vehicle.updated_at)
+
+
+def conditional_vehicle_response(request, vehicle, fields):
+    """GET of one vehicle: 404, 304 when the client's copy is current, else the JSON body"""
+    if vehicle is None:
+        return _error(404, "Vehicle not found.")
+    not_modified = _conditional(request, vehicle_etag(vehicle, fields), vehicle.updated_at)
+    if not_modified is not None:
+        return not_modified
+    return vehicle_response(request, vehicle, fields)
+
+
+# ROLE CHECKS FOR THE JSON API: ROLES PER HTTP METHOD, JSON ERRORS INSTEAD OF REDIRECTS
+class ApiRoleRequiredMixin(RoleRequiredMixin):
+    allowed_roles_by_method = {
+        "GET": ["superadmin", "admin", "user"],
+        "HEAD": ["superadmin", "admin", "user"],
+        "POST": ["superadmin"],
+        "PUT": ["superadmin", "admin"],
+        "PATCH": ["superadmin", "admin"],
+        "DELETE": ["superadmin"],
+    }
+
+    def test_func(self):
+        self.allowed_roles = self.allowed_roles_by_method.get(self.request.method, [])
+        return super().test_func()
+
+    def handle_no_permission(self):
+        if self.request.user.is_authenticated:
+            return _error(403, self.permission_denied_message)
+        return _error(401, "Authentication required.")
+
+
+# /vehicles/api/ - LIST (CURSOR PAGINATED) AND CREATE
+@query_budget(get=3, post=5)
+class VehicleApiListView(ApiRoleRequiredMixin, View):
+
+    def get(self, request):
+        fields = fields_from_request(request)
+        ordering = ordering_from_request(request)
+        ordering_fields = [name.lstrip("-") for name in ordering]
+        queryset = filter_vehicles(request, Vehicle.objects.all()).only(
+            *set(fields) | set(ordering_fields) | {"updated_at"}
+        )
+        paginator = KeysetPaginator(queryset, ordering=ordering, page_size=page_size_from_request(request))
+        page = paginator.page_from_request(request)
+
+        # THE PAGE'S ROWS ARE ALREADY LOADED (ONE INDEXED QUERY); ONLY SERIALIZE IF THE CLIENT'S COPY IS STALE
+        etag = quote_etag(_version(
+            fields, ordering, page.has_next, page.has_previous,
+            [(vehicle.pk, vehicle.updated_at) for vehicle in page],
+        ))
+        last_modified = max((vehicle.updated_at for vehicle in page), default=None)
+        not_modified = _conditional(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = JsonResponse({
+            "results": [serialize_vehicle(vehicle, fields) for vehicle in page],
+            "next": page.next_cursor,
+            "previous": page.previous_cursor,
+            "page_size": paginator.page_size,
+        })
+        return _set_validators(request, response, etag, last_modified)
+
+    def post(self, request):
+        data = _json_body(request)
+        if data is None:
+            return _error(400, "Request body must be a JSON object.")
+        form = VehicleForm(data={name: data.get(name, "") for name in WRITABLE_FIELDS})
+        if not form.is_valid():
+            return _error(400, "Invalid vehicle.", errors=form.errors.get_json_data())
+        vehicle = form.save()
+        response = vehicle_response(request, vehicle, status=201)
+        response["Location"] = reverse("vehicle_api_detail", args=[vehicle.pk])
+        return response
+
+
+# /vehicles/api/<pk>/ - READ, REPLACE (PUT), PARTIAL UPDATE (PATCH), DELETE
+@query_budget(get=3, put=9, patch=9, delete=6)
+class VehicleApiDetailView(ApiRoleRequiredMixin, View):
+
+    def get_vehicle(self, pk, fields=API_FIELDS):
+        return Vehicle.objects.only(*set(fields) | {"updated_at"}).filter(pk=pk).first()
+
+    def get(self, request, pk):
+        fields = fields_from_request(request)
+        return conditional_vehicle_response(request, self.get_vehicle(pk, fields), fields)
+
+    def put(self, request, pk):
+        return self.update(request, pk, partial=False)
+
+    def patch(self, request, pk):
+        return self.update(request, pk, partial=True)
+
+    def update(self, request, pk, partial):
+        vehicle = self.get_vehicle(pk)
+        if vehicle is None:
+            return _error(404, "Vehicle not found.")
+        # If-Match / If-Unmodified-Since: REFUSE TO OVERWRITE A VERSION THE CLIENT HAS NOT SEEN
+        precondition = _conditional(request, write_etag(request, vehicle), vehicle.updated_at)
+        if precondition is not None:
+            return precondition
+
+        data = _json_body(request)
+        if data is None:
+            return _error(400, "Request body must be a JSON object.")
+        if partial:
+            current = serialize_vehicle(vehicle, WRITABLE_FIELDS)
+            data = {name: data.get(name, current[name]) for name in WRITABLE_FIELDS}
+        else:
+            data = {name: data.get(name, "") for name in WRITABLE_FIELDS}
+
+        form = VehicleForm(data=data, instance=vehicle)
+        if not form.is_valid():
+            return _error(400, "Invalid vehicle.", errors=form.errors.get_json_data())
+        return vehicle_response(request, form.save())
+
+    def delete(self, request, pk):
+        vehicle = self.get_vehicle(pk)
+        if vehicle is None:
+            return _error(404, "Vehicle not found.")
+        precondition = _conditional(request, write_etag(request, vehicle), vehicle.updated_at)
+        if precondition is not None:
+            return precondition
+        vehicle.delete()
+        return HttpResponse(status=204)
+
+
+# /vehicles/api/plate/<plate>/ - EXACT LOOKUP BY PLATE IN ANY SPELLING ("mh 12 ab 1234" == "MH12AB1234"),
+# ONE SEEK ON THE UNIQUE vehicle_number_normalized INDEX
+@query_budget(3)
+class VehicleApiPlateView(ApiRoleRequiredMixin, View):
+    http_method_names = ["get", "head", "options"]
+
+    def get(self, request, plate):
+        fields = fields_from_request(request)
+        normalized = normalize_vehicle_number(plate)
+        vehicle = None
+        if normalized:
+            vehicle = (
+                Vehicle.objects.only(*set(fields) | {"updated_at"})
+                .filter(vehicle_number_normalized=normalized)
+                .first()
+            )
+        return conditional_vehicle_response(request, vehicle, fields)
+
+
+# /vehicles/api/changes/?since=<cursor> - DELTA SYNC: VEHICLES CHANGED AND TOMBSTONES OF VEHICLES
+# DELETED SINCE THE CURSOR. Start without ?since= (a full sync), then always send the returned
+# cursor back; ask again at once while has_more is true. 410 means start over without a cursor.
+@query_budget(4)
+class VehicleApiChangesView(ApiRoleRequiredMixin, View):
+    http_method_names = ["get", "head", "options"]
+
+    def get(self, request):
+        fields = fields_from_request(request)
+        try:
+            changes = vehicle_changes(
+                request.GET.get("since"), limit=page_size_from_request(request), fields=fields
+            )
+        except SyncCursorError as error:
+            return _error(400, str(error))
+        except SyncCursorExpired:
+            return _error(410, "Cursor too old, deletions since then were pruned. Sync again without ?since=.")
+        return JsonResponse({
+            "vehicles": [serialize_vehicle(vehicle, fields) for vehicle in changes.vehicles],
+            "deleted": [
+                {
+                    "id": tombstone.vehicle_id,
+                    "vehicle_number": tombstone.vehicle_number,
+                    "deleted_at": tombstone.deleted_at.isoformat(),
+                }
+                for tombstone in changes.deleted
+            ],
+            "cursor": changes.cursor,
+            "has_more": changes.has_more,
+        })
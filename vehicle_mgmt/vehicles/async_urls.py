@@ -0,0 +1,18 @@
+from django.urls import path
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# THE ROUTES OF vehicles/urls.py WITH THE PAGE VIEWS SWAPPED FOR THEIR ASYNC VERSIONS
+ASYNC_VIEWS = {
+    "vehicle_list": async_views.vehicle_list,
+    "vehicle_add": async_views.vehicle_create,
+    "vehicle_detail": async_views.vehicle_detail,
+    "vehicle_edit": async_views.vehicle_edit,
+    "vehicle_delete": async_views.vehicle_delete,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
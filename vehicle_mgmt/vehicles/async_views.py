@@ -0,0 +1,101 @@
+from functools import wraps
+
+from django.contrib import messages
+from django.shortcuts import aget_object_or_404, redirect, render
+
+from .filters import filter_vehicles, ordering_from_request
+from .forms import AsyncVehicleForm, VehicleBulkForm
+from .fragments import acached_vehicle_page
+from .models import Vehicle
+from .pagination import KeysetPaginator, page_size_from_request
+from .stats import aget_fleet_stats_context
+from .views import RoleRequiredMixin
+
+# NATIVE ASYNC VERSIONS OF THE VEHICLE PAGES, ROUTED BY vehicles/async_urls.py WHEN
+# VEHICLE_ASYNC_VIEWS IS ON (asgi.py TURNS IT ON). Every database call goes through
+# the async ORM; templates are rendered only after the data they show is loaded.
+
+
+# ASYNC-SAFE ROLE CHECK (SAME RULES AS LoginRequiredMixin + RoleRequiredMixin)
+def role_required(*roles):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            # REPLACE THE LAZY USER SO TEMPLATES AND CONTEXT PROCESSORS DON'T QUERY FROM ASYNC CODE
+            request.user = user
+            if not user.is_authenticated:
+                return redirect('login')
+            if user.role not in roles:
+                messages.error(request, RoleRequiredMixin.permission_denied_message)
+                return redirect('vehicle_list')
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# VEHICLE LIST (ALL ROLES CAN VIEW)
+@role_required("superadmin", "admin", "user")
+async def vehicle_list(request):
+    async def aget_page():
+        vehicles = filter_vehicles(request, Vehicle.objects.all())
+        paginator = KeysetPaginator(
+            vehicles,
+            ordering=ordering_from_request(request),
+            page_size=page_size_from_request(request),
+        )
+        return await paginator.apage_from_request(request)
+
+    page, rows_html = await acached_vehicle_page(request, aget_page)
+    context = {
+        'vehicles' : page,
+        'page_obj' : page,
+        'rows_html' : rows_html,
+        'bulk_form' : VehicleBulkForm(),
+    }
+    context.update(await aget_fleet_stats_context())
+    return render(request, "vehicles/list.html", context)
+
+
+# VEHICLE DETAIL (ALL ROLES CAN VIEW)
+@role_required("superadmin", "admin", "user")
+async def vehicle_detail(request, pk):
+    vehicle = await aget_object_or_404(Vehicle, pk=pk)
+    return render(request, "vehicles/detail.html", {"vehicle": vehicle})
+
+
+# VEHICLE CREATE (ONLY SUPERADMIN)
+@role_required("superadmin")
+async def vehicle_create(request):
+    if request.method == "POST":
+        form = AsyncVehicleForm(request.POST)
+        if await form.ais_valid():
+            await form.save(commit=False).asave()
+            return redirect('vehicle_list')
+    else:
+        form = AsyncVehicleForm()
+    return render(request, "vehicles/form.html", {"form": form, "form_title": "Add Vehicle"})
+
+
+# VEHICLE UPDATE (ONLY SUPERADMIN + ADMIN)
+@role_required("superadmin", "admin")
+async def vehicle_edit(request, pk):
+    vehicle = await aget_object_or_404(Vehicle, pk=pk)
+    if request.method == "POST":
+        form = AsyncVehicleForm(request.POST, instance=vehicle)
+        if await form.ais_valid():
+            await form.save(commit=False).asave()
+            return redirect('vehicle_list')
+    else:
+        form = AsyncVehicleForm(instance=vehicle)
+    return render(request, "vehicles/form.html", {"form": form, "form_title": "Edit Vehicle"})
+
+
+# VEHICLE DELETE (ONLY SUPERADMIN)
+@role_required("superadmin")
+async def vehicle_delete(request, pk):
+    vehicle = await aget_object_or_404(Vehicle, pk=pk)
+    if request.method == "POST":
+        await vehicle.adelete()
+        return redirect('vehicle_list')
+    return render(request, "vehicles/delete.html", {"vehicle": vehicle})
@@ -0,0 +1,226 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import VehicleChange
+
+logger = logging.getLogger(__name__)
+
+# FIELDS WHOSE CHANGES ARE RECORDED
+AUDITED_FIELDS = ("vehicle_number", "vehicle_type", "vehicle_model", "vehicle_description")
+
+# LONGEST WAIT BETWEEN TRIES OF A BATCH THE DATABASE REJECTED
+MAX_RETRY_DELAY = 30
+
+# THE REQUEST BEING SERVED (SET BY vehicles.middleware.audit_user_middleware), FOR "WHO"
+current_request = ContextVar("vehicles_audit_request", default=None)
+
+
+def _current_user():
+    request = current_request.get()
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user
+    return None
+
+
+def build_change(vehicle_id, vehicle_number, action, changes, user=None, changed_at=None):
+    """An unsaved VehicleChange stamped with the acting user and the current time"""
+    if user is None:
+        user = _current_user()
+    return VehicleChange(
+        vehicle_id=vehicle_id,
+        vehicle_number=vehicle_number,
+        action=action,
+        changes=changes,
+        user=user,
+        username=user.get_username() if user is not None else "",
+        changed_at=changed_at or timezone.now(),
+    )
+
+
+def field_changes(old_values, new_values):
+    """{field: [old, new]} for the audited fields that differ"""
+    return {
+        name: [old_values.get(name), new_values.get(name)]
+        for name in AUDITED_FIELDS
+        if old_values.get(name) != new_values.get(name)
+    }
+
+
+class AuditWriter:
+    """
+    Write-behind queue for VehicleChange rows.
+
+    Requests only enqueue; a daemon thread drains the queue and inserts the
+    rows with one bulk_create per batch. The queue is bounded. When it is
+    full, VEHICLE_AUDIT_QUEUE_POLICY decides what happens:
+
+      sync  - the caller writes its rows itself (slower, nothing is lost)
+      block - the caller waits up to VEHICLE_AUDIT_BLOCK_TIMEOUT for room,
+              then writes synchronously
+      drop  - the rows are discarded and counted in `dropped`
+
+    A batch the database rejects (locked, unreachable) stays with the
+    thread and is retried with backoff until it is stored. The thread
+    starts on first use in each process (so it survives forking servers)
+    and the queue is flushed at interpreter exit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self.dropped = 0
+
+    @property
+    def write_behind(self):
+        return settings.VEHICLE_AUDIT_WRITE_BEHIND
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=settings.VEHICLE_AUDIT_QUEUE_SIZE)
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="vehicle-audit-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def record(self, changes):
+        """Queue VehicleChange rows once the current transaction commits"""
+        changes = list(changes)
+        if changes:
+            transaction.on_commit(lambda: self._enqueue(changes))
+
+    def _enqueue(self, changes):
+        if not self.write_behind:
+            self._write(changes)
+            return
+        self._ensure_started()
+        policy = settings.VEHICLE_AUDIT_QUEUE_POLICY
+        for position, change in enumerate(changes):
+            try:
+                if policy == "block":
+                    self._queue.put(change, timeout=settings.VEHICLE_AUDIT_BLOCK_TIMEOUT)
+                else:
+                    self._queue.put_nowait(change)
+            except queue.Full:
+                overflow = changes[position:]
+                if policy == "drop":
+                    self.dropped += len(overflow)
+                    logger.warning("Audit queue full, dropped %d vehicle change records", len(overflow))
+                else:
+                    self._write(overflow)
+                return
+
+    def _write(self, changes):
+        VehicleChange.objects.bulk_create(changes, batch_size=settings.VEHICLE_AUDIT_BATCH_SIZE)
+
+    def _take_batch(self, timeout):
+        """Up to VEHICLE_AUDIT_BATCH_SIZE queued rows, waiting at most `timeout` for the first"""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < settings.VEHICLE_AUDIT_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_until_stored(self, batch):
+        """Write a batch, retrying after VEHICLE_AUDIT_FLUSH_INTERVAL, 2x, 4x... (up to MAX_RETRY_DELAY) seconds"""
+        delay = settings.VEHICLE_AUDIT_FLUSH_INTERVAL
+        while True:
+            close_old_connections()
+            try:
+                self._write(batch)
+                return
+            except Exception:
+                logger.exception(
+                    "Could not write %d vehicle change records, retrying in %.1f s", len(batch), delay
+                )
+                # A FRESH CONNECTION FOR THE RETRY
+                connection.close()
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._take_batch(settings.VEHICLE_AUDIT_FLUSH_INTERVAL)
+            if not batch:
+                continue
+            # ROWS COUNT AS DONE (FOR flush()) ONLY ONCE THEY ARE STORED
+            self._write_until_stored(batch)
+            for _ in batch:
+                self._queue.task_done()
+        connection.close()
+
+    def flush(self):
+        """Block until every queued row has been written"""
+        if self._queue is not None and self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self, timeout=10):
+        """Write what is queued and stop the thread (registered with atexit)"""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        thread.join(timeout)
+
+
+audit_writer = AuditWriter()
+
+
+def record_changes(changes):
+    audit_writer.record(changes)
+
+
+def vehicle_values(vehicle):
+    return {name: getattr(vehicle, name) for name in AUDITED_FIELDS}
+
+
+def audit_rows(action, rows, new_values=None, changed_at=None):
+    """
+    Record one change per (pk, {field: old value}) row.
+
+    For "delete" the new values are None; otherwise they come from new_values
+    (the same for every row, as in a bulk update). Rows left unchanged are skipped.
+    """
+    changed_at = changed_at or timezone.now()
+    user = _current_user()
+    changes = []
+    for pk, old_values in rows:
+        if action == "delete":
+            diff = {name: [old_values[name], None] for name in AUDITED_FIELDS}
+        else:
+            diff = field_changes(old_values, {**old_values, **new_values})
+            if not diff:
+                continue
+        number = (new_values or {}).get("vehicle_number") or old_values["vehicle_number"]
+        changes.append(build_change(pk, number, action, diff, user=user, changed_at=changed_at))
+    record_changes(changes)
+
+
+def audited_values(queryset):
+    """[(pk, {field: value})] for the audited fields, in one query"""
+    return [
+        (values[0], dict(zip(AUDITED_FIELDS, values[1:])))
+        for values in queryset.order_by().values_list("pk", *AUDITED_FIELDS).iterator(chunk_size=2000)
+    ]
@@ -0,0 +1,85 @@
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .audit import audit_rows, audited_values
+from .models import Vehicle
+from .signals import bulk_operation, vehicles_bulk_changed
+from .sync import record_tombstones
+
+# FIELDS A BULK EDIT MAY SET (vehicle_number IS UNIQUE, SO IT IS EDITED ONE VEHICLE AT A TIME)
+BULK_EDIT_FIELDS = ("vehicle_type", "vehicle_model", "vehicle_description")
+
+
+def clean_bulk_changes(changes):
+    """Validate {field: value} against the model fields; raise ValidationError if invalid"""
+    cleaned = {}
+    errors = {}
+    for name, value in changes.items():
+        if name not in BULK_EDIT_FIELDS:
+            errors[name] = [f"{name} can't be changed in bulk."]
+            continue
+        try:
+            cleaned[name] = Vehicle._meta.get_field(name).clean(value, None)
+        except ValidationError as error:
+            errors[name] = error.messages
+    if errors:
+        raise ValidationError(errors)
+    if not cleaned:
+        raise ValidationError("Choose at least one field to change.")
+    return cleaned
+
+
+def bulk_update_vehicles(queryset, changes):
+    """
+    Apply the same field values to every vehicle in the queryset.
+
+    One UPDATE statement in one transaction; updated_at is bumped explicitly
+    because QuerySet.update() skips auto_now. The previous values are read
+    first (one query) for the audit log. Returns the number of rows.
+    """
+    changes = clean_bulk_changes(changes)
+    # queryset.db IS WHERE IT WOULD BE READ (A REPLICA): READ THE OLD VALUES AND UPDATE ON THE PRIMARY
+    queryset = queryset.using(router.db_for_write(Vehicle))
+    with transaction.atomic(using=queryset.db):
+        previous = audited_values(queryset)
+        now = timezone.now()
+        count = queryset.update(**changes, updated_at=now)
+        if count:
+            audit_rows("update", previous, changes, changed_at=now)
+            vehicles_bulk_changed.send(sender=Vehicle, action="update")
+    return count
+
+
+def bulk_delete_vehicles(queryset):
+    """
+    Delete every vehicle in the queryset in one transaction.
+
+    One DELETE statement: the per-row signal receivers would all be muted
+    anyway, so the rows are not loaded (QuerySet.delete() would fetch them and
+    delete in chunks of 100). A single vehicles_bulk_changed brings counters
+    and caches up to date; tombstones for the sync feed are written with one
+    bulk insert. Returns the number of vehicles.
+    """
+    # AS IN bulk_update_vehicles, ON THE PRIMARY
+    queryset = queryset.using(router.db_for_write(Vehicle))
+    with transaction.atomic(using=queryset.db), bulk_operation():
+        previous = audited_values(queryset)
+        count = _delete_rows(queryset)
+        if count:
+            record_tombstones((pk, values["vehicle_number"]) for pk, values in previous)
+            audit_rows("delete", previous)
+            vehicles_bulk_changed.send(sender=Vehicle, action="delete")
+    return count
+
+
+def _delete_rows(queryset):
+    # DELETE ... WHERE id IN (THE QUERYSET'S ids): NOTHING CASCADES TO Vehicle (VehicleChange IS
+    # DO_NOTHING), SO THERE IS NOTHING FOR QuerySet.delete()'S COLLECTOR TO DO BUT LOAD THE ROWS
+    connection = connections[queryset.db]
+    ids, params = queryset.order_by().values("pk").query.get_compiler(queryset.db).as_sql()
+    table = connection.ops.quote_name(Vehicle._meta.db_table)
+    key = connection.ops.quote_name(Vehicle._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {key} IN ({ids})", params)
+        return cursor.rowcount
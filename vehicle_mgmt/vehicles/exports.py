@@ -0,0 +1,79 @@
+import csv
+import datetime
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+EXPORT_FIELDS = (
+    "id",
+    "vehicle_number",
+    "vehicle_type",
+    "vehicle_model",
+    "vehicle_description",
+    "created_at",
+    "updated_at",
+)
+# ROWS FETCHED FROM THE DATABASE PER ROUND TRIP, AND ROWS JOINED INTO ONE RESPONSE CHUNK
+EXPORT_FETCH_SIZE = 2000
+EXPORT_ROWS_PER_CHUNK = 500
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+class Echo:
+    """File-like object whose write() hands the line back instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def _export_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_export_rows(queryset):
+    """Export rows as tuples, fetched in chunks so memory stays flat"""
+    rows = queryset.order_by("id").values_list(*EXPORT_FIELDS)
+    for row in rows.iterator(chunk_size=EXPORT_FETCH_SIZE):
+        yield [_export_value(value) for value in row]
+
+
+def _chunked(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= EXPORT_ROWS_PER_CHUNK:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def iter_csv(queryset):
+    writer = csv.writer(Echo())
+    # THE HEADER GOES OUT BEFORE THE QUERY RUNS
+    yield writer.writerow(EXPORT_FIELDS)
+    yield from _chunked(writer.writerow(row) for row in iter_export_rows(queryset))
+
+
+def iter_ndjson(queryset):
+    lines = (
+        json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n"
+        for row in iter_export_rows(queryset)
+    )
+    yield from _chunked(lines)
+
+
+def export_response(queryset, export_format):
+    """Stream the queryset as a CSV or NDJSON download"""
+    rows = iter_csv(queryset) if export_format == "csv" else iter_ndjson(queryset)
+    response = StreamingHttpResponse(rows, content_type=EXPORT_FORMATS[export_format])
+    filename = f"vehicles-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,35 @@
+from .models import Vehicle
+from .pagination import DEFAULT_ORDERING
+from .search import search_vehicles
+
+# ?ordering= VALUES ACCEPTED BY THE VEHICLE LIST, EACH BACKED BY AN INDEX.
+# Every ordering ends in a unique column so keyset cursors stay stable, and
+# keeps one direction throughout so the index can be walked without a sort.
+VEHICLE_ORDERINGS = {
+    "-created_at": DEFAULT_ORDERING,
+    "created_at": ("created_at", "id"),
+    "-updated_at": ("-updated_at", "-id"),
+    "updated_at": ("updated_at", "id"),
+    "vehicle_number": ("vehicle_number",),
+    "-vehicle_number": ("-vehicle_number",),
+    "vehicle_type": ("vehicle_type", "created_at", "id"),
+    "-vehicle_type": ("-vehicle_type", "-created_at", "-id"),
+}
+
+VEHICLE_TYPE_CODES = {code for code, _ in Vehicle.VEHICLE_TYPES}
+
+
+def ordering_from_request(request):
+    """The keyset ordering picked with ?ordering=, defaulting to newest first"""
+    return VEHICLE_ORDERINGS.get(request.GET.get("ordering", ""), DEFAULT_ORDERING)
+
+
+def filter_vehicles(request, queryset):
+    """Apply the list page's ?type= and ?q= parameters to a vehicle queryset"""
+    vehicle_type = request.GET.get("type", "")
+    if vehicle_type in VEHICLE_TYPE_CODES:
+        queryset = queryset.filter(vehicle_type=vehicle_type)
+    search = request.GET.get("q", "").strip()
+    if search:
+        queryset = search_vehicles(search, queryset)
+    return queryset
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Vehicle
+from .models import Vehicle, normalize_vehicle_number
 class VehicleForm(forms.ModelForm):
     class Meta:
         model = Vehicle
@@ -9,4 +9,125 @@ class VehicleForm(forms.ModelForm):
             "vehicle_model",
             "vehicle_description",
             ]
-        
+
+    def clean_vehicle_number(self):
+        vehicle_number = self.cleaned_data["vehicle_number"]
+        if not normalize_vehicle_number(vehicle_number):
+            raise forms.ValidationError("Enter a vehicle number with letters or digits.")
+        return vehicle_number
+
+    def duplicate_vehicles(self, vehicle_number):
+        """Other vehicles whose number is the same plate written differently (or identically)"""
+        duplicates = Vehicle.objects.filter(
+            vehicle_number_normalized=normalize_vehicle_number(vehicle_number)
+        )
+        if self.instance.pk is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        return duplicates
+
+    def add_duplicate_error(self):
+        self.add_error("vehicle_number", self.instance.unique_error_message(Vehicle, ["vehicle_number"]))
+
+    def validate_unique(self):
+        # THE NORMALIZED PLATE CHECK COVERS vehicle_number'S OWN UNIQUE CHECK TOO
+        vehicle_number = self.cleaned_data.get("vehicle_number")
+        if vehicle_number and self.duplicate_vehicles(vehicle_number).exists():
+            self.add_duplicate_error()
+
+
+# VEHICLE FORM FOR THE ASYNC VIEWS
+class AsyncVehicleForm(VehicleForm):
+    """VehicleForm whose uniqueness query runs on the async ORM: validate with ais_valid()"""
+
+    def validate_unique(self):
+        pass
+
+    async def ais_valid(self):
+        if not self.is_valid():
+            return False
+        if await self.duplicate_vehicles(self.cleaned_data["vehicle_number"]).aexists():
+            self.add_duplicate_error()
+        return not self.errors
+
+
+# PER-ROW VALIDATION FOR BULK IMPORTS
+class VehicleImportRowForm(VehicleForm):
+    """VehicleForm rules without the per-row uniqueness query (the import upserts instead)"""
+
+    def validate_unique(self):
+        pass
+
+    def rebind(self, data):
+        """Validate another row with this form, skipping the field deep-copy a new form costs"""
+        self.data = data
+        self.instance = self._meta.model()
+        self._errors = None
+        return self.is_valid()
+
+
+# FILE UPLOAD FOR BULK IMPORTS
+class VehicleImportForm(forms.Form):
+    FORMAT_CHOICES = [
+        ("auto", "Detect from file name"),
+        ("csv", "CSV"),
+        ("ndjson", "NDJSON (one JSON object per line)"),
+    ]
+
+    file = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.ndjson,.jsonl,.json'})
+    )
+    file_format = forms.ChoiceField(
+        choices=FORMAT_CHOICES,
+        initial="auto",
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+
+# BULK EDIT / DELETE FROM THE VEHICLE LIST
+class VehicleIdsField(forms.Field):
+    """The ticked row checkboxes (repeated ?ids=) as a list of primary keys"""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        try:
+            return [int(pk) for pk in value or []]
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Invalid vehicle selection.")
+
+
+class VehicleBulkForm(forms.Form):
+    ACTION_CHOICES = [("update", "Update"), ("delete", "Delete")]
+    SCOPE_CHOICES = [
+        ("selected", "Selected vehicles"),
+        ("filtered", "All vehicles matching the current filters"),
+    ]
+
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+    scope = forms.ChoiceField(choices=SCOPE_CHOICES, initial="selected")
+    ids = VehicleIdsField(required=False)
+    vehicle_type = forms.ChoiceField(
+        choices=[("", "Keep type")] + Vehicle.VEHICLE_TYPES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    vehicle_model = forms.CharField(
+        max_length=100,
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'placeholder': 'Keep model'}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("scope") == "selected" and not cleaned_data.get("ids"):
+            raise forms.ValidationError("Select at least one vehicle.")
+        if cleaned_data.get("action") == "update" and not self.changes():
+            raise forms.ValidationError("Choose a new type or model to apply.")
+        return cleaned_data
+
+    def changes(self):
+        """The fields to set, skipping the ones left blank"""
+        return {
+            name: self.cleaned_data[name]
+            for name in ("vehicle_type", "vehicle_model")
+            if self.cleaned_data.get(name)
+        }
@@ -0,0 +1,183 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.functional import cached_property
+from django.utils.safestring import mark_safe
+
+from vehicle_mgmt.replicas import pinned_to_primary
+
+from .models import Vehicle
+
+# RENDERED-HTML CACHE FOR THE VEHICLE LIST
+#
+# Two layers:
+#   * one <tr> fragment per vehicle, keyed on (pk, updated_at) so an edited
+#     vehicle simply misses and re-renders; all rows of a page are fetched
+#     with a single get_many.
+#   * the assembled rows of a whole page (plus its cursors), keyed on the
+#     request's list parameters and a generation number that every vehicle
+#     write bumps (see vehicles/signals.py).
+# Nothing user specific is cached; the surrounding page is rendered per request.
+# Requests pinned to the primary skip the page cache: a page cached from a
+# lagging replica may not have the writes they must see (vehicle_mgmt/replicas.py).
+ROW_TEMPLATE = "vehicles/_row.html"
+PAGE_GENERATION_KEY = "vehicles:page-generation"
+PAGE_CACHE_PARAMS = ("q", "type", "ordering", "after", "before", "page_size")
+
+
+def row_cache_key(pk, updated_at):
+    return f"vehicles:row:{pk}:{updated_at.timestamp()}"
+
+
+def _render_missing_rows(keys, vehicles, fragments):
+    """Render the rows absent from `fragments` into it; return just the new ones"""
+    missing = {}
+    template = None
+    for key, vehicle in zip(keys, vehicles):
+        if key not in fragments:
+            template = template or get_template(ROW_TEMPLATE)
+            missing[key] = fragments[key] = template.render({"vehicle": vehicle})
+    return missing
+
+
+def render_vehicle_rows(vehicles):
+    """Render the <tr> of every vehicle, reusing cached fragments"""
+    vehicles = list(vehicles)
+    keys = [row_cache_key(vehicle.pk, vehicle.updated_at) for vehicle in vehicles]
+    fragments = cache.get_many(keys)
+    missing = _render_missing_rows(keys, vehicles, fragments)
+    if missing:
+        cache.set_many(missing, settings.VEHICLE_ROW_CACHE_TIMEOUT)
+    return mark_safe("".join(fragments[key] for key in keys))
+
+
+async def arender_vehicle_rows(vehicles):
+    vehicles = list(vehicles)
+    keys = [row_cache_key(vehicle.pk, vehicle.updated_at) for vehicle in vehicles]
+    fragments = await cache.aget_many(keys)
+    missing = _render_missing_rows(keys, vehicles, fragments)
+    if missing:
+        await cache.aset_many(missing, settings.VEHICLE_ROW_CACHE_TIMEOUT)
+    return mark_safe("".join(fragments[key] for key in keys))
+
+
+def forget_vehicle_row(pk, updated_at):
+    if pk is not None and updated_at is not None:
+        cache.delete(row_cache_key(pk, updated_at))
+
+
+# PAGE CACHE
+def page_generation():
+    # SEEDED FROM THE CLOCK SO A GENERATION LOST TO EVICTION NEVER REUSES AN OLD NUMBER
+    return cache.get_or_set(PAGE_GENERATION_KEY, time.time_ns, timeout=None)
+
+
+async def apage_generation():
+    return await cache.aget_or_set(PAGE_GENERATION_KEY, time.time_ns, timeout=None)
+
+
+def invalidate_vehicle_pages():
+    """Retire every cached list page (they expire on their own once unreachable)"""
+    try:
+        cache.incr(PAGE_GENERATION_KEY)
+    except ValueError:
+        cache.add(PAGE_GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def page_cache_key(request, generation=None):
+    if generation is None:
+        generation = page_generation()
+    params = [(name, request.GET.get(name, "").strip()) for name in PAGE_CACHE_PARAMS]
+    digest = hashlib.blake2b(repr(params).encode(), digest_size=16).hexdigest()
+    return f"vehicles:page:{generation}:{digest}"
+
+
+class CachedPage:
+    """A list page restored from the page cache; the vehicles themselves load only if asked for"""
+
+    def __init__(self, pks, has_next, has_previous, next_cursor, previous_cursor):
+        self.pks = pks
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(
+            entry["pks"], entry["has_next"], entry["has_previous"],
+            entry["next_cursor"], entry["previous_cursor"],
+        )
+
+    @staticmethod
+    def entry_for(page, rows_html):
+        return {
+            "pks": [vehicle.pk for vehicle in page.object_list],
+            "rows_html": str(rows_html),
+            "has_next": page.has_next,
+            "has_previous": page.has_previous,
+            "next_cursor": page.next_cursor,
+            "previous_cursor": page.previous_cursor,
+        }
+
+    @cached_property
+    def object_list(self):
+        vehicles = Vehicle.objects.in_bulk(self.pks)
+        return [vehicles[pk] for pk in self.pks if pk in vehicles]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.pks)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def _bypass_page_cache():
+    return bool(settings.DATABASE_REPLICAS) and pinned_to_primary()
+
+
+def cached_vehicle_page(request, get_page):
+    """
+    Return (page, rows_html) for the vehicle list.
+
+    get_page() runs the keyset query; it is only called when the page cache
+    is cold. The generation is read before the query and writes bump it once
+    they commit, so a page built from rows read before a commit is stored
+    under a generation that is never read again.
+    """
+    if _bypass_page_cache():
+        page = get_page()
+        return page, render_vehicle_rows(page.object_list)
+
+    key = page_cache_key(request)
+    entry = cache.get(key)
+    if entry is not None:
+        return CachedPage.from_entry(entry), mark_safe(entry["rows_html"])
+
+    page = get_page()
+    rows_html = render_vehicle_rows(page.object_list)
+    cache.set(key, CachedPage.entry_for(page, rows_html), settings.VEHICLE_PAGE_CACHE_TIMEOUT)
+    return page, rows_html
+
+
+async def acached_vehicle_page(request, aget_page):
+    """cached_vehicle_page() for async views; aget_page is a coroutine function"""
+    if _bypass_page_cache():
+        page = await aget_page()
+        return page, await arender_vehicle_rows(page.object_list)
+
+    key = page_cache_key(request, await apage_generation())
+    entry = await cache.aget(key)
+    if entry is not None:
+        return CachedPage.from_entry(entry), mark_safe(entry["rows_html"])
+
+    page = await aget_page()
+    rows_html = await arender_vehicle_rows(page.object_list)
+    await cache.aset(key, CachedPage.entry_for(page, rows_html), settings.VEHICLE_PAGE_CACHE_TIMEOUT)
+    return page, rows_html
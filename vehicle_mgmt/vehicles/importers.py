@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+import os
+
+from django.db import transaction
+from django.utils import timezone
+
+from .audit import audited_values, build_change, field_changes, record_changes, vehicle_values
+from .forms import VehicleImportRowForm
+from .models import Vehicle, normalize_vehicle_number
+from .signals import vehicles_bulk_changed
+
+IMPORT_FIELDS = VehicleImportRowForm._meta.fields
+IMPORT_BATCH_SIZE = 1000
+# ERRORS KEPT IN THE REPORT; THE COUNT KEEPS GOING PAST THIS
+MAX_REPORTED_ERRORS = 1000
+# SHOWN WHEN AN UPLOAD ISN'T UTF-8 (THE FILE IS DECODED AS IT IS READ, SO EARLIER BATCHES MAY BE IN)
+NOT_UTF8_MESSAGE = (
+    "The file isn't UTF-8 text ({error}). Save it as UTF-8 (\"CSV UTF-8\" in Excel) and import it again; "
+    "rows before the invalid bytes may already have been imported."
+)
+
+
+class ImportReport:
+    """Outcome of an import: rows written plus per-row validation errors"""
+
+    def __init__(self):
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, vehicle_number, messages):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'vehicle_number': vehicle_number, 'errors': messages})
+
+    @property
+    def ok(self):
+        return self.error_count == 0
+
+
+def detect_format(filename, file_format="auto"):
+    if file_format != "auto":
+        return file_format
+    extension = os.path.splitext(filename or "")[1].lower()
+    return "csv" if extension == ".csv" else "ndjson"
+
+
+def iter_records(stream, file_format):
+    """Yield (line number, dict) pairs from a text stream, one row at a time"""
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield line_number, error
+            continue
+        yield line_number, record
+
+
+def _write_batch(batch):
+    """Upsert one batch keyed on the normalized plate: new plates are inserted, known ones updated"""
+    with transaction.atomic():
+        # STAMPED ONCE THE WRITE LOCK IS HELD (BEGIN IMMEDIATE CAN WAIT busy_timeout FOR IT), SO THE
+        # ROWS COMMIT WITHIN THE SYNC FEED'S SETTLE WINDOW OF THEIR updated_at
+        now = timezone.now()
+        for vehicle in batch:
+            vehicle.created_at = vehicle.updated_at = now
+        # VALUES BEFORE THE UPSERT, FOR THE AUDIT LOG
+        previous = {
+            normalize_vehicle_number(values["vehicle_number"]): (pk, values)
+            for pk, values in audited_values(
+                Vehicle.objects.filter(
+                    vehicle_number_normalized__in=[vehicle.vehicle_number_normalized for vehicle in batch]
+                )
+            )
+        }
+        Vehicle.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=["vehicle_number_normalized"],
+            update_fields=["vehicle_type", "vehicle_model", "vehicle_description", "updated_at"],
+        )
+        changes = []
+        for vehicle in batch:
+            pk, old_values = previous.get(vehicle.vehicle_number_normalized, (vehicle.pk, {}))
+            new_values = vehicle_values(vehicle)
+            # AN UPDATED ROW KEEPS ITS STORED PLATE SPELLING
+            new_values["vehicle_number"] = old_values.get("vehicle_number", vehicle.vehicle_number)
+            diff = field_changes(old_values, new_values)
+            if diff:
+                changes.append(build_change(pk, new_values["vehicle_number"], "import", diff, changed_at=now))
+        record_changes(changes)
+
+
+def import_vehicles(stream, file_format, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validate and upsert vehicles from a CSV or NDJSON text stream.
+
+    Rows are checked with the VehicleForm rules and written in batches with
+    one INSERT ... ON CONFLICT DO UPDATE each. Invalid rows are skipped and
+    reported; they never abort the rest of the file.
+    """
+    report = ImportReport()
+    # KEYED ON THE NORMALIZED PLATE: A PLATE REPEATED INSIDE ONE BATCH KEEPS ITS LAST ROW
+    batch = {}
+    form = VehicleImportRowForm(data={})
+
+    for line_number, record in iter_records(stream, file_format):
+        if not isinstance(record, dict):
+            report.add_error(line_number, "", {"__all__": [f"Invalid row: {record}"]})
+            continue
+        data = {field: record.get(field) or "" for field in IMPORT_FIELDS}
+        if not form.rebind(data):
+            messages = {field: [str(e) for e in errors] for field, errors in form.errors.items()}
+            report.add_error(line_number, data["vehicle_number"], messages)
+            continue
+        vehicle = form.save(commit=False)
+        # bulk_create SKIPS save(), SO THE CANONICAL COLUMN IS FILLED HERE
+        vehicle.vehicle_number_normalized = normalize_vehicle_number(vehicle.vehicle_number)
+        batch[vehicle.vehicle_number_normalized] = vehicle
+        if len(batch) >= batch_size:
+            _write_batch(list(batch.values()))
+            report.imported += len(batch)
+            batch = {}
+
+    if batch:
+        _write_batch(list(batch.values()))
+        report.imported += len(batch)
+
+    if report.imported:
+        vehicles_bulk_changed.send(sender=Vehicle, action="import")
+    return report
+
+
+def import_vehicles_from_upload(uploaded_file, file_format="auto", batch_size=IMPORT_BATCH_SIZE):
+    file_format = detect_format(uploaded_file.name, file_format)
+    uploaded_file.seek(0)
+    stream = io.TextIOWrapper(uploaded_file.file, encoding="utf-8-sig", newline="")
+    try:
+        return import_vehicles(stream, file_format, batch_size=batch_size)
+    finally:
+        stream.detach()
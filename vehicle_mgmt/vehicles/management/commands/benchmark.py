@@ -0,0 +1,384 @@
+import http.cookiejar
+import json
+import re
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core import mail
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.mailer import otp_mailer
+from users.models import CustomUser
+from vehicles.audit import audit_writer
+from vehicles.bulk import bulk_delete_vehicles
+from vehicles.models import Vehicle, VehicleChange, VehicleTombstone
+
+# EVERY ROW THE BENCHMARK WRITES STARTS WITH THESE, SO IT CAN BE CLEANED UP AFTERWARDS
+BENCH_PLATE_PREFIX = "BENCH"
+BENCH_USER_PREFIX = "bench_"
+BENCH_PASSWORD = "benchpass123"
+# PAGES THAT READ, THEN PAGES THAT WRITE; register RUNS BEFORE verify_otp, WHICH USES ITS CODES
+SCENARIOS = ("home", "about", "list", "detail", "create", "edit", "login", "register", "verify_otp")
+OTP_PATTERN = re.compile(r"verification code is: (\d{6})")
+
+
+class ClientDriver:
+    """Requests through Django's test client, in this process: queries and memory can be measured"""
+    measures_queries = True
+
+    def __init__(self):
+        self.clients = {}
+
+    def session(self, user):
+        key = user.pk if user else None
+        if key not in self.clients:
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            self.clients[key] = client
+        return self.clients[key]
+
+    def request(self, method, path, data=None, user=None):
+        client = self.session(user)
+        # RUN ON-COMMIT WORK (QUEUEING THE OTP EMAIL) EVEN WHEN AN OUTER TRANSACTION WRAPS US, AS IN TESTS
+        with TestCase.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.post(path, data) if method == "POST" else client.get(path)
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, len(queries.captured_queries)
+
+    def sent_otp(self, username):
+        otp_mailer.flush()
+        for message in reversed(mail.outbox):
+            if username in message.body:
+                match = OTP_PATTERN.search(message.body)
+                return match.group(1) if match else None
+        return None
+
+
+class HttpDriver:
+    """Requests to a running server (runserver, gunicorn, uvicorn) over HTTP; one cookie jar per user"""
+    measures_queries = False
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.openers = {}
+
+    def session(self, user):
+        key = user.pk if user else None
+        if key not in self.openers:
+            jar = http.cookiejar.CookieJar()
+            opener = urllib.request.build_opener(
+                urllib.request.HTTPCookieProcessor(jar), NoRedirect
+            )
+            self.openers[key] = (opener, jar)
+            if user is not None:
+                status, _, _ = self.request("POST", reverse("login"), {
+                    "login": user.username, "password": BENCH_PASSWORD,
+                }, user=None, opener=self.openers[key])
+                if status != 302:
+                    raise CommandError(f"Could not log in to {self.base_url} as {user.username} (HTTP {status}).")
+        return self.openers[key]
+
+    def request(self, method, path, data=None, user=None, opener=None):
+        opener, jar = opener or self.session(user)
+        url = self.base_url + path
+        body = None
+        headers = {"Referer": url}
+        if method == "POST":
+            token = self.csrf_token(opener, jar, url)
+            body = urllib.parse.urlencode({**(data or {}), "csrfmiddlewaretoken": token}).encode()
+        started = time.perf_counter()
+        try:
+            with opener.open(urllib.request.Request(url, data=body, headers=headers, method=method)) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        return status, time.perf_counter() - started, None
+
+    def csrf_token(self, opener, jar, url):
+        for cookie in jar:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        try:
+            opener.open(url).read()
+        except urllib.error.HTTPError:
+            pass
+        return next((cookie.value for cookie in jar if cookie.name == settings.CSRF_COOKIE_NAME), "")
+
+    def sent_otp(self, username):
+        # THE CODE ONLY EXISTS IN THE SERVER'S MAILBOX
+        return None
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report 302s instead of following them, as the test client does"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+    def http_error_302(self, request, response, code, message, headers):
+        return response
+
+    http_error_301 = http_error_303 = http_error_307 = http_error_302
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main pages (home, about, vehicle list/detail/create/edit, login, register and "
+        "OTP verification) and report p50/p95/p99 latency, queries per request and peak memory. "
+        "Run it on a seeded database (see seed_data); rows it creates are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100, help="Requests per scenario.")
+        parser.add_argument(
+            "--scenario", action="append", dest="scenarios", choices=SCENARIOS,
+            help="Scenario to run, repeatable (default: all).",
+        )
+        parser.add_argument(
+            "--url", help="Base URL of a running server (default: in process, through the test client).",
+        )
+        parser.add_argument(
+            "--memory-requests", type=int, default=10,
+            help="Extra requests per scenario traced with tracemalloc for peak memory (0 to skip).",
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Print the change against a JSON file from an earlier run.")
+        parser.add_argument("--keep", action="store_true", help="Keep the rows the benchmark created.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("--requests must be positive.")
+        if not Vehicle.objects.exists():
+            raise CommandError("No vehicles to read; run `manage.py seed_data` first.")
+        driver = HttpDriver(options["url"]) if options["url"] else ClientDriver()
+        scenarios = [name for name in SCENARIOS if name in (options["scenarios"] or SCENARIOS)]
+        if "verify_otp" in scenarios and "register" not in scenarios:
+            scenarios.insert(scenarios.index("verify_otp"), "register")
+
+        self.run_id = f"{int(time.time())}"
+        self.superadmin = self.bench_user("superadmin")
+        self.vehicle_ids = list(Vehicle.objects.order_by("-created_at", "-id").values_list("pk", flat=True)[:1000])
+        self.otps = []
+        self.edited_vehicle = None
+
+        # IN PROCESS: CAPTURE MAIL INSTEAD OF SENDING IT, WRITE THE AUDIT LOG IN THE REQUEST RATHER
+        # THAN FROM A THREAD THAT CAN'T SEE THE CALLER'S TRANSACTION, AND ACCEPT THE TEST CLIENT'S HOST
+        local = isinstance(driver, ClientDriver)
+        overrides = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+            VEHICLE_AUDIT_WRITE_BEHIND=False,
+            ALLOWED_HOSTS=["testserver", *settings.ALLOWED_HOSTS],
+        ) if local else nullcontext()
+        results = {}
+        try:
+            with overrides:
+                mail.outbox = []
+                for name in scenarios:
+                    results[name] = self.run_scenario(driver, name, options)
+        finally:
+            if not options["keep"]:
+                self.clean_up()
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "commit": self.git_commit(),
+            "target": options["url"] or "test client",
+            "vehicles": Vehicle.objects.count(),
+            "users": CustomUser.objects.count(),
+            "requests_per_scenario": options["requests"],
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "scenarios": results,
+        }
+        self.print_report(report)
+        if options["compare"]:
+            self.print_comparison(report, options["compare"])
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    # DATA THE SCENARIOS NEED
+    def bench_user(self, role):
+        user, created = CustomUser.objects.get_or_create(
+            username=f"{BENCH_USER_PREFIX}{role}",
+            defaults={"email": f"{BENCH_USER_PREFIX}{role}@example.com", "role": role, "is_active": True},
+        )
+        if created or not user.check_password(BENCH_PASSWORD):
+            user.set_password(BENCH_PASSWORD)
+            user.save()
+        return user
+
+    def clean_up(self):
+        # LET THE AUDIT LOG CATCH UP FIRST SO NO ROW FOR A BENCHMARK VEHICLE IS WRITTEN AFTER THIS
+        audit_writer.flush()
+        vehicles = Vehicle.objects.filter(vehicle_number__startswith=BENCH_PLATE_PREFIX)
+        ids = list(vehicles.values_list("pk", flat=True))
+        bulk_delete_vehicles(vehicles)
+        VehicleChange.objects.filter(vehicle_id__in=ids).delete()
+        VehicleTombstone.objects.filter(vehicle_id__in=ids).delete()
+        CustomUser.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+
+    # ONE REQUEST OF A SCENARIO: (METHOD, PATH, POST DATA, LOGGED-IN USER, EXPECTED STATUS)
+    def scenario_request(self, name, index):
+        vehicle_id = self.vehicle_ids[index % len(self.vehicle_ids)]
+        unique = f"{self.run_id}{index:05d}"
+        if name == "home":
+            return "GET", reverse("home"), None, None, 200
+        if name == "about":
+            return "GET", reverse("about"), None, None, 200
+        if name == "list":
+            return "GET", reverse("vehicle_list"), None, self.superadmin, 200
+        if name == "detail":
+            return "GET", reverse("vehicle_detail", args=[vehicle_id]), None, self.superadmin, 200
+        if name == "create":
+            return "POST", reverse("vehicle_add"), {
+                "vehicle_number": f"{BENCH_PLATE_PREFIX}{unique}", "vehicle_type": "Four",
+                "vehicle_model": "Benchmark Model", "vehicle_description": "Created by the benchmark",
+            }, self.superadmin, 302
+        if name == "edit":
+            if self.edited_vehicle is None:
+                self.edited_vehicle = Vehicle.objects.create(
+                    vehicle_number=f"{BENCH_PLATE_PREFIX}E{self.run_id}", vehicle_type="Two",
+                    vehicle_model="Benchmark Model", vehicle_description="Edited by the benchmark",
+                )
+            vehicle = self.edited_vehicle
+            return "POST", reverse("vehicle_edit", args=[vehicle.pk]), {
+                "vehicle_number": vehicle.vehicle_number, "vehicle_type": ("Two", "Three", "Four")[index % 3],
+                "vehicle_model": f"Benchmark Model {index}", "vehicle_description": "Edited by the benchmark",
+            }, self.superadmin, 302
+        if name == "login":
+            return "POST", reverse("login"), {
+                "login": self.superadmin.username, "password": BENCH_PASSWORD,
+            }, None, 302
+        if name == "register":
+            return "POST", reverse("register"), {
+                "username": f"{BENCH_USER_PREFIX}{unique}", "email": f"{BENCH_USER_PREFIX}{unique}@example.com",
+                "role": "user", "password1": BENCH_PASSWORD, "password2": BENCH_PASSWORD,
+            }, None, 302
+        if name == "verify_otp":
+            if not self.otps:
+                return None
+            username, otp = self.otps.pop()
+            return "POST", reverse("verify_otp", args=[username]), {"otp": otp}, None, 302
+        raise CommandError(f"Unknown scenario {name}")
+
+    def run_scenario(self, driver, name, options):
+        latencies, queries, errors = [], [], 0
+        for index in range(options["requests"]):
+            planned = self.scenario_request(name, index)
+            if planned is None:
+                break
+            method, path, data, user, expected = planned
+            status, elapsed, query_count = driver.request(method, path, data, user)
+            latencies.append(elapsed)
+            if query_count is not None:
+                queries.append(query_count)
+            if status != expected:
+                errors += 1
+            elif name == "register":
+                otp = driver.sent_otp(data["username"])
+                if otp:
+                    self.otps.append((data["username"], otp))
+
+        peak = None
+        if isinstance(driver, ClientDriver) and options["memory_requests"] and name != "verify_otp":
+            peak = self.peak_memory(driver, name, options["requests"], options["memory_requests"])
+
+        if not latencies:
+            self.stderr.write(f"{name}: nothing to run (no OTP codes could be read back)")
+            return {"requests": 0, "errors": 0}
+        cut = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+            "p50_ms": round(cut[49] * 1000, 3),
+            "p95_ms": round(cut[94] * 1000, 3),
+            "p99_ms": round(cut[98] * 1000, 3),
+            "queries_mean": round(statistics.fmean(queries), 2) if queries else None,
+            "queries_max": max(queries) if queries else None,
+            "peak_memory_kb": peak,
+        }
+
+    def peak_memory(self, driver, name, offset, count):
+        """Largest traced allocation peak of one request (tracemalloc slows requests, so timed separately)"""
+        peak = 0
+        tracemalloc.start()
+        try:
+            for index in range(offset, offset + count):
+                method, path, data, user, _ = self.scenario_request(name, index)
+                driver.session(user)
+                tracemalloc.reset_peak()
+                driver.request(method, path, data, user)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+        return round(peak / 1024, 1)
+
+    # OUTPUT
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{report['vehicles']} vehicles, {report['users']} users, target: {report['target']}, "
+            f"commit: {report['commit'] or '-'}"
+        )
+        self.stdout.write(
+            f"{'scenario':<11} {'reqs':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>8} {'peak KB':>8}"
+        )
+        for name, result in report["scenarios"].items():
+            if not result["requests"]:
+                continue
+            self.stdout.write(
+                f"{name:<11} {result['requests']:>5} {result['errors']:>4} {result['p50_ms']:>8.2f} "
+                f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{self.optional(result['queries_mean'], '.1f'):>8} {self.optional(result['peak_memory_kb'], '.0f'):>8}"
+            )
+        self.stdout.write(f"Process max RSS: {report['max_rss_kb'] / 1024:.1f} MB")
+
+    def print_comparison(self, report, path):
+        try:
+            with open(path) as handle:
+                baseline = json.load(handle)
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Could not read {path}: {error}")
+        self.stdout.write(f"Change against {path} (commit {baseline.get('commit') or '-'}):")
+        for name, result in report["scenarios"].items():
+            before = baseline.get("scenarios", {}).get(name)
+            if not before or not before.get("requests") or not result["requests"]:
+                continue
+            changes = []
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if before[key]:
+                    changes.append(f"{key[:-3]} {(result[key] - before[key]) / before[key] * 100:+.1f}%")
+            if before.get("queries_mean") is not None and result["queries_mean"] is not None:
+                changes.append(f"queries {result['queries_mean'] - before['queries_mean']:+.1f}")
+            self.stdout.write(f"  {name:<11} " + ", ".join(changes))
+
+    @staticmethod
+    def optional(value, spec):
+        return "-" if value is None else format(value, spec)
@@ -0,0 +1,246 @@
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from django.test import Client, override_settings
+
+from users.models import CustomUser
+from vehicles.models import Vehicle
+
+# EACH MODE IS A (HANDLER, URLCONF) PAIR: HOW THE SAME PAGES ARE SERVED UNDER wsgi.py / asgi.py
+MODES = {
+    "wsgi": ("wsgi", "vehicle_mgmt.urls"),
+    "asgi": ("asgi", "vehicle_mgmt.async_urls"),
+    "asgi-sync": ("asgi", "vehicle_mgmt.urls"),
+}
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec of the vehicle pages served through Django's WSGI handler "
+        "(sync views) and ASGI handler (async views), in process and against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Requests per mode.")
+        parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight at once.")
+        parser.add_argument("--username", help="User to log in as (default: the first superadmin).")
+        parser.add_argument(
+            "--path", action="append", dest="paths",
+            help="Path to request, repeatable (default: the list page and one detail page).",
+        )
+        parser.add_argument(
+            "--mode", action="append", dest="modes", choices=sorted(MODES),
+            help="Modes to run, repeatable (default: wsgi and asgi).",
+        )
+        parser.add_argument(
+            "--compare-replicas", action="store_true",
+            help="Run every mode twice: all reads on the primary, then reads spread over DATABASE_REPLICAS.",
+        )
+        parser.add_argument(
+            "--background-writes", action="store_true",
+            help="Keep a writer thread updating vehicles on the primary during every run.",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        users = CustomUser.objects.filter(is_active=True)
+        if options["username"]:
+            user = users.filter(username=options["username"]).first()
+        else:
+            user = users.filter(role="superadmin").order_by("pk").first()
+        if user is None:
+            raise CommandError("No matching active user to log in as; pass --username.")
+
+        paths = options["paths"] or self.default_paths()
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        host = next((h for h in settings.ALLOWED_HOSTS if "*" not in h and not h.startswith(".")), "localhost")
+
+        if options["compare_replicas"] and not settings.DATABASE_REPLICAS:
+            raise CommandError("--compare-replicas needs replicas; set SQLITE_REPLICA_FILES.")
+        self.stdout.write(
+            f"{options['requests']} requests per mode, concurrency {options['concurrency']}, "
+            f"paths: {', '.join(paths)}"
+        )
+        # (LABEL SUFFIX, REPLICA ALIASES) PER RUN
+        replica_runs = [("", settings.DATABASE_REPLICAS)]
+        if options["compare_replicas"]:
+            replica_runs = [("", []), ("+replicas", settings.DATABASE_REPLICAS)]
+
+        self.stdout.write(f"{'mode':<18} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for mode in options["modes"] or ["wsgi", "asgi"]:
+            handler_type, urlconf = MODES[mode]
+            for suffix, replicas in replica_runs:
+                with override_settings(
+                    ROOT_URLCONF=urlconf,
+                    ALLOWED_HOSTS=[host, *settings.ALLOWED_HOSTS],
+                    DATABASE_REPLICAS=replicas,
+                ):
+                    run = self.run_wsgi if handler_type == "wsgi" else self.run_asgi
+                    with self.background_writes(options["background_writes"]):
+                        elapsed, latencies, errors = run(
+                            paths, host, cookie, options["requests"], options["concurrency"]
+                        )
+                self.report(mode + suffix, elapsed, latencies, errors)
+
+    def report(self, label, elapsed, latencies, errors):
+        self.stdout.write(
+            f"{label:<18} {len(latencies) / elapsed:>9.1f} "
+            f"{statistics.median(latencies) * 1000:>8.2f} "
+            f"{statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else 0:>8.2f} "
+            f"{errors:>7}"
+        )
+
+    @contextmanager
+    def background_writes(self, enabled):
+        """Write to the primary in a loop while the block runs (what replicas take reads away from)"""
+        if not enabled:
+            yield
+            return
+        stop = threading.Event()
+
+        def write():
+            try:
+                while not stop.is_set():
+                    with transaction.atomic():
+                        Vehicle.objects.filter(pk__in=Vehicle.objects.order_by("?").values("pk")[:50]).update(
+                            updated_at=timezone.now()
+                        )
+            finally:
+                connections.close_all()
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            writer.join()
+
+    def default_paths(self):
+        paths = ["/vehicles/"]
+        vehicle = Vehicle.objects.order_by("pk").first()
+        if vehicle is not None:
+            paths.append(f"/vehicles/{vehicle.pk}/")
+        return paths
+
+    # WSGI: A THREAD POOL CALLING THE HANDLER, AS A THREADED WSGI SERVER WOULD
+    # (body IS SENT AS A FORM POST; A RESPONSE OTHER THAN expect COUNTS AS AN ERROR)
+    def run_wsgi(self, paths, host, cookie, total, concurrency, body=None, expect=200):
+        handler = WSGIHandler()
+
+        def request(index):
+            environ = {
+                "REQUEST_METHOD": "GET" if body is None else "POST",
+                "PATH_INFO": paths[index % len(paths)],
+                "QUERY_STRING": "",
+                "SCRIPT_NAME": "",
+                "SERVER_NAME": host,
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "HTTP_HOST": host,
+                "HTTP_COOKIE": cookie,
+                "wsgi.input": BytesIO(body or b""),
+                "wsgi.errors": sys.stderr,
+                "wsgi.url_scheme": "http",
+            }
+            if body is not None:
+                environ.update(CONTENT_TYPE=FORM_CONTENT_TYPE, CONTENT_LENGTH=str(len(body)))
+            status = []
+            started = time.perf_counter()
+            response = handler(environ, lambda code, headers: status.append(code))
+            for _ in response:
+                pass
+            response.close()
+            return time.perf_counter() - started, not status[0].startswith(str(expect))
+
+        def worker(indexes):
+            try:
+                return [request(index) for index in indexes]
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            chunks = pool.map(worker, [range(i, total, concurrency) for i in range(concurrency)])
+            results = [result for chunk in chunks for result in chunk]
+        return self.summarize(started, results)
+
+    # ASGI: CONCURRENT TASKS ON ONE EVENT LOOP, AS AN ASGI SERVER WOULD
+    def run_asgi(self, paths, host, cookie, total, concurrency, body=None, expect=200):
+        handler = ASGIHandler()
+        headers = [(b"host", host.encode()), (b"cookie", cookie.encode())]
+        if body is not None:
+            headers += [(b"content-type", FORM_CONTENT_TYPE.encode()), (b"content-length", str(len(body)).encode())]
+
+        async def request(index):
+            path = paths[index % len(paths)]
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "GET" if body is None else "POST",
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": b"",
+                "root_path": "",
+                "headers": headers,
+                "client": ("127.0.0.1", 0),
+                "server": (host, 80),
+            }
+            body_sent = False
+            status = []
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {"type": "http.request", "body": body or b"", "more_body": False}
+                # NO DISCONNECT: WAIT UNTIL THE HANDLER CANCELS ITS LISTENER
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+
+            started = time.perf_counter()
+            await handler(scope, receive, send)
+            return time.perf_counter() - started, status[0] != expect
+
+        async def main():
+            queue = iter(range(total))
+            results = []
+
+            async def worker():
+                for index in queue:
+                    results.append(await request(index))
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return results
+
+        started = time.perf_counter()
+        results = asyncio.run(main())
+        connections.close_all()
+        return self.summarize(started, results)
+
+    def summarize(self, started, results):
+        elapsed = time.perf_counter() - started
+        latencies = [latency for latency, _ in results]
+        errors = sum(1 for _, failed in results if failed)
+        return elapsed, latencies, errors
@@ -0,0 +1,106 @@
+import os
+import statistics
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+from users.hashing import password_hashing
+from users.models import CustomUser
+
+from . import benchmark_asgi
+from .benchmark import BENCH_PASSWORD, BENCH_USER_PREFIX
+from .benchmark_asgi import MODES
+
+LOGIN_USERNAME = f"{BENCH_USER_PREFIX}login"
+
+
+class Command(benchmark_asgi.Command):
+    help = (
+        "Measure successful logins/sec, per core and in CPU time, under concurrent load: the sync login "
+        "view through the WSGI and ASGI handlers, and the async login view hashing on the password "
+        "hashing pool (users/hashing.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100, help="Logins per mode.")
+        parser.add_argument("--concurrency", type=int, default=16, help="Logins in flight at once.")
+        parser.add_argument(
+            "--mode", action="append", dest="modes", choices=sorted(MODES),
+            help="Modes to run, repeatable (default: wsgi, asgi-sync and asgi).",
+        )
+        parser.add_argument(
+            "--workers", type=int,
+            help="PASSWORD_HASHING_WORKERS for the async view (default: the setting).",
+        )
+        parser.add_argument("--cores", type=int, help="Cores to divide throughput by (default: the usable ones).")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        if options["workers"] is not None and options["workers"] < 1:
+            raise CommandError("--workers must be positive.")
+        cores = options["cores"] or (
+            len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        )
+        workers = options["workers"] or settings.PASSWORD_HASHING_WORKERS
+
+        user, _ = CustomUser.objects.get_or_create(
+            username=LOGIN_USERNAME,
+            defaults={"email": f"{LOGIN_USERNAME}@example.com", "role": "user", "is_active": True},
+        )
+        user.set_password(BENCH_PASSWORD)
+        user.save()
+
+        # ONE CSRF COOKIE AND TOKEN FOR EVERY LOGIN, AS A BROWSER WOULD SEND AFTER LOADING THE PAGE
+        csrf_request = RequestFactory().get("/")
+        body = urlencode({
+            "login": LOGIN_USERNAME,
+            "password": BENCH_PASSWORD,
+            "csrfmiddlewaretoken": get_token(csrf_request),
+        }).encode()
+        cookie = f"{settings.CSRF_COOKIE_NAME}={csrf_request.META['CSRF_COOKIE']}"
+        host = next((h for h in settings.ALLOWED_HOSTS if "*" not in h and not h.startswith(".")), "localhost")
+
+        self.stdout.write(
+            f"{options['requests']} logins per mode, concurrency {options['concurrency']}, "
+            f"{cores} core(s), {workers} hashing worker(s) for the async view"
+        )
+        self.stdout.write(
+            f"{'mode':<10} {'logins/s':>9} {'per core':>9} {'cpu ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}"
+        )
+        try:
+            for mode in options["modes"] or ["wsgi", "asgi-sync", "asgi"]:
+                handler_type, urlconf = MODES[mode]
+                run = self.run_wsgi if handler_type == "wsgi" else self.run_asgi
+                with override_settings(
+                    ROOT_URLCONF=urlconf,
+                    ALLOWED_HOSTS=[host, *settings.ALLOWED_HOSTS],
+                    PASSWORD_HASHING_WORKERS=workers,
+                ):
+                    # A FRESH POOL PER RUN, SIZED BY THE OVERRIDE
+                    password_hashing.shutdown()
+                    cpu_started = time.process_time()
+                    elapsed, latencies, errors = run(
+                        [reverse("login")], host, cookie, options["requests"], options["concurrency"],
+                        body=body, expect=302,
+                    )
+                    cpu = time.process_time() - cpu_started
+                    password_hashing.shutdown()
+                self.report_logins(mode, elapsed, cpu, cores, latencies, errors)
+        finally:
+            CustomUser.objects.filter(username=LOGIN_USERNAME).delete()
+
+    def report_logins(self, label, elapsed, cpu, cores, latencies, errors):
+        # cpu ms: PROCESS CPU TIME (ALL THREADS) PER LOGIN, HASHING INCLUDED
+        rate = len(latencies) / elapsed
+        self.stdout.write(
+            f"{label:<10} {rate:>9.2f} {rate / cores:>9.2f} {cpu / len(latencies) * 1000:>8.1f} "
+            f"{statistics.median(latencies) * 1000:>8.1f} "
+            f"{statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else 0:>8.1f} "
+            f"{errors:>7}"
+        )
@@ -0,0 +1,155 @@
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+# THE SAME STATEMENTS THE APP RUNS MOST: A LIST PAGE, A DETAIL LOOKUP, AN EDIT
+LIST_PAGE = (
+    "SELECT id, vehicle_number, vehicle_type, vehicle_model, created_at "
+    "FROM vehicles_vehicle ORDER BY created_at DESC, id DESC LIMIT 25"
+)
+DETAIL = "SELECT * FROM vehicles_vehicle WHERE id = ?"
+EDIT = "UPDATE vehicles_vehicle SET vehicle_model = ?, updated_at = ? WHERE id = ?"
+
+
+class Profile:
+    """How connections are opened and configured for one run"""
+
+    def __init__(self, name, pragmas, persistent, begin="BEGIN"):
+        self.name = name
+        self.pragmas = pragmas
+        self.persistent = persistent
+        self.begin = begin
+
+    def connect(self, path):
+        # isolation_level=None: TRANSACTIONS ARE OPENED EXPLICITLY, LIKE DJANGO'S AUTOCOMMIT MODE;
+        # timeout=5 IS THE sqlite3 MODULE DEFAULT DJANGO CONNECTS WITH
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name}={value}")
+        return connection
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent read/write throughput on a copy of the database, first with SQLite's "
+        "defaults and a new connection per request, then with SQLITE_PRAGMAS and persistent connections"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=5.0, help="Length of each run.")
+        parser.add_argument("--readers", type=int, default=8, help="Reader threads.")
+        parser.add_argument("--writers", type=int, default=2, help="Writer threads.")
+        parser.add_argument(
+            "--reads-per-request", type=int, default=3,
+            help="Queries per simulated read request (a new connection per request in the default profile).",
+        )
+
+    def handle(self, *args, **options):
+        primary = connections["default"]
+        if primary.vendor != "sqlite":
+            raise CommandError("This benchmark only applies to SQLite.")
+        if options["readers"] < 0 or options["writers"] < 0 or options["readers"] + options["writers"] < 1:
+            raise CommandError("Need at least one reader or writer.")
+
+        workdir = tempfile.mkdtemp(prefix="vehicle-sqlite-bench-")
+        try:
+            source = os.path.join(workdir, "source.sqlite3")
+            primary.ensure_connection()
+            target = sqlite3.connect(source)
+            try:
+                primary.connection.backup(target)
+                target.execute("PRAGMA journal_mode=delete")
+                ids = [row[0] for row in target.execute("SELECT id FROM vehicles_vehicle")]
+            finally:
+                target.close()
+            if not ids:
+                raise CommandError("The vehicles table is empty; import or seed some vehicles first.")
+
+            profiles = [
+                # ROLLBACK JOURNAL, DEFERRED BEGIN, A CONNECTION PER REQUEST: THE PROJECT BEFORE TUNING
+                Profile("default", {}, persistent=False),
+                Profile("tuned", settings.SQLITE_PRAGMAS, persistent=True, begin="BEGIN IMMEDIATE"),
+            ]
+            self.stdout.write(
+                f"{len(ids)} vehicles, {options['readers']} readers, {options['writers']} writers, "
+                f"{options['seconds']}s per profile"
+            )
+            self.stdout.write(
+                f"{'profile':<10} {'reads/s':>9} {'writes/s':>9} {'read p95 ms':>12} "
+                f"{'write p95 ms':>13} {'locked':>7}"
+            )
+            for profile in profiles:
+                path = os.path.join(workdir, f"{profile.name}.sqlite3")
+                shutil.copyfile(source, path)
+                self.report(profile, self.run(profile, path, ids, options))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def run(self, profile, path, ids, options):
+        deadline = time.perf_counter() + options["seconds"]
+        results = {"read": [], "write": [], "locked": 0}
+        lock = threading.Lock()
+
+        def worker(kind):
+            latencies, locked = [], 0
+            connection = profile.connect(path) if profile.persistent else None
+            current = None
+            rng = random.Random()
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    current = connection or profile.connect(path)
+                    if kind == "read":
+                        current.execute(LIST_PAGE).fetchall()
+                        for _ in range(options["reads_per_request"] - 1):
+                            current.execute(DETAIL, (rng.choice(ids),)).fetchall()
+                    else:
+                        current.execute(profile.begin)
+                        current.execute(EDIT, (f"Model {rng.random():.6f}", timezone.now().isoformat(), rng.choice(ids)))
+                        current.execute("COMMIT")
+                    latencies.append(time.perf_counter() - started)
+                except sqlite3.OperationalError:
+                    # "database is locked" (OR A SCHEMA READ FAILING UNDER THE LOCK)
+                    locked += 1
+                    if current is not None and current.in_transaction:
+                        current.execute("ROLLBACK")
+                finally:
+                    if connection is None and current is not None:
+                        current.close()
+                        current = None
+            if connection is not None:
+                connection.close()
+            with lock:
+                results[kind].extend(latencies)
+                results["locked"] += locked
+
+        threads = [threading.Thread(target=worker, args=("read",)) for _ in range(options["readers"])]
+        threads += [threading.Thread(target=worker, args=("write",)) for _ in range(options["writers"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results["seconds"] = options["seconds"]
+        return results
+
+    def report(self, profile, results):
+        def p95(latencies):
+            if len(latencies) < 2:
+                return 0.0
+            return statistics.quantiles(latencies, n=20)[-1] * 1000
+
+        self.stdout.write(
+            f"{profile.name:<10} {len(results['read']) / results['seconds']:>9.1f} "
+            f"{len(results['write']) / results['seconds']:>9.1f} {p95(results['read']):>12.2f} "
+            f"{p95(results['write']):>13.2f} {results['locked']:>7}"
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.importers import IMPORT_BATCH_SIZE, NOT_UTF8_MESSAGE, detect_format, import_vehicles
+
+
+class Command(BaseCommand):
+    help = "Import vehicles from a CSV or NDJSON file, inserting new plates and updating known ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or NDJSON file to import")
+        parser.add_argument(
+            "--format", choices=["auto", "csv", "ndjson"], default="auto",
+            help="File format (default: detect from the file extension)",
+        )
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = detect_format(path, options["format"])
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as stream:
+                report = import_vehicles(stream, file_format, batch_size=options["batch_size"])
+        except OSError as error:
+            raise CommandError(f"Could not read {path}: {error}")
+        except UnicodeDecodeError as error:
+            raise CommandError(f"Could not read {path}: " + NOT_UTF8_MESSAGE.format(error=error.reason))
+
+        for error in report.errors:
+            details = "; ".join(
+                f"{field}: {' '.join(messages)}" for field, messages in error["errors"].items()
+            )
+            self.stderr.write(f"line {error['line']} ({error['vehicle_number'] or '-'}): {details}")
+        if report.error_count > len(report.errors):
+            self.stderr.write(f"... and {report.error_count - len(report.errors)} more errors")
+
+        style = self.style.SUCCESS if report.ok else self.style.WARNING
+        self.stdout.write(style(
+            f"Imported {report.imported} vehicles, skipped {report.error_count} invalid rows."
+        ))
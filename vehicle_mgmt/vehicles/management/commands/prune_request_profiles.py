@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from vehicles.profiling import prune_profiles
+
+
+class Command(BaseCommand):
+    help = "Delete request profiles older than VEHICLE_PROFILE_KEEP_DAYS (run daily, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        count = prune_profiles()
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {count} request profiles older than {settings.VEHICLE_PROFILE_KEEP_DAYS} days."
+        ))
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from vehicles.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = "Delete sync-feed tombstones older than VEHICLE_SYNC_TOMBSTONE_DAYS (run daily, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        count = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {count} tombstones older than {settings.VEHICLE_SYNC_TOMBSTONE_DAYS} days."
+        ))
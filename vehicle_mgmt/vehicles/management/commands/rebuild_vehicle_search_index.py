@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.search import fts_enabled, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over vehicle number, model and description"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default", help="Database alias to rebuild")
+
+    def handle(self, *args, **options):
+        database = options["database"]
+        if not fts_enabled(database):
+            raise CommandError("The full-text search index is only available on SQLite.")
+        rebuild_search_index(database)
+        self.stdout.write(self.style.SUCCESS("Vehicle search index rebuilt."))
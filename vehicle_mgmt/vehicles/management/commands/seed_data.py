@@ -0,0 +1,94 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import CustomUser
+from vehicles.models import Vehicle, normalize_vehicle_number
+from vehicles.signals import vehicles_bulk_changed
+
+STATES = ("MH", "KA", "DL", "TN", "GJ", "RJ", "UP", "WB", "KL", "TS")
+MODELS = {
+    "Two": ("Honda Activa", "TVS Jupiter", "Bajaj Pulsar 150", "Royal Enfield Classic 350", "Hero Splendor"),
+    "Three": ("Bajaj RE", "Piaggio Ape", "Mahindra Treo", "TVS King"),
+    "Four": ("Maruti Swift", "Tata Nexon", "Hyundai Creta", "Mahindra XUV700", "Toyota Innova"),
+}
+# SHARE OF SEEDED USERS PER ROLE
+ROLE_WEIGHTS = {"superadmin": 1, "admin": 4, "user": 15}
+LETTERS = "ABCDEFGHJKLMNPRSTUVWXYZ"
+
+
+def seed_plate(rng, number):
+    """A realistic-looking plate, unique per number up to 23 million: "MH 12 AB 0042" style"""
+    letters = LETTERS[number // 1_000_000 % len(LETTERS)] + rng.choice(LETTERS)
+    return f"{STATES[number % len(STATES)]} {number // 10000 % 100:02d} {letters} {number % 10000:04d}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed N vehicles and M users across roles for load testing. "
+        "Existing seeded rows are kept, so the command can be re-run to grow the data set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vehicles", type=int, default=10_000, help="Vehicles to create.")
+        parser.add_argument("--users", type=int, default=100, help="Users to create, split across roles.")
+        parser.add_argument("--password", default="seedpass123", help="Password for every seeded user.")
+        parser.add_argument("--user-prefix", default="seed_user", help="Seeded usernames are <prefix><n>.")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0, help="Random seed (same seed, same data).")
+
+    def handle(self, *args, **options):
+        if options["vehicles"] < 0 or options["users"] < 0 or options["batch_size"] < 1:
+            raise CommandError("--vehicles and --users can't be negative; --batch-size must be positive.")
+        rng = random.Random(options["seed"])
+        vehicles = self.seed_vehicles(rng, options["vehicles"], options["batch_size"])
+        users = self.seed_users(options["users"], options["password"], options["user_prefix"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Seeded {vehicles} vehicles and {users} users."))
+
+    def seed_vehicles(self, rng, count, batch_size):
+        start = Vehicle.objects.count()
+        created = 0
+        now = timezone.now()
+        with transaction.atomic():
+            for batch_start in range(start, start + count, batch_size):
+                batch = []
+                for number in range(batch_start, min(batch_start + batch_size, start + count)):
+                    vehicle_type = rng.choice(list(MODELS))
+                    vehicle_number = seed_plate(rng, number)
+                    batch.append(Vehicle(
+                        vehicle_number=vehicle_number,
+                        vehicle_number_normalized=normalize_vehicle_number(vehicle_number),
+                        vehicle_type=vehicle_type,
+                        vehicle_model=rng.choice(MODELS[vehicle_type]),
+                        vehicle_description=f"Seeded {vehicle_type.lower()} wheeler #{number}",
+                        created_at=now,
+                        updated_at=now,
+                    ))
+                # bulk_create SKIPS save() AND THE SIGNALS; ONE vehicles_bulk_changed BELOW CATCHES UP
+                Vehicle.objects.bulk_create(batch, ignore_conflicts=True)
+                created += len(batch)
+                self.stdout.write(f"  {created}/{count} vehicles")
+            if created:
+                vehicles_bulk_changed.send(sender=Vehicle, action="import")
+        return created
+
+    def seed_users(self, count, password, prefix, batch_size):
+        # HASH ONCE: EVERY SEEDED USER SHARES THE PASSWORD
+        password_hash = make_password(password)
+        roles = [role for role, weight in ROLE_WEIGHTS.items() for _ in range(weight)]
+        start = CustomUser.objects.filter(username__startswith=prefix).count()
+        users = [
+            CustomUser(
+                username=f"{prefix}{number}",
+                email=f"{prefix}{number}@example.com",
+                password=password_hash,
+                role=roles[number % len(roles)],
+                is_active=True,
+            )
+            for number in range(start, start + count)
+        ]
+        CustomUser.objects.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
+        return len(users)
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto every replica in SQLITE_REPLICA_FILES "
+        "(a consistent online backup; run it whenever the replicas should catch up)"
+    )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured; set SQLITE_REPLICA_FILES.")
+        primary = connections["default"]
+        if primary.vendor != "sqlite":
+            raise CommandError("Replica files can only be copied from a SQLite primary.")
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections[alias]
+            # CLOSE OUR OWN HANDLE SO THE FILE CAN BE REPLACED CLEANLY
+            replica.close()
+            target = sqlite3.connect(replica.settings_dict["NAME"])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f"{alias}: copied to {replica.settings_dict['NAME']}")
+        self.stdout.write(self.style.SUCCESS(f"{len(settings.DATABASE_REPLICAS)} replicas in sync."))
@@ -0,0 +1,359 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+# REQUEST METRICS, RECORDED BY vehicles.middleware.request_metrics_middleware AND
+# SERVED AT /metrics IN THE PROMETHEUS TEXT FORMAT.
+#
+# Values are kept per process in one dict per thread: a thread only ever writes
+# its own dict, so recording takes no lock. A scrape adds the dicts up. With
+# VEHICLE_METRICS_MULTIPROCESS_FILE set, every worker also adds what it recorded
+# since its last flush to that file, and a scrape from any worker reports the sum.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# NAME: (TYPE, HELP, HISTOGRAM BUCKETS)
+METRICS = {
+    "vehicle_http_requests_total": (
+        "counter", "Requests served, by URL name, method and status.", None),
+    "vehicle_http_request_duration_seconds": (
+        "histogram", "Time spent in the view and middleware, by URL name.", DURATION_BUCKETS),
+    "vehicle_http_db_queries_total": (
+        "counter", "SQL queries run while serving requests, by URL name.", None),
+    "vehicle_http_db_query_seconds_total": (
+        "counter", "Time spent in SQL queries while serving requests, by URL name.", None),
+    "vehicle_http_template_render_seconds": (
+        "histogram", "Template rendering time per request, by URL name.", DURATION_BUCKETS),
+    "vehicle_http_response_size_bytes": (
+        "histogram", "Response body sizes, by URL name.", SIZE_BUCKETS),
+}
+
+UNMATCHED = "unmatched"
+
+
+class RequestStats:
+    """Queries and template time of the request being served"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+
+current_stats = ContextVar("vehicles_metrics_request", default=None)
+
+
+class MetricsRegistry:
+    """
+    Per-process metric values, sharded per thread.
+
+    Keys are (sample name, ((label, value), ...)). A snapshot copies every
+    shard (dict.copy() is atomic under the GIL) and adds them up. The shard
+    of a thread that has exited is folded into one retired dict, so servers
+    that start a thread per request don't pile up shards. Histograms are
+    stored as one counter per bucket plus _sum and _count; the buckets are
+    made cumulative when rendered.
+    """
+
+    def __init__(self):
+        self._shards_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._local = threading.local()
+        # [(THREAD, SHARD)]; _retired HOLDS THE TOTALS OF THREADS THAT HAVE EXITED
+        self._shards = []
+        self._retired = {}
+        self._flushed = {}
+        self._flushed_at = time.monotonic()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # ONLY THE FIRST VALUE A THREAD RECORDS TAKES THE LOCK
+            with self._shards_lock:
+                self._retire_dead_shards()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead_shards(self):
+        # CALLED WITH _shards_LOCK HELD. A THREAD THAT HAS EXITED CAN'T WRITE ITS SHARD ANY MORE
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+                continue
+            for key, value in shard.items():
+                self._retired[key] = self._retired.get(key, 0) + value
+        self._shards = live
+
+    def inc(self, name, labels, value=1):
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        bound = next((bound for bound in METRICS[name][2] if value <= bound), None)
+        if bound is not None:
+            self.inc(f"{name}_bucket", labels + (("le", _format_value(bound)),))
+        self.inc(f"{name}_sum", labels, value)
+        self.inc(f"{name}_count", labels)
+
+    def snapshot(self):
+        with self._shards_lock:
+            self._retire_dead_shards()
+            shards = [shard for _, shard in self._shards]
+            totals = dict(self._retired)
+        for shard in shards:
+            for key, value in shard.copy().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    # MULTIPROCESS MODE
+    def flush(self, path, force=False):
+        """Add what was recorded since the last flush to the shared file (at most every FLUSH_INTERVAL)"""
+        if not force and time.monotonic() - self._flushed_at < settings.VEHICLE_METRICS_FLUSH_INTERVAL:
+            return
+        with self._flush_lock:
+            current = self.snapshot()
+            deltas = {key: value - self._flushed.get(key, 0) for key, value in current.items()}
+            SharedMetricsFile(path).add({key: value for key, value in deltas.items() if value})
+            self._flushed = current
+            self._flushed_at = time.monotonic()
+
+    def collect(self):
+        """Every process's values when multiprocess mode is on, else this process's"""
+        path = settings.VEHICLE_METRICS_MULTIPROCESS_FILE
+        if not path:
+            return self.snapshot()
+        self.flush(path, force=True)
+        return SharedMetricsFile(path).read()
+
+
+class SharedMetricsFile:
+    """
+    Metric totals shared by the workers of one server, as a JSON file.
+
+    Writers take an exclusive flock on "<path>.lock", merge their deltas and
+    atomically replace the file, so readers never see a partial write
+    (flock makes this mode Unix-only).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _locked(self, operation):
+        import fcntl
+
+        handle = open(f"{self.path}.lock", "a")
+        fcntl.flock(handle, operation)
+        return handle
+
+    def _load(self):
+        try:
+            with open(self.path) as handle:
+                rows = json.load(handle)
+        except (FileNotFoundError, ValueError):
+            return {}
+        return {(name, tuple(map(tuple, labels))): value for name, labels, value in rows}
+
+    def read(self):
+        import fcntl
+
+        with self._locked(fcntl.LOCK_SH):
+            return self._load()
+
+    def add(self, deltas):
+        import fcntl
+
+        if not deltas:
+            return
+        with self._locked(fcntl.LOCK_EX):
+            totals = self._load()
+            for key, value in deltas.items():
+                totals[key] = totals.get(key, 0) + value
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary, "w") as handle:
+                json.dump([[name, labels, value] for (name, labels), value in totals.items()], handle)
+            os.replace(temporary, self.path)
+
+
+registry = MetricsRegistry()
+if hasattr(os, "register_at_fork"):
+    # A FORKED WORKER STARTS FROM ZERO (WHAT THE PARENT RECORDED IS THE PARENT'S)
+    os.register_at_fork(after_in_child=registry.reset)
+
+
+@atexit.register
+def _flush_at_exit():
+    if settings.configured and getattr(settings, "VEHICLE_METRICS_MULTIPROCESS_FILE", ""):
+        registry.flush(settings.VEHICLE_METRICS_MULTIPROCESS_FILE, force=True)
+
+
+# DATABASE QUERIES: A WRAPPER ON EVERY CONNECTION, COUNTING FOR THE REQUEST IN current_stats
+def time_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # FIRST IN THE LIST, SO connection.execute_wrapper() BLOCKS STILL POP THEIR OWN WRAPPER
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+# TEMPLATES: settings.TEMPLATES USES THIS BACKEND SO EVERY RENDER IS TIMED
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return super().render(context, request)
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_depth -= 1
+            # A TEMPLATE RENDERED FROM INSIDE ANOTHER IS ALREADY IN THE OUTER ONE'S TIME
+            if not stats.template_depth:
+                stats.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time added to the request's metrics"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+# RECORDING A REQUEST
+def begin_request():
+    stats = RequestStats()
+    return stats, current_stats.set(stats)
+
+
+def end_request(request, response, started, stats, token):
+    """Record one served request; a streamed body is measured (queries included) as it is sent"""
+    current_stats.reset(token)
+    match = request.resolver_match
+    view = match.view_name if match is not None else UNMATCHED
+    labels = (("view", view),)
+    registry.inc("vehicle_http_requests_total",
+                 labels + (("method", request.method), ("status", str(response.status_code))))
+    registry.observe("vehicle_http_request_duration_seconds", labels, time.perf_counter() - started)
+    if response.streaming:
+        _measure_stream(response, labels, stats)
+    else:
+        _record_body(labels, stats, len(response.content))
+
+    path = settings.VEHICLE_METRICS_MULTIPROCESS_FILE
+    if path:
+        registry.flush(path)
+    return response
+
+
+def _record_body(labels, stats, size):
+    registry.inc("vehicle_http_db_queries_total", labels, stats.queries)
+    registry.inc("vehicle_http_db_query_seconds_total", labels, stats.db_seconds)
+    registry.observe("vehicle_http_template_render_seconds", labels, stats.template_seconds)
+    registry.observe("vehicle_http_response_size_bytes", labels, size)
+
+
+def _measure_stream(response, labels, stats):
+    # EACH CHUNK IS PRODUCED WITH THE REQUEST'S STATS CURRENT, SO QUERIES RUN BY THE STREAM COUNT
+    if response.is_async:
+        async def counted(chunks):
+            size = 0
+            chunks = aiter(chunks)
+            while True:
+                token = current_stats.set(stats)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    current_stats.reset(token)
+                size += len(chunk)
+                yield chunk
+            _record_body(labels, stats, size)
+    else:
+        def counted(chunks):
+            size = 0
+            chunks = iter(chunks)
+            while True:
+                token = current_stats.set(stats)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    current_stats.reset(token)
+                size += len(chunk)
+                yield chunk
+            _record_body(labels, stats, size)
+    response.streaming_content = counted(response.streaming_content)
+
+
+# PROMETHEUS TEXT FORMAT
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name, labels, value):
+    rendered = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+    return f"{name}{{{rendered}}} {_format_value(value)}" if rendered else f"{name} {_format_value(value)}"
+
+
+def render_metrics(values=None):
+    """The values (default: registry.collect()) in the Prometheus text exposition format"""
+    values = registry.collect() if values is None else values
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == "counter":
+            for (sample, labels), value in sorted(values.items()):
+                if sample == name:
+                    lines.append(_sample(name, labels, value))
+            continue
+        for (sample, labels), count in sorted(values.items()):
+            if sample != f"{name}_count":
+                continue
+            cumulative = 0
+            for bound in buckets:
+                le = _format_value(bound)
+                cumulative += values.get((f"{name}_bucket", labels + (("le", le),)), 0)
+                lines.append(_sample(f"{name}_bucket", labels + (("le", le),), cumulative))
+            lines.append(_sample(f"{name}_bucket", labels + (("le", "+Inf"),), count))
+            lines.append(_sample(f"{name}_sum", labels, values.get((f"{name}_sum", labels), 0)))
+            lines.append(_sample(f"{name}_count", labels, count))
+    return "\n".join(lines) + "\n"
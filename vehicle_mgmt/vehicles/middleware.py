@@ -0,0 +1,104 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from .audit import current_request
+from .metrics import begin_request, end_request
+from .profiling import RequestProfiler, profile_reason
+from .slow_queries import record_slow_queries
+
+
+# REMEMBER THE REQUEST BEING SERVED SO THE AUDIT LOG CAN TELL WHO MADE A CHANGE
+@sync_and_async_middleware
+def audit_user_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = current_request.set(request)
+            try:
+                return await get_response(request)
+            finally:
+                current_request.reset(token)
+    else:
+        def middleware(request):
+            token = current_request.set(request)
+            try:
+                return get_response(request)
+            finally:
+                current_request.reset(token)
+    return middleware
+
+
+# PER-URL-NAME REQUEST COUNTS, LATENCY, QUERIES, TEMPLATE TIME AND RESPONSE SIZES (SEE vehicles/metrics.py)
+@sync_and_async_middleware
+def request_metrics_middleware(get_response):
+    if not settings.VEHICLE_METRICS_ENABLED:
+        raise MiddlewareNotUsed
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            stats, token = begin_request()
+            response = await get_response(request)
+            return end_request(request, response, started, stats, token)
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            stats, token = begin_request()
+            response = get_response(request)
+            return end_request(request, response, started, stats, token)
+    return middleware
+
+
+# QUERIES OVER VEHICLE_SLOW_QUERY_MS GO TO THE SLOW-QUERY LOG WITH THE VIEW AND APP CODE THAT RAN THEM
+@sync_and_async_middleware
+def slow_query_middleware(get_response):
+    if not settings.VEHICLE_SLOW_QUERY_MS:
+        raise MiddlewareNotUsed
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            # INSTALLED ON THE THREAD THE ASYNC ORM RUNS THIS REQUEST'S QUERIES IN
+            wrappers = await sync_to_async(record_slow_queries)(request)
+            try:
+                return await get_response(request)
+            finally:
+                await sync_to_async(wrappers.close)()
+    else:
+        def middleware(request):
+            with record_slow_queries(request):
+                return get_response(request)
+    return middleware
+
+
+# ?profile=1 / "X-Profile: 1" FROM A SUPERADMIN, OR 1-IN-N SAMPLING: RUN THE VIEW UNDER cProfile (SEE vehicles/profiling.py)
+@sync_and_async_middleware
+def request_profiling_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            reason = await sync_to_async(profile_reason)(request)
+            profiler = RequestProfiler(request, reason) if reason else None
+            # cProfile RUNS ON THE EVENT LOOP, THE QUERY CAPTURE ON THE ORM'S THREAD
+            if profiler is None or not profiler.start():
+                return await get_response(request)
+            await sync_to_async(profiler.capture_queries)()
+            try:
+                response = await get_response(request)
+            finally:
+                profiler.stop()
+                await sync_to_async(profiler.release_queries)()
+            return await sync_to_async(profiler.finish)(response)
+    else:
+        def middleware(request):
+            reason = profile_reason(request)
+            profiler = RequestProfiler(request, reason) if reason else None
+            if profiler is None or not profiler.start():
+                return get_response(request)
+            profiler.capture_queries()
+            try:
+                response = get_response(request)
+            finally:
+                profiler.stop()
+                profiler.release_queries()
+            return profiler.finish(response)
+    return middleware
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:56
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_counters(apps, schema_editor):
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+    VehicleTypeCounter = apps.get_model('vehicles', 'VehicleTypeCounter')
+    counts = dict(Vehicle.objects.values_list('vehicle_type').annotate(total=Count('id')).order_by())
+    VehicleTypeCounter.objects.bulk_create([
+        VehicleTypeCounter(vehicle_type=vehicle_type, count=counts.get(vehicle_type, 0))
+        for vehicle_type in ('Two', 'Three', 'Four')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleTypeCounter',
+            fields=[
+                ('vehicle_type', models.CharField(choices=[('Two', 'Two Wheeler'), ('Three', 'Three Wheeler'), ('Four', 'Four Wheeler')], max_length=10, primary_key=True, serialize=False)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from vehicles.search import install_search_index, rebuild_search_index
+
+    install_search_index(schema_editor.connection)
+    if schema_editor.connection.vendor == 'sqlite':
+        rebuild_search_index(schema_editor.connection.alias)
+
+
+def uninstall(apps, schema_editor):
+    from vehicles.search import uninstall_search_index
+
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0002_vehicletypecounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,61 @@
+from collections import defaultdict
+
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+def backfill_normalized_numbers(apps, schema_editor):
+    from vehicles.models import normalize_vehicle_number
+
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+    vehicles = Vehicle.objects.using(schema_editor.connection.alias)
+    plates = defaultdict(list)
+    batch = []
+    for vehicle in vehicles.only('id', 'vehicle_number').iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        vehicle.vehicle_number_normalized = normalize_vehicle_number(vehicle.vehicle_number)
+        plates[vehicle.vehicle_number_normalized].append(vehicle.vehicle_number)
+        batch.append(vehicle)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            vehicles.bulk_update(batch, ['vehicle_number_normalized'])
+            batch = []
+    if batch:
+        vehicles.bulk_update(batch, ['vehicle_number_normalized'])
+
+    # THE UNIQUE CONSTRAINT BELOW WOULD FAIL ON THESE; NAME THEM SO THEY CAN BE MERGED BY HAND
+    clashes = {plate: numbers for plate, numbers in plates.items() if len(numbers) > 1 or not plate}
+    if clashes:
+        details = '; '.join(f"{plate or '(empty)'}: {', '.join(numbers)}" for plate, numbers in clashes.items())
+        raise RuntimeError(f"Vehicle numbers that normalize to the same plate must be merged first: {details}")
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    # THE TABLE REBUILDS ABOVE DROP THE FTS SYNC TRIGGERS ON SQLITE
+    from vehicles.search import install_search_index
+
+    install_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0004_vehicle_list_indexes'),
+    ]
+
+    operations = [
+        # RUNS LAST WHEN UNAPPLYING, AFTER THE FIELD IS DROPPED AGAIN
+        migrations.RunPython(migrations.RunPython.noop, reinstall_search_triggers),
+        migrations.AddField(
+            model_name='vehicle',
+            name='vehicle_number_normalized',
+            field=models.CharField(default='', editable=False, max_length=20),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_normalized_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='vehicle_number_normalized',
+            field=models.CharField(editable=False, max_length=20, unique=True),
+        ),
+        migrations.RunPython(reinstall_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0006_vehiclechange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vehicle_id', models.BigIntegerField()),
+                ('vehicle_number', models.CharField(max_length=20)),
+                ('deleted_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at', 'id'], name='vehicle_tombstone_sync_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:02
+
+from django.db import migrations
+
+
+def strip_query_params(apps, schema_editor):
+    # PROFILES STORED BEFORE THE PARAMETERS WERE DROPPED HOLD SESSION, OTP AND PASSWORD VALUES
+    RequestProfile = apps.get_model('vehicles', 'RequestProfile')
+    for profile in RequestProfile.objects.only('queries').iterator(chunk_size=200):
+        if any('params' in query for query in profile.queries):
+            profile.queries = [
+                {key: value for key, value in query.items() if key != 'params'} for query in profile.queries
+            ]
+            profile.save(update_fields=['queries'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0008_requestprofile'),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_query_params, migrations.RunPython.noop),
+    ]
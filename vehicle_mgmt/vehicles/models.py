@@ -1,8 +1,17 @@
-from django.db import models
+import re
+
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import Count
 from django.contrib.auth.models import AbstractUser
 
 # Create your models here.
 
+# CANONICAL PLATE: "MH 12-AB 1234" / "mh12ab1234" -> "MH12AB1234"
+def normalize_vehicle_number(value):
+    return re.sub(r"[\W_]+", "", value or "").upper()
+
+
 # VEHICLE MODEL
 
 class Vehicle(models.Model):
@@ -13,11 +22,163 @@ class Vehicle(models.Model):
     ]
 
     vehicle_number = models.CharField(max_length=20, unique=True)
+    # MAINTAINED BY save(); UNIQUE SO SPELLINGS OF ONE PLATE CAN'T BE STORED TWICE
+    vehicle_number_normalized = models.CharField(max_length=20, unique=True, editable=False)
     vehicle_type = models.CharField(max_length=10, choices=VEHICLE_TYPES)
     vehicle_model = models.CharField(max_length=100)
     vehicle_description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # KEYSET PAGINATION / ?ordering= (SEE vehicles/filters.py)
+            models.Index(fields=["created_at", "id"], name="vehicle_created_idx"),
+            models.Index(fields=["vehicle_type", "created_at", "id"], name="vehicle_type_created_idx"),
+            models.Index(fields=["updated_at", "id"], name="vehicle_updated_idx"),
+        ]
+
     def __str__(self):
         return f"{self.vehicle_number} - {self.vehicle_model}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # REMEMBER THE VALUES AS LOADED SO SIGNAL HANDLERS CAN SEE WHAT A SAVE CHANGED
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.vehicle_number_normalized = normalize_vehicle_number(self.vehicle_number)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "vehicle_number" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "vehicle_number_normalized"}
+        # THE ROW AND ITS post_save WORK (TYPE COUNTERS, SEARCH INDEX) COMMIT OR ROLL BACK TOGETHER
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+        }
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
+# DENORMALIZED VEHICLE COUNTS PER TYPE (KEPT CURRENT BY vehicles/signals.py)
+class VehicleTypeCounter(models.Model):
+    vehicle_type = models.CharField(max_length=10, choices=Vehicle.VEHICLE_TYPES, primary_key=True)
+    count = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.vehicle_type}: {self.count}"
+
+    @classmethod
+    def adjust(cls, vehicle_type, delta):
+        """Atomically add delta to a type's counter, creating it on first use"""
+        # ONE UPSERT, SO TWO FIRST WRITERS OF A TYPE CAN'T BOTH TRY TO INSERT IT
+        using = router.db_for_write(cls)
+        connection = connections[using]
+        table = connection.ops.quote_name(cls._meta.db_table)
+        key = connection.ops.quote_name(cls._meta.pk.column)
+        count = connection.ops.quote_name(cls._meta.get_field("count").column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({key}, {count}) VALUES (%s, %s) "
+                f"ON CONFLICT ({key}) DO UPDATE SET {count} = {table}.{count} + %s",
+                [vehicle_type, max(delta, 0), delta],
+            )
+
+    @classmethod
+    def rebuild(cls):
+        """Recount every type from the vehicle table (after bulk writes that skip signals)"""
+        counts = dict(
+            Vehicle.objects.values_list("vehicle_type").annotate(total=Count("id")).order_by()
+        )
+        # ONE UPSERT FOR ALL TYPES (INSERT ... ON CONFLICT DO UPDATE)
+        cls.objects.bulk_create(
+            [cls(vehicle_type=vehicle_type, count=counts.get(vehicle_type, 0))
+             for vehicle_type, _ in Vehicle.VEHICLE_TYPES],
+            update_conflicts=True,
+            unique_fields=["vehicle_type"],
+            update_fields=["count"],
+        )
+
+
+# APPEND-ONLY CHANGE HISTORY (WRITTEN BEHIND THE REQUEST BY vehicles/audit.py)
+class VehicleChange(models.Model):
+    ACTIONS = [
+        ("create", "Created"),
+        ("update", "Updated"),
+        ("delete", "Deleted"),
+        ("import", "Imported"),
+    ]
+
+    # NO FOREIGN KEY CONSTRAINT: HISTORY OUTLIVES THE VEHICLE
+    vehicle = models.ForeignKey(
+        Vehicle, on_delete=models.DO_NOTHING, db_constraint=False, related_name="changes"
+    )
+    vehicle_number = models.CharField(max_length=20)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    # {field: [old value, new value]}
+    changes = models.JSONField(default=dict)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    username = models.CharField(max_length=150, blank=True)
+    # WHEN THE CHANGE HAPPENED, NOT WHEN THE WRITER THREAD GOT TO IT
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["vehicle", "changed_at"], name="vehicle_change_history_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.vehicle_number} {self.action} at {self.changed_at:%Y-%m-%d %H:%M:%S}"
+
+
+# DELETION LOG FOR THE SYNC FEED (vehicles/sync.py), WRITTEN IN THE DELETING TRANSACTION
+class VehicleTombstone(models.Model):
+    # PLAIN COLUMN, NOT A FOREIGN KEY: THE VEHICLE ROW IS GONE
+    vehicle_id = models.BigIntegerField()
+    vehicle_number = models.CharField(max_length=20)
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["deleted_at", "id"], name="vehicle_tombstone_sync_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.vehicle_number} deleted at {self.deleted_at:%Y-%m-%d %H:%M:%S}"
+
+
+# A PROFILED REQUEST (vehicles/profiling.py), BROWSED AND COMPARED IN THE ADMIN
+class RequestProfile(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    # TAKEN BY 1-IN-N SAMPLING RATHER THAN ASKED FOR
+    sampled = models.BooleanField(default=False)
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_ms = models.FloatField()
+    # [{"alias", "sql", "params", "ms"}, ...]
+    queries = models.JSONField(default=list)
+    summary = models.TextField()
+    # RAW pstats DATA (marshal of Profile.stats, AS WRITTEN BY Profile.dump_stats)
+    stats = models.BinaryField()
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} at {self.created_at:%Y-%m-%d %H:%M:%S}"
@@ -0,0 +1,184 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# NEWEST VEHICLES FIRST, ID BREAKS TIES BETWEEN ROWS CREATED IN THE SAME INSTANT
+DEFAULT_ORDERING = ("-created_at", "-id")
+
+
+def page_size_from_request(request):
+    """Read ?page_size= from the request, clamped to the configured maximum"""
+    default = settings.VEHICLE_LIST_PAGE_SIZE
+    try:
+        page_size = int(request.GET.get("page_size", default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, settings.VEHICLE_LIST_MAX_PAGE_SIZE))
+
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move to its neighbours"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0])
+        return None
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) pagination over a queryset.
+
+    Instead of OFFSET, each page is fetched with a WHERE clause that starts
+    right after (or before) the row the cursor points at, so every page costs
+    the same index range scan no matter how deep into the table it is.
+    The ordering must end in a unique field (the primary key) to be stable.
+    """
+
+    def __init__(self, queryset, ordering=DEFAULT_ORDERING, page_size=None):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = page_size or settings.VEHICLE_LIST_PAGE_SIZE
+        self.fields = [name.lstrip("-") for name in self.ordering]
+        self.descending = [name.startswith("-") for name in self.ordering]
+
+    # CURSOR ENCODING
+    def encode_cursor(self, obj):
+        values = []
+        for name in self.fields:
+            value = getattr(obj, name)
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            values.append(value)
+        raw = json.dumps(values, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """Return the cursor's field values, or None if it is malformed"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            values = json.loads(raw)
+        except (binascii.Error, ValueError):
+            return None
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            return None
+        model = self.queryset.model
+        try:
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            return None
+        # THE ORDERING COLUMNS ARE NOT NULL: A None CAN'T POINT AT A ROW (AND CAN'T BE COMPARED)
+        if any(value is None for value in values):
+            return None
+        return values
+
+    # QUERY BUILDING
+    def _seek_filter(self, values, forward):
+        """
+        Build "row comes strictly after the cursor" for a mixed-direction
+        ordering: (a > x) OR (a = x AND b > y) OR ...
+
+        The leading a >= x term is redundant but lets the database turn the
+        whole predicate into a single index range scan.
+        """
+        def lookup(descending):
+            return "lt" if descending == forward else "gt"
+
+        first, first_desc = self.fields[0], self.descending[0]
+        leading = Q(**{f"{first}__{lookup(first_desc)}e": values[0]})
+
+        seek = Q()
+        for position, (name, descending) in enumerate(zip(self.fields, self.descending)):
+            equal = {self.fields[i]: values[i] for i in range(position)}
+            seek |= Q(**equal, **{f"{name}__{lookup(descending)}": values[position]})
+        return leading & seek
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith("-") else f"-{name}" for name in self.ordering]
+
+    def _page_query(self, after, before):
+        """Decode the cursors into (queryset for page_size + 1 rows, walking backwards?, came from a cursor?)"""
+        after_values = self.decode_cursor(after) if after else None
+        before_values = self.decode_cursor(before) if before and not after_values else None
+
+        if before_values is not None:
+            queryset = self.queryset.filter(self._seek_filter(before_values, forward=False))
+            return queryset.order_by(*self._reversed_ordering())[: self.page_size + 1], True, True
+
+        queryset = self.queryset
+        if after_values is not None:
+            queryset = queryset.filter(self._seek_filter(after_values, forward=True))
+        return queryset.order_by(*self.ordering)[: self.page_size + 1], False, after_values is not None
+
+    def _build_page(self, rows, backwards, from_cursor):
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if backwards:
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+        return KeysetPage(rows, self, has_next=has_more, has_previous=from_cursor)
+
+    def get_page(self, after=None, before=None):
+        """Fetch the page after the `after` cursor, before the `before` cursor, or the first page"""
+        queryset, backwards, from_cursor = self._page_query(after, before)
+        return self._build_page(list(queryset), backwards, from_cursor)
+
+    async def aget_page(self, after=None, before=None):
+        """get_page() on the async ORM"""
+        queryset, backwards, from_cursor = self._page_query(after, before)
+        return self._build_page([row async for row in queryset], backwards, from_cursor)
+
+    def page_from_request(self, request):
+        return self.get_page(after=request.GET.get("after"), before=request.GET.get("before"))
+
+    async def apage_from_request(self, request):
+        return await self.aget_page(after=request.GET.get("after"), before=request.GET.get("before"))
+
+
+class KeysetPaginationMixin:
+    """Swap ListView's page-number pagination for keyset pagination"""
+    keyset_ordering = DEFAULT_ORDERING
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def get_paginate_by(self, queryset):
+        return page_size_from_request(self.request)
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.get_keyset_ordering(), page_size)
+        page = paginator.page_from_request(self.request)
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,201 @@
+import cProfile
+import io
+import itertools
+import logging
+import marshal
+import os
+import pstats
+import time
+from contextlib import ExitStack
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from vehicle_mgmt.replicas import writes_without_pinning
+
+logger = logging.getLogger(__name__)
+
+# ON-DEMAND REQUEST PROFILING
+#
+# vehicles.middleware.request_profiling_middleware runs a request under
+# cProfile when a superadmin asks for it (?profile=1 or an "X-Profile: 1"
+# header) or, with VEHICLE_PROFILE_SAMPLE_EVERY = N, for every Nth request.
+# The SQL it ran is captured alongside, without its parameters (they carry
+# session data, OTP codes and password hashes). Each run is stored as a
+# RequestProfile (browsable and comparable in the admin) holding a
+# hot-function summary and the raw pstats data, which loads into
+# `python -m pstats` or any pstats viewer. Profiles older than
+# VEHICLE_PROFILE_KEEP_DAYS are deleted by the prune_request_profiles command.
+PROFILE_PARAM = "profile"
+PROFILE_HEADER = "X-Profile"
+SUMMARY_LINES = 40
+
+_requests = itertools.count(1)
+
+
+def is_superadmin(user):
+    return user.is_authenticated and (user.role == "superadmin" or user.is_superuser)
+
+
+def profile_reason(request):
+    """"requested", "sampled" or None (whether to profile this request)"""
+    if request.GET.get(PROFILE_PARAM) == "1" or request.headers.get(PROFILE_HEADER) == "1":
+        # ONLY FLAGGED REQUESTS LOAD THE USER
+        return "requested" if is_superadmin(request.user) else None
+    every = settings.VEHICLE_PROFILE_SAMPLE_EVERY
+    # itertools.count() IS ATOMIC UNDER THE GIL, SO EVERY WORKER THREAD SHARES ONE SEQUENCE
+    if every and next(_requests) % every == 0:
+        return "sampled"
+    return None
+
+
+class QueryCapture:
+    """execute_wrapper callable keeping the SQL (placeholders, not values) and time of every query"""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < settings.VEHICLE_PROFILE_MAX_QUERIES:
+                self.queries.append({
+                    "alias": self.alias,
+                    "sql": sql,
+                    "ms": round((time.perf_counter() - started) * 1000, 3),
+                })
+
+
+class RequestProfiler:
+    """
+    cProfile and query capture around one request.
+
+    cProfile only sees the thread it was started in: for an async request
+    that is the event loop, so ORM work handed to sync_to_async threads
+    shows up as time waiting for them (their SQL is still captured).
+    """
+
+    def __init__(self, request, reason):
+        self.request = request
+        self.reason = reason
+        self.profile = cProfile.Profile()
+        self.captures = []
+        self._wrappers = ExitStack()
+
+    def start(self):
+        """Profile this thread; False when another profiler already runs in it"""
+        try:
+            self.profile.enable()
+        except ValueError:
+            return False
+        self.started = time.perf_counter()
+        return True
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        self.profile.disable()
+
+    def capture_queries(self):
+        """Capture the SQL run on this thread's connections (the ORM's thread, for async requests)"""
+        for connection in connections.all():
+            capture = QueryCapture(connection.alias)
+            self.captures.append(capture)
+            self._wrappers.enter_context(connection.execute_wrapper(capture))
+
+    def release_queries(self):
+        self._wrappers.close()
+
+    def finish(self, response):
+        """Store the run as a RequestProfile and name it in an X-Profile-Id header"""
+        from .models import RequestProfile
+
+        queries = [query for capture in self.captures for query in capture.queries]
+        stats = dump_stats(self.profile)
+        match = self.request.resolver_match
+        user = getattr(self.request, "user", None)
+        try:
+            # THE PROFILE IS BOOKKEEPING: STORING IT MUSTN'T PIN THE SESSION TO THE PRIMARY
+            with writes_without_pinning():
+                profile = RequestProfile.objects.create(
+                    user=user if user is not None and user.is_authenticated else None,
+                    method=self.request.method,
+                    path=self.request.get_full_path()[:2000],
+                    view_name=match.view_name if match is not None else "",
+                    status_code=response.status_code,
+                    sampled=self.reason == "sampled",
+                    duration_ms=round(self.duration * 1000, 3),
+                    query_count=len(queries),
+                    query_ms=round(sum(query["ms"] for query in queries), 3),
+                    queries=queries,
+                    summary=summarize(load_stats(stats)),
+                    stats=stats,
+                )
+        except Exception:
+            # A PROFILE THAT CAN'T BE STORED MUST NOT TURN THE VIEW'S RESPONSE INTO AN ERROR
+            logger.exception("Could not store the profile of %s %s", self.request.method, self.request.path)
+            return response
+        response["X-Profile-Id"] = str(profile.pk)
+        return response
+
+
+def prune_profiles():
+    """Delete profiles older than VEHICLE_PROFILE_KEEP_DAYS; returns how many"""
+    from .models import RequestProfile
+
+    cutoff = timezone.now() - timedelta(days=settings.VEHICLE_PROFILE_KEEP_DAYS)
+    return RequestProfile.objects.filter(created_at__lt=cutoff).delete()[0]
+
+
+# PSTATS DATA: THE SAME BYTES Profile.dump_stats() WRITES TO A .prof FILE
+def dump_stats(profile):
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
+
+
+def load_stats(data):
+    """A pstats.Stats from stored pstats bytes"""
+    stats = pstats.Stats()
+    stats.stats = marshal.loads(bytes(data))
+    stats.get_top_level_stats()
+    return stats
+
+
+def summarize(stats, lines=SUMMARY_LINES):
+    """The hottest functions by cumulative time, as pstats prints them"""
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(lines)
+    return stream.getvalue()
+
+
+def _function_name(key):
+    filename, line, function = key
+    return f"{function} ({os.path.basename(filename)}:{line})" if line else function
+
+
+def diff_stats(before, after, limit=SUMMARY_LINES):
+    """
+    Per-function changes between two profiles, biggest cumulative change first.
+
+    Rows are dicts with the function, calls, own time and cumulative time
+    (seconds) of both profiles and the cumulative delta.
+    """
+    rows = []
+    for key in before.stats.keys() | after.stats.keys():
+        old = before.stats.get(key, (0, 0, 0.0, 0.0, {}))
+        new = after.stats.get(key, (0, 0, 0.0, 0.0, {}))
+        rows.append({
+            "function": _function_name(key),
+            "calls": (old[1], new[1]),
+            "own": (old[2], new[2]),
+            "cumulative": (old[3], new[3]),
+            "delta": new[3] - old[3],
+        })
+    rows.sort(key=lambda row: abs(row["delta"]), reverse=True)
+    return rows[:limit]
@@ -0,0 +1,152 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Vehicle
+
+# FTS5 INDEX OVER THE SEARCHABLE VEHICLE COLUMNS (SQLITE ONLY)
+#
+# The index is an external-content table: it stores only the token index and
+# reads column values back from vehicles_vehicle. Triggers keep it in sync on
+# every insert, update and delete, including bulk_create / QuerySet.update().
+FTS_TABLE = "vehicles_vehicle_fts"
+FTS_COLUMNS = ("vehicle_number", "vehicle_model", "vehicle_description")
+# bm25() COLUMN WEIGHTS: A PLATE HIT OUTRANKS A MODEL HIT, WHICH OUTRANKS THE DESCRIPTION
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+_columns = ", ".join(FTS_COLUMNS)
+_new_values = ", ".join(f"new.{column}" for column in FTS_COLUMNS)
+_old_values = ", ".join(f"old.{column}" for column in FTS_COLUMNS)
+
+INSTALL_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_columns},
+        content='vehicles_vehicle', content_rowid='id',
+        tokenize='unicode61', prefix='2 3'
+    )
+    """,
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON vehicles_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON vehicles_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF {_columns} ON vehicles_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END
+    """,
+]
+
+UNINSTALL_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def fts_enabled(using="default"):
+    return connections[using].vendor == "sqlite"
+
+
+def install_search_index(connection):
+    """
+    Create the FTS table and its sync triggers (idempotent).
+
+    SQLite drops a table's triggers whenever Django rebuilds the table during
+    a migration, so migrations that alter vehicles_vehicle call this again.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+
+
+def uninstall_search_index(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for statement in UNINSTALL_SQL:
+            cursor.execute(statement)
+
+
+def rebuild_search_index(using="default"):
+    """Reinstall the triggers and re-tokenize every vehicle"""
+    connection = connections[using]
+    install_search_index(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search_terms(query):
+    return re.findall(r"\w+", query or "")
+
+
+def build_match_expression(query):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    "mh12 activa" -> "mh12"* "activa"*
+    Words are quoted so FTS5 operators typed by users are treated as text.
+    """
+    return " ".join(f'"{term}"*' for term in search_terms(query))
+
+
+def search_vehicles(query, queryset=None):
+    """Filter a vehicle queryset down to rows matching the search text"""
+    if queryset is None:
+        queryset = Vehicle.objects.all()
+    expression = build_match_expression(query)
+    if not expression:
+        return queryset
+
+    if not fts_enabled(queryset.db):
+        # PORTABLE FALLBACK FOR DATABASES WITHOUT THE FTS5 TABLE
+        condition = Q()
+        for term in search_terms(query):
+            condition &= (
+                Q(vehicle_number__icontains=term)
+                | Q(vehicle_model__icontains=term)
+                | Q(vehicle_description__icontains=term)
+            )
+        return queryset.filter(condition)
+
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression])
+    )
+
+
+def rank_vehicles(query, limit=20, using=None):
+    """Best matches first, ranked by bm25 with plate hits weighted highest"""
+    expression = build_match_expression(query)
+    if not expression:
+        return []
+    # A REPLICA UNLESS THE REQUEST IS PINNED TO THE PRIMARY (vehicle_mgmt/replicas.py)
+    using = using or router.db_for_read(Vehicle)
+    if not fts_enabled(using):
+        return list(search_vehicles(query, Vehicle.objects.using(using)).order_by("vehicle_number")[:limit])
+
+    weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+    return list(Vehicle.objects.using(using).raw(
+        f"""
+        SELECT vehicles_vehicle.* FROM {FTS_TABLE}
+        JOIN vehicles_vehicle ON vehicles_vehicle.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s
+        ORDER BY bm25({FTS_TABLE}, {weights})
+        LIMIT %s
+        """,
+        [expression, limit],
+    ))
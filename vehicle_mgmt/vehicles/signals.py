@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .audit import build_change, field_changes, record_changes, vehicle_values
+from .fragments import forget_vehicle_row, invalidate_vehicle_pages
+from .models import Vehicle, VehicleTypeCounter
+from .sync import record_tombstones
+from .typeahead import vehicle_typeahead
+
+# SENT AFTER WRITES THAT BYPASS PER-INSTANCE SIGNALS (bulk_create, QuerySet.update/delete)
+# SO DENORMALIZED DATA CAN CATCH UP. Keyword arguments: action ("import", ...).
+vehicles_bulk_changed = Signal()
+
+_in_bulk_operation = ContextVar("vehicles_in_bulk_operation", default=False)
+
+
+@contextmanager
+def bulk_operation():
+    """
+    Mute the per-instance receivers below while a bulk write runs.
+
+    QuerySet.delete() still sends post_delete once per row; inside this block
+    those calls are skipped and the caller sends vehicles_bulk_changed once.
+    """
+    token = _in_bulk_operation.set(True)
+    try:
+        yield
+    finally:
+        _in_bulk_operation.reset(token)
+
+
+# KEEP THE PER-TYPE COUNTERS IN STEP WITH VEHICLE WRITES (IN THE WRITE'S TRANSACTION, SEE Vehicle.save)
+@receiver(post_save, sender=Vehicle)
+def count_saved_vehicle(sender, instance, created, **kwargs):
+    if _in_bulk_operation.get():
+        return
+    if created:
+        VehicleTypeCounter.adjust(instance.vehicle_type, 1)
+        return
+    previous_type = getattr(instance, "_loaded_values", {}).get("vehicle_type")
+    if previous_type and previous_type != instance.vehicle_type:
+        VehicleTypeCounter.adjust(previous_type, -1)
+        VehicleTypeCounter.adjust(instance.vehicle_type, 1)
+
+
+@receiver(post_delete, sender=Vehicle)
+def count_deleted_vehicle(sender, instance, **kwargs):
+    if _in_bulk_operation.get():
+        return
+    VehicleTypeCounter.adjust(instance.vehicle_type, -1)
+
+
+@receiver(vehicles_bulk_changed)
+def recount_after_bulk_change(sender, **kwargs):
+    VehicleTypeCounter.rebuild()
+
+
+# DROP CACHED LIST HTML THAT A WRITE MADE STALE. THE PAGE GENERATION MOVES ON ONCE THE WRITE
+# COMMITS: BUMPED EARLIER, A READER COULD CACHE THE UNCOMMITTED STATE UNDER THE NEW GENERATION
+@receiver(post_save, sender=Vehicle)
+def invalidate_saved_vehicle_html(sender, instance, created, **kwargs):
+    if _in_bulk_operation.get():
+        return
+    if not created:
+        forget_vehicle_row(instance.pk, getattr(instance, "_loaded_values", {}).get("updated_at"))
+    transaction.on_commit(invalidate_vehicle_pages)
+
+
+@receiver(post_delete, sender=Vehicle)
+def invalidate_deleted_vehicle_html(sender, instance, **kwargs):
+    if _in_bulk_operation.get():
+        return
+    forget_vehicle_row(instance.pk, instance.updated_at)
+    transaction.on_commit(invalidate_vehicle_pages)
+
+
+@receiver(vehicles_bulk_changed)
+def invalidate_pages_after_bulk_change(sender, **kwargs):
+    transaction.on_commit(invalidate_vehicle_pages)
+
+
+# KEEP THIS WORKER'S TYPEAHEAD INDEX CURRENT, ONCE THE WRITE COMMITS (A ROLLBACK LEAVES IT ALONE)
+@receiver(post_save, sender=Vehicle)
+def index_saved_vehicle(sender, instance, **kwargs):
+    if _in_bulk_operation.get():
+        return
+    values = (instance.pk, instance.vehicle_number, instance.vehicle_model, instance.vehicle_type)
+    transaction.on_commit(lambda: vehicle_typeahead.update(*values))
+
+
+@receiver(post_delete, sender=Vehicle)
+def unindex_deleted_vehicle(sender, instance, **kwargs):
+    if _in_bulk_operation.get():
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: vehicle_typeahead.remove(pk))
+
+
+@receiver(vehicles_bulk_changed)
+def reset_typeahead_after_bulk_change(sender, **kwargs):
+    transaction.on_commit(vehicle_typeahead.invalidate)
+
+
+# TOMBSTONES FOR THE SYNC FEED (SAME TRANSACTION AS THE DELETE)
+@receiver(post_delete, sender=Vehicle)
+def tombstone_deleted_vehicle(sender, instance, **kwargs):
+    if _in_bulk_operation.get():
+        return
+    record_tombstones([(instance.pk, instance.vehicle_number)])
+
+
+# APPEND TO THE AUDIT LOG (QUEUED UNTIL THE TRANSACTION COMMITS, WRITTEN BY vehicles/audit.py)
+@receiver(post_save, sender=Vehicle)
+def audit_saved_vehicle(sender, instance, created, **kwargs):
+    if _in_bulk_operation.get():
+        return
+    new_values = vehicle_values(instance)
+    if created:
+        changes, action = field_changes({}, new_values), "create"
+    else:
+        changes, action = field_changes(getattr(instance, "_loaded_values", {}), new_values), "update"
+        if not changes:
+            return
+    record_changes([build_change(instance.pk, instance.vehicle_number, action, changes)])
+
+
+@receiver(post_delete, sender=Vehicle)
+def audit_deleted_vehicle(sender, instance, **kwargs):
+    if _in_bulk_operation.get():
+        return
+    changes = {name: [value, None] for name, value in vehicle_values(instance).items()}
+    record_changes([build_change(instance.pk, instance.vehicle_number, "delete", changes)])
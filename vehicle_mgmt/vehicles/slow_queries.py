@@ -0,0 +1,139 @@
+import linecache
+import logging
+import os
+import sys
+import time
+from collections import deque, namedtuple
+from contextlib import ExitStack
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# SLOW-QUERY LOG
+#
+# vehicles.middleware.slow_query_middleware wraps every database connection
+# with a SlowQueryRecorder (connection.execute_wrapper) for the length of a
+# request. A query is only timed; when it took longer than
+# VEHICLE_SLOW_QUERY_MS the recorder walks the stack for the app code that
+# issued it and keeps a record in this process's ring buffer (shown in the
+# admin) and in the "vehicles.slow_queries" log (a rotating file when
+# VEHICLE_SLOW_QUERY_LOG_FILE is set).
+SLOW_QUERY_APPS = ("vehicles", "users")
+MAX_PARAMS_LENGTH = 500
+
+SlowQuery = namedtuple(
+    "SlowQuery", "recorded_at duration_ms alias view sql params call_site function code"
+)
+
+# FRAMES IN THESE FILES ARE PLUMBING, NOT CALL SITES
+_PLUMBING = {
+    os.path.join(os.path.dirname(__file__), name) for name in ("slow_queries.py", "middleware.py", "metrics.py")
+}
+
+
+class SlowQueryLog:
+    """The latest slow queries of this process, newest last (deque.append is thread-safe)"""
+
+    def __init__(self, size):
+        self._records = deque(maxlen=size)
+
+    def add(self, record):
+        self._records.append(record)
+
+    def records(self):
+        """Newest first"""
+        return list(reversed(self._records))
+
+    def clear(self):
+        self._records.clear()
+
+
+slow_query_log = SlowQueryLog(settings.VEHICLE_SLOW_QUERY_BUFFER_SIZE)
+
+
+def _app_dirs():
+    return tuple(os.path.join(apps.get_app_config(label).path, "") for label in SLOW_QUERY_APPS)
+
+
+def find_call_site(frame):
+    """(relative "path:line", function, source line) of the innermost app frame, or blanks"""
+    app_dirs = _app_dirs()
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(app_dirs) and filename not in _PLUMBING:
+            return (
+                f"{os.path.relpath(filename, settings.BASE_DIR)}:{frame.f_lineno}",
+                frame.f_code.co_name,
+                linecache.getline(filename, frame.f_lineno).strip(),
+            )
+        frame = frame.f_back
+    return "", "", ""
+
+
+def _view_name(request):
+    if request is None:
+        return ""
+    # MIDDLEWARE QUERIES RUN BEFORE THE HANDLER SETS request.resolver_match
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return request.path
+    return match.view_name
+
+
+class SlowQueryRecorder:
+    """execute_wrapper callable: times each query and records the ones over the threshold"""
+
+    def __init__(self, request, alias, threshold_ms=None):
+        self.request = request
+        self.alias = alias
+        threshold_ms = settings.VEHICLE_SLOW_QUERY_MS if threshold_ms is None else threshold_ms
+        self.threshold = threshold_ms / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if duration >= self.threshold:
+                self.record(sql, params, many, duration, sys._getframe(1))
+
+    def record(self, sql, params, many, duration, frame):
+        call_site, function, code = find_call_site(frame)
+        params = repr(params)
+        if many:
+            params = f"(executemany) {params}"
+        if len(params) > MAX_PARAMS_LENGTH:
+            params = params[:MAX_PARAMS_LENGTH] + "..."
+        record = SlowQuery(
+            recorded_at=timezone.now(),
+            duration_ms=round(duration * 1000, 2),
+            alias=self.alias,
+            view=_view_name(self.request),
+            sql=sql,
+            params=params,
+            call_site=call_site,
+            function=function,
+            code=code,
+        )
+        slow_query_log.add(record)
+        logger.warning(
+            "Slow query (%.1f ms) on %s in %s from %s: %s; params=%s",
+            record.duration_ms, self.alias, record.view, call_site or "<outside the apps>", sql, params,
+        )
+
+
+def record_slow_queries(request):
+    """An ExitStack with a SlowQueryRecorder on every connection of this thread; close() removes them"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(SlowQueryRecorder(request, connection.alias)))
+    return stack
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import Vehicle, VehicleTypeCounter
+
+
+def _type_count_aggregates():
+    aggregates = {"total": Count("id")}
+    for vehicle_type, _ in Vehicle.VEHICLE_TYPES:
+        aggregates[vehicle_type] = Count("id", filter=Q(vehicle_type=vehicle_type))
+    return aggregates
+
+
+def count_vehicles_by_type():
+    """Total and per-type vehicle counts from a single conditional-aggregation query"""
+    return Vehicle.objects.aggregate(**_type_count_aggregates())
+
+
+async def acount_vehicles_by_type():
+    return await Vehicle.objects.aaggregate(**_type_count_aggregates())
+
+
+def _counter_stats(rows):
+    stats = {vehicle_type: 0 for vehicle_type, _ in Vehicle.VEHICLE_TYPES}
+    stats.update(rows)
+    stats["total"] = sum(stats.values())
+    return stats
+
+
+def read_vehicle_counters():
+    """Same shape as count_vehicles_by_type(), read from the denormalized counters table"""
+    return _counter_stats(VehicleTypeCounter.objects.values_list("vehicle_type", "count"))
+
+
+async def aread_vehicle_counters():
+    rows = VehicleTypeCounter.objects.values_list("vehicle_type", "count")
+    return _counter_stats([row async for row in rows])
+
+
+def get_fleet_stats():
+    """
+    Fleet totals for the stats cards: {"total": n, "Two": n, "Three": n, "Four": n}.
+
+    Reads the counters table (a few rows, O(1)) when VEHICLE_STATS_USE_COUNTERS
+    is on, otherwise aggregates over the vehicle table.
+    """
+    if settings.VEHICLE_STATS_USE_COUNTERS:
+        return read_vehicle_counters()
+    return count_vehicles_by_type()
+
+
+async def aget_fleet_stats():
+    if settings.VEHICLE_STATS_USE_COUNTERS:
+        return await aread_vehicle_counters()
+    return await acount_vehicles_by_type()
+
+
+def get_fleet_stats_context():
+    """Fleet stats under the context names the vehicle list template uses"""
+    return fleet_stats_context(get_fleet_stats())
+
+
+async def aget_fleet_stats_context():
+    return fleet_stats_context(await aget_fleet_stats())
+
+
+def fleet_stats_context(stats):
+    return {
+        'fleet_stats': stats,
+        'total_vehicle_count': stats['total'],
+        'two_wheeler_count': stats['Two'],
+        'three_wheeler_count': stats['Three'],
+        'four_wheeler_count': stats['Four'],
+    }
@@ -0,0 +1,118 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Vehicle, VehicleTombstone
+from .pagination import KeysetPaginator
+
+# DELTA SYNC: "WHAT CHANGED SINCE MY LAST CURSOR"
+#
+# Two keyset streams walked in ascending order: vehicles by (updated_at, id)
+# (vehicle_updated_idx) and tombstones by (deleted_at, id). The opaque cursor
+# holds the position reached in each. Only rows older than the settle window
+# are served, so a transaction that stamped its rows a moment ago but commits
+# after this read is still picked up on the next call instead of being skipped.
+VEHICLE_SYNC_ORDERING = ("updated_at", "id")
+TOMBSTONE_SYNC_ORDERING = ("deleted_at", "id")
+
+
+class SyncCursorError(ValueError):
+    """The cursor is malformed"""
+
+
+class SyncCursorExpired(Exception):
+    """Tombstones the cursor still needs have been pruned; the client must sync from scratch"""
+
+
+def tombstone_cutoff():
+    return timezone.now() - datetime.timedelta(days=settings.VEHICLE_SYNC_TOMBSTONE_DAYS)
+
+
+def prune_tombstones():
+    """Delete tombstones past the retention period; returns how many"""
+    return VehicleTombstone.objects.filter(deleted_at__lt=tombstone_cutoff()).delete()[0]
+
+
+def record_tombstones(rows, deleted_at=None):
+    """Log deleted vehicles from (pk, vehicle_number) pairs"""
+    deleted_at = deleted_at or timezone.now()
+    VehicleTombstone.objects.bulk_create(
+        [VehicleTombstone(vehicle_id=pk, vehicle_number=number, deleted_at=deleted_at) for pk, number in rows],
+        batch_size=1000,
+    )
+
+
+def encode_sync_cursor(vehicles, deleted):
+    raw = json.dumps({"v": vehicles, "d": deleted}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_sync_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise SyncCursorError("Malformed cursor.")
+    if not isinstance(data, dict) or not isinstance(data.get("d"), str):
+        raise SyncCursorError("Malformed cursor.")
+    if not (data.get("v") is None or isinstance(data["v"], str)):
+        raise SyncCursorError("Malformed cursor.")
+    return data.get("v"), data["d"]
+
+
+class VehicleChanges:
+    """One page of the sync feed"""
+
+    def __init__(self, vehicles, deleted, cursor, has_more):
+        self.vehicles = vehicles
+        self.deleted = deleted
+        self.cursor = cursor
+        self.has_more = has_more
+
+
+def vehicle_changes(cursor=None, limit=None, fields=None):
+    """
+    Vehicles created or changed, and tombstones of vehicles deleted, after `cursor`.
+
+    Without a cursor every vehicle is sent (the initial sync) and deletions are
+    followed from now on. Each stream returns at most `limit` rows; has_more
+    means the client should ask again straight away with the new cursor.
+    """
+    horizon = timezone.now() - datetime.timedelta(seconds=settings.VEHICLE_SYNC_SETTLE_SECONDS)
+    vehicles_queryset = Vehicle.objects.filter(updated_at__lte=horizon)
+    if fields:
+        vehicles_queryset = vehicles_queryset.only(*set(fields) | set(VEHICLE_SYNC_ORDERING))
+    vehicles = KeysetPaginator(vehicles_queryset, VEHICLE_SYNC_ORDERING, limit)
+    tombstones = KeysetPaginator(
+        VehicleTombstone.objects.filter(deleted_at__lte=horizon), TOMBSTONE_SYNC_ORDERING, limit
+    )
+
+    if cursor:
+        vehicles_after, deleted_after = _decode_sync_cursor(cursor)
+        if vehicles_after is not None and vehicles.decode_cursor(vehicles_after) is None:
+            raise SyncCursorError("Malformed cursor.")
+        deleted_position = tombstones.decode_cursor(deleted_after)
+        if deleted_position is None:
+            raise SyncCursorError("Malformed cursor.")
+        if deleted_position[0] < tombstone_cutoff():
+            raise SyncCursorExpired()
+    else:
+        # INITIAL SYNC: THE CLIENT IS ABOUT TO RECEIVE EVERY LIVE VEHICLE, SO ONLY LATER DELETIONS MATTER
+        vehicles_after = None
+        deleted_after = tombstones.encode_cursor(VehicleTombstone(id=0, deleted_at=horizon))
+
+    vehicle_page = vehicles.get_page(after=vehicles_after)
+    tombstone_page = tombstones.get_page(after=deleted_after)
+    next_cursor = encode_sync_cursor(
+        vehicles.encode_cursor(vehicle_page[-1]) if len(vehicle_page) else vehicles_after,
+        tombstones.encode_cursor(tombstone_page[-1]) if len(tombstone_page) else deleted_after,
+    )
+    return VehicleChanges(
+        list(vehicle_page),
+        list(tombstone_page),
+        next_cursor,
+        vehicle_page.has_next or tombstone_page.has_next,
+    )
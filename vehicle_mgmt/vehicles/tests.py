@@ -1,9 +1,59 @@
-from django.test import TestCase, Client
+import base64
+import csv
+import json
+import logging
+import marshal
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from io import StringIO
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.utils import timezone
+from django.core.management import CommandError, call_command
+from unittest import skipUnless
+from django.db import DatabaseError, connection, connections, transaction
+from django.utils.connection import ConnectionDoesNotExist
+from django.db.models import Count
+from django.db.models.signals import post_save, pre_save
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, AsyncClient, RequestFactory, override_settings, tag
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from django.urls import reverse
-from .models import Vehicle
+from django.urls import resolve, reverse
+from asgiref.sync import iscoroutinefunction
+from .models import (
+    RequestProfile, Vehicle, VehicleChange, VehicleTombstone, VehicleTypeCounter, normalize_vehicle_number,
+)
 from .forms import VehicleForm
+from .pagination import DEFAULT_ORDERING, KeysetPaginator
+from .filters import VEHICLE_ORDERINGS
+from .exports import EXPORT_FIELDS
+from .importers import import_vehicles
+from .stats import aread_vehicle_counters, count_vehicles_by_type, get_fleet_stats, read_vehicle_counters
+from .search import rank_vehicles, search_vehicles
+from .fragments import page_generation, render_vehicle_rows, row_cache_key
+from .bulk import bulk_delete_vehicles, bulk_update_vehicles
+from .typeahead import SortedPrefixIndex, VehicleTypeahead, model_keys, vehicle_typeahead
+from .audit import AuditWriter, build_change
+from .sync import TOMBSTONE_SYNC_ORDERING, encode_sync_cursor
+from .metrics import MetricsRegistry, SharedMetricsFile, registry, render_metrics
+from .slow_queries import SlowQueryRecorder, slow_query_log
+from .profiling import diff_stats, load_stats
+from django.core.exceptions import ValidationError
 from users.models import CustomUser
+from vehicle_mgmt.query_budgets import budget_for, budgeted_routes, query_budget
+from vehicle_mgmt.runner import QUERY_BUDGET_TAG, QUERY_BUDGET_TEST, VehicleTestRunner
+from vehicle_mgmt.replicas import PrimaryReplicaRouter, SESSION_KEY, pinned_to_primary, replica_pin_middleware
 
 User = get_user_model()
 
@@ -309,6 +359,7 @@ class VehicleListFunctionalityTest(TestCase):
     
     def setUp(self):
         """Set up test data for list functionality"""
+        cache.clear()
         self.client = Client()
         self.user = CustomUser.objects.create_user(
             username='list_test_user',
@@ -337,3 +388,2486 @@ class VehicleListFunctionalityTest(TestCase):
         self.assertEqual(response.context['three_wheeler_count'], 1)
         self.assertEqual(response.context['four_wheeler_count'], 2)
         self.assertEqual(len(response.context['vehicles']), 5)  # Total vehicles
+
+@override_settings(VEHICLE_LIST_PAGE_SIZE=2)
+class VehicleKeysetPaginationTest(TestCase):
+    """Test cursor based pagination of the vehicle list"""
+
+    def setUp(self):
+        """Create five vehicles, newest last"""
+        cache.clear()
+        self.client = Client()
+        self.vehicles = [
+            Vehicle.objects.create(
+                vehicle_number=f'PAGE{i}',
+                vehicle_type='Two',
+                vehicle_model=f'Page Model {i}',
+                vehicle_description='Pagination test'
+            )
+            for i in range(5)
+        ]
+
+    def numbers(self, response):
+        return [vehicle.vehicle_number for vehicle in response.context['vehicles']]
+
+    def test_first_page_is_newest_vehicles(self):
+        """Test the first page holds the newest vehicles and links forward only"""
+        response = self.client.get(reverse('vehicle_list'))
+
+        self.assertEqual(self.numbers(response), ['PAGE4', 'PAGE3'])
+        self.assertTrue(response.context['page_obj'].has_next)
+        self.assertFalse(response.context['page_obj'].has_previous)
+        self.assertEqual(response.context['total_vehicle_count'], 5)
+
+    def test_next_and_previous_cursors_walk_the_table(self):
+        """Test following next cursors visits every vehicle once, and previous goes back"""
+        seen = []
+        url = reverse('vehicle_list')
+        response = self.client.get(url)
+        pages = [response]
+        while True:
+            seen.extend(self.numbers(response))
+            page = response.context['page_obj']
+            if not page.has_next:
+                break
+            response = self.client.get(url, {'after': page.next_cursor})
+            pages.append(response)
+
+        self.assertEqual(seen, ['PAGE4', 'PAGE3', 'PAGE2', 'PAGE1', 'PAGE0'])
+
+        second = pages[1].context['page_obj']
+        response = self.client.get(url, {'before': second.previous_cursor})
+        self.assertEqual(self.numbers(response), ['PAGE4', 'PAGE3'])
+        self.assertFalse(response.context['page_obj'].has_previous)
+
+    def test_cursor_is_stable_when_rows_are_added(self):
+        """Test a cursor keeps pointing at the same place after new vehicles arrive"""
+        response = self.client.get(reverse('vehicle_list'))
+        cursor = response.context['page_obj'].next_cursor
+
+        Vehicle.objects.create(
+            vehicle_number='PAGENEW', vehicle_type='Four',
+            vehicle_model='New', vehicle_description='Added later'
+        )
+
+        response = self.client.get(reverse('vehicle_list'), {'after': cursor})
+        self.assertEqual(self.numbers(response), ['PAGE2', 'PAGE1'])
+
+    def test_page_size_parameter_is_clamped(self):
+        """Test ?page_size= is honoured up to the configured maximum"""
+        with self.settings(VEHICLE_LIST_MAX_PAGE_SIZE=3):
+            response = self.client.get(reverse('vehicle_list'), {'page_size': 50})
+        self.assertEqual(len(response.context['vehicles']), 3)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        """Test a garbage cursor shows the first page instead of erroring"""
+        response = self.client.get(reverse('vehicle_list'), {'after': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.numbers(response), ['PAGE4', 'PAGE3'])
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        """Test well-formed cursors holding the wrong types or nulls are ignored by the list and the API"""
+        self.client.force_login(CustomUser.objects.create_user(username='cursor_user', role='user', is_active=True))
+        for values in ([1, 1], [None, 1], ['2024-01-01T00:00:00+00:00', None], [{}, []]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+            response = self.client.get(reverse('vehicle_list'), {'after': cursor})
+            self.assertEqual(response.status_code, 200, values)
+            self.assertEqual(self.numbers(response), ['PAGE4', 'PAGE3'])
+
+            response = self.client.get(reverse('vehicle_api_list'), {'after': cursor})
+            self.assertEqual(response.status_code, 200, values)
+
+    def test_paginator_orders_by_created_at_then_id(self):
+        """Test rows sharing a created_at timestamp are split across pages without loss"""
+        Vehicle.objects.update(created_at=self.vehicles[0].created_at)
+        paginator = KeysetPaginator(Vehicle.objects.all(), page_size=2)
+
+        page = paginator.get_page()
+        seen = [vehicle.pk for vehicle in page]
+        while page.has_next:
+            page = paginator.get_page(after=page.next_cursor)
+            seen.extend(vehicle.pk for vehicle in page)
+
+        self.assertEqual(seen, sorted((v.pk for v in self.vehicles), reverse=True))
+
+class FleetStatsTest(TestCase):
+    """Test the fleet stats service and the maintained per-type counters"""
+
+    def setUp(self):
+        """Create a small mixed fleet"""
+        for number, vehicle_type in [('ST1', 'Two'), ('ST2', 'Two'), ('ST3', 'Three'), ('ST4', 'Four')]:
+            Vehicle.objects.create(
+                vehicle_number=number, vehicle_type=vehicle_type,
+                vehicle_model='Stats', vehicle_description='Stats test'
+            )
+        self.expected = {'total': 4, 'Two': 2, 'Three': 1, 'Four': 1}
+
+    def test_aggregate_counts_in_one_query(self):
+        """Test the conditional aggregation returns every count from one query"""
+        with self.assertNumQueries(1):
+            stats = count_vehicles_by_type()
+        self.assertEqual(stats, self.expected)
+
+    def test_counters_match_aggregate(self):
+        """Test the counters table agrees with a real count"""
+        with self.assertNumQueries(1):
+            stats = read_vehicle_counters()
+        self.assertEqual(stats, self.expected)
+
+    def test_counters_follow_type_change_and_delete(self):
+        """Test updating a vehicle's type and deleting vehicles keeps counters current"""
+        vehicle = Vehicle.objects.get(vehicle_number='ST1')
+        vehicle.vehicle_type = 'Four'
+        vehicle.save()
+        vehicle.save()  # saving again without a change must not count twice
+        Vehicle.objects.get(vehicle_number='ST3').delete()
+
+        self.assertEqual(read_vehicle_counters(), {'total': 3, 'Two': 1, 'Three': 0, 'Four': 2})
+        self.assertEqual(read_vehicle_counters(), count_vehicles_by_type())
+
+    def test_adjust_creates_missing_counter_in_one_query(self):
+        """Test adjust() upserts, so a type's first writers never race into a duplicate insert"""
+        VehicleTypeCounter.objects.filter(vehicle_type='Three').delete()
+        with self.assertNumQueries(1):
+            VehicleTypeCounter.adjust('Three', 1)
+        VehicleTypeCounter.adjust('Three', 1)
+
+        self.assertEqual(VehicleTypeCounter.objects.get(vehicle_type='Three').count, 2)
+
+    def test_rebuild_recounts_after_bulk_write(self):
+        """Test rebuild() repairs counters after a write that skips signals"""
+        Vehicle.objects.filter(vehicle_type='Two').update(vehicle_type='Three')
+        VehicleTypeCounter.rebuild()
+
+        self.assertEqual(read_vehicle_counters(), {'total': 4, 'Two': 0, 'Three': 3, 'Four': 1})
+
+    def test_get_fleet_stats_without_counters(self):
+        """Test the stats fall back to aggregation when counters are turned off"""
+        with self.settings(VEHICLE_STATS_USE_COUNTERS=False):
+            self.assertEqual(get_fleet_stats(), self.expected)
+
+class VehicleTypeCounterTransactionTest(TransactionTestCase):
+    """Test a vehicle write and its counter change commit together"""
+
+    def test_failed_save_leaves_counters_alone(self):
+        """Test the counter change rolls back when a later post_save receiver fails"""
+        def fail(**kwargs):
+            raise RuntimeError("receiver failed")
+
+        post_save.connect(fail, sender=Vehicle)
+        try:
+            with self.assertRaises(RuntimeError):
+                Vehicle.objects.create(
+                    vehicle_number='TX1', vehicle_type='Two', vehicle_model='Stats', vehicle_description='Rolled back'
+                )
+        finally:
+            post_save.disconnect(fail, sender=Vehicle)
+
+        self.assertFalse(Vehicle.objects.exists())
+        self.assertFalse(VehicleTypeCounter.objects.filter(count__gt=0).exists())
+
+class VehicleSearchTest(TestCase):
+    """Test full-text vehicle search and its index triggers"""
+
+    def setUp(self):
+        """Create vehicles and a logged in user"""
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(
+            username='search_user',
+            email='search@test.com',
+            password='testpass123',
+            role='user',
+            is_active=True
+        )
+        self.client.force_login(self.user)
+        self.activa = Vehicle.objects.create(
+            vehicle_number='MH12AB1234', vehicle_type='Two',
+            vehicle_model='Honda Activa', vehicle_description='Blue scooter used for deliveries'
+        )
+        self.nexon = Vehicle.objects.create(
+            vehicle_number='KA01XY9999', vehicle_type='Four',
+            vehicle_model='Tata Nexon', vehicle_description='Company car, blue'
+        )
+
+    def numbers(self, queryset):
+        return sorted(vehicle.vehicle_number for vehicle in queryset)
+
+    def test_prefix_matching_on_number_and_model(self):
+        """Test words match as prefixes of plate numbers and models"""
+        self.assertEqual(self.numbers(search_vehicles('mh12')), ['MH12AB1234'])
+        self.assertEqual(self.numbers(search_vehicles('nex')), ['KA01XY9999'])
+        self.assertEqual(self.numbers(search_vehicles('blue')), ['KA01XY9999', 'MH12AB1234'])
+        self.assertEqual(self.numbers(search_vehicles('blue scoot')), ['MH12AB1234'])
+
+    def test_index_follows_update_and_delete(self):
+        """Test the index is kept in sync when vehicles change or are removed"""
+        self.activa.vehicle_model = 'Suzuki Access'
+        self.activa.save()
+        self.assertEqual(self.numbers(search_vehicles('activa')), [])
+        self.assertEqual(self.numbers(search_vehicles('suzuki')), ['MH12AB1234'])
+
+        self.activa.delete()
+        self.assertEqual(self.numbers(search_vehicles('suzuki')), [])
+
+    def test_operators_in_user_input_are_treated_as_text(self):
+        """Test FTS syntax characters in the query do not raise errors"""
+        self.assertEqual(self.numbers(search_vehicles('"nexon* (')), ['KA01XY9999'])
+
+    def test_ranking_prefers_plate_matches(self):
+        """Test a hit on the plate number ranks above a hit in the description"""
+        Vehicle.objects.create(
+            vehicle_number='KA01ZZ0001', vehicle_type='Three',
+            vehicle_model='Bajaj RE', vehicle_description='Replaces MH12 fleet autos'
+        )
+        ranked = rank_vehicles('mh12')
+        self.assertEqual(ranked[0].vehicle_number, 'MH12AB1234')
+        self.assertEqual(len(ranked), 2)
+
+    def test_list_view_search_parameter(self):
+        """Test ?q= filters the paginated list on the server"""
+        response = self.client.get(reverse('vehicle_list'), {'q': 'tata'})
+        self.assertEqual([v.vehicle_number for v in response.context['vehicles']], ['KA01XY9999'])
+
+    def test_search_endpoint_returns_ranked_json(self):
+        """Test the search endpoint returns JSON results"""
+        response = self.client.get(reverse('vehicle_search'), {'q': 'honda'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['vehicle_number'] for r in results], ['MH12AB1234'])
+
+    def test_rebuild_command(self):
+        """Test the management command rebuilds the index"""
+        call_command('rebuild_vehicle_search_index', stdout=StringIO())
+        self.assertEqual(self.numbers(search_vehicles('activa')), ['MH12AB1234'])
+
+class VehicleFilterOrderingTest(TestCase):
+    """Test server-side ?type= and ?ordering= on the vehicle list and admin"""
+
+    def setUp(self):
+        """Create one vehicle of each type and a superadmin"""
+        self.client = Client()
+        self.superadmin = CustomUser.objects.create_user(
+            username='filter_superadmin',
+            email='filter@test.com',
+            password='testpass123',
+            role='superadmin',
+            is_active=True,
+            is_staff=True,
+            is_superuser=True
+        )
+        self.client.force_login(self.superadmin)
+        for number, vehicle_type in [('B2', 'Two'), ('C3', 'Three'), ('A4', 'Four')]:
+            Vehicle.objects.create(
+                vehicle_number=number, vehicle_type=vehicle_type,
+                vehicle_model='Filter', vehicle_description='Filter test'
+            )
+
+    def numbers(self, response):
+        return [vehicle.vehicle_number for vehicle in response.context['vehicles']]
+
+    def test_type_parameter_filters_list(self):
+        """Test ?type= only returns vehicles of that type"""
+        response = self.client.get(reverse('vehicle_list'), {'type': 'Three'})
+        self.assertEqual(self.numbers(response), ['C3'])
+
+    def test_unknown_type_is_ignored(self):
+        """Test an unknown ?type= value shows every vehicle"""
+        response = self.client.get(reverse('vehicle_list'), {'type': 'Six'})
+        self.assertEqual(len(self.numbers(response)), 3)
+
+    def test_ordering_parameter(self):
+        """Test ?ordering= sorts on the server"""
+        response = self.client.get(reverse('vehicle_list'), {'ordering': 'vehicle_number'})
+        self.assertEqual(self.numbers(response), ['A4', 'B2', 'C3'])
+
+        response = self.client.get(reverse('vehicle_list'), {'ordering': 'vehicle_type'})
+        self.assertEqual(self.numbers(response), ['A4', 'C3', 'B2'])
+
+        response = self.client.get(reverse('vehicle_list'), {'ordering': 'created_at'})
+        self.assertEqual(self.numbers(response), ['B2', 'C3', 'A4'])
+
+    @override_settings(VEHICLE_LIST_PAGE_SIZE=1)
+    def test_cursor_pagination_with_ordering_and_type(self):
+        """Test cursors follow the selected ordering across pages"""
+        url = reverse('vehicle_list')
+        response = self.client.get(url, {'ordering': '-vehicle_number'})
+        seen = self.numbers(response)
+        while response.context['page_obj'].has_next:
+            response = self.client.get(url, {
+                'ordering': '-vehicle_number',
+                'after': response.context['page_obj'].next_cursor,
+            })
+            seen.extend(self.numbers(response))
+        self.assertEqual(seen, ['C3', 'B2', 'A4'])
+
+    def test_admin_accepts_type_and_ordering(self):
+        """Test the admin changelist understands ?type= and ?ordering="""
+        url = reverse('admin:vehicles_vehicle_changelist')
+        response = self.client.get(url, {'type': 'Two', 'ordering': 'vehicle_number'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [v.vehicle_number for v in response.context['cl'].result_list], ['B2']
+        )
+
+        response = self.client.get(url, {'ordering': 'vehicle_number'})
+        self.assertEqual(
+            [v.vehicle_number for v in response.context['cl'].result_list], ['A4', 'B2', 'C3']
+        )
+
+    @skipUnless(connection.vendor == 'sqlite', 'query plan wording is SQLite specific')
+    def test_query_plans_use_indexes(self):
+        """Test filtered and ordered list queries are index range scans without a sort"""
+        cases = [
+            (Vehicle.objects.all(), DEFAULT_ORDERING, 'vehicle_created_idx'),
+            (Vehicle.objects.filter(vehicle_type='Two'), DEFAULT_ORDERING, 'vehicle_type_created_idx'),
+            (Vehicle.objects.all(), VEHICLE_ORDERINGS['-updated_at'], 'vehicle_updated_idx'),
+            (Vehicle.objects.all(), VEHICLE_ORDERINGS['vehicle_type'], 'vehicle_type_created_idx'),
+        ]
+        for queryset, ordering, index in cases:
+            paginator = KeysetPaginator(queryset, ordering=ordering, page_size=25)
+            cursor = paginator.encode_cursor(queryset.order_by(*ordering).first())
+            seek = queryset.filter(paginator._seek_filter(paginator.decode_cursor(cursor), forward=True))
+            for query in (queryset, seek):
+                plan = query.order_by(*ordering)[:26].explain()
+                with self.subTest(ordering=ordering, plan=plan):
+                    self.assertIn(index, plan)
+                    self.assertNotIn('TEMP B-TREE', plan)
+
+class VehicleExportTest(TestCase):
+    """Test the streaming CSV / NDJSON export"""
+
+    def setUp(self):
+        """Create users and vehicles to export"""
+        self.client = Client()
+        self.admin = CustomUser.objects.create_user(
+            username='export_admin',
+            email='exportadmin@test.com',
+            password='testpass123',
+            role='admin',
+            is_active=True,
+            is_staff=True,
+            is_superuser=True
+        )
+        self.user = CustomUser.objects.create_user(
+            username='export_user',
+            email='exportuser@test.com',
+            password='testpass123',
+            role='user',
+            is_active=True
+        )
+        Vehicle.objects.create(vehicle_number='EXP1', vehicle_type='Two', vehicle_model='Export, One', vehicle_description='First "quoted"')
+        Vehicle.objects.create(vehicle_number='EXP2', vehicle_type='Four', vehicle_model='Export Two', vehicle_description='Second')
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        """Test the CSV export streams a header and every vehicle"""
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('vehicle_export'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(self.content(response))))
+        self.assertEqual(rows[0], list(EXPORT_FIELDS))
+        self.assertEqual([row[1] for row in rows[1:]], ['EXP1', 'EXP2'])
+        self.assertEqual(rows[1][3], 'Export, One')
+        self.assertEqual(rows[1][4], 'First "quoted"')
+
+    def test_ndjson_export_respects_filters(self):
+        """Test the NDJSON export writes one object per line for the filtered vehicles"""
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('vehicle_export'), {'format': 'ndjson', 'type': 'Four'})
+
+        lines = self.content(response).splitlines()
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record['vehicle_number'], 'EXP2')
+        self.assertEqual(set(record), set(EXPORT_FIELDS))
+
+    def test_export_requires_admin_role(self):
+        """Test plain users are redirected away from the export"""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('vehicle_export'))
+        self.assertRedirects(response, reverse('vehicle_list'))
+
+    def test_unknown_format_is_rejected(self):
+        """Test an unsupported format returns 400"""
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('vehicle_export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_export_action(self):
+        """Test the admin action streams the selected vehicles"""
+        self.client.force_login(self.admin)
+        selected = Vehicle.objects.get(vehicle_number='EXP1')
+        response = self.client.post(reverse('admin:vehicles_vehicle_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [selected.pk],
+        })
+        rows = list(csv.reader(StringIO(self.content(response))))
+        self.assertEqual([row[1] for row in rows[1:]], ['EXP1'])
+
+class VehicleImportTest(TestCase):
+    """Test bulk vehicle import from CSV and NDJSON"""
+
+    def setUp(self):
+        """Create a superadmin and one existing vehicle"""
+        self.client = Client()
+        self.superadmin = CustomUser.objects.create_user(
+            username='import_superadmin',
+            email='import@test.com',
+            password='testpass123',
+            role='superadmin',
+            is_active=True
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='import_admin',
+            email='importadmin@test.com',
+            password='testpass123',
+            role='admin',
+            is_active=True
+        )
+        Vehicle.objects.create(
+            vehicle_number='IMP1', vehicle_type='Two',
+            vehicle_model='Old Model', vehicle_description='Before import'
+        )
+
+    def test_csv_import_upserts_and_reports_errors(self):
+        """Test new plates are inserted, known plates updated and bad rows reported"""
+        data = (
+            'vehicle_number,vehicle_type,vehicle_model,vehicle_description\n'
+            'IMP1,Four,New Model,After import\n'
+            'IMP2,Three,Auto,Fresh\n'
+            'IMP3,Nine,Broken,Bad type\n'
+            ',Two,No Number,Missing plate\n'
+        )
+        report = import_vehicles(StringIO(data), 'csv', batch_size=1)
+
+        self.assertEqual(report.imported, 2)
+        self.assertEqual(report.error_count, 2)
+        self.assertEqual([error['line'] for error in report.errors], [4, 5])
+        self.assertIn('vehicle_type', report.errors[0]['errors'])
+        self.assertIn('vehicle_number', report.errors[1]['errors'])
+
+        updated = Vehicle.objects.get(vehicle_number='IMP1')
+        self.assertEqual(updated.vehicle_type, 'Four')
+        self.assertEqual(updated.vehicle_model, 'New Model')
+        self.assertEqual(Vehicle.objects.count(), 2)
+        self.assertEqual(read_vehicle_counters(), {'total': 2, 'Two': 0, 'Three': 1, 'Four': 1})
+        self.assertEqual([v.vehicle_number for v in search_vehicles('auto')], ['IMP2'])
+
+    def test_ndjson_import_with_duplicate_plates_in_batch(self):
+        """Test NDJSON lines are imported and a repeated plate keeps its last row"""
+        data = '\n'.join([
+            json.dumps({'vehicle_number': 'ND1', 'vehicle_type': 'Two', 'vehicle_model': 'A', 'vehicle_description': 'x'}),
+            json.dumps({'vehicle_number': 'ND1', 'vehicle_type': 'Four', 'vehicle_model': 'B', 'vehicle_description': 'y'}),
+            'not json',
+        ])
+        report = import_vehicles(StringIO(data), 'ndjson')
+
+        self.assertEqual(report.imported, 1)
+        self.assertEqual(report.errors[0]['line'], 3)
+        self.assertEqual(Vehicle.objects.get(vehicle_number='ND1').vehicle_model, 'B')
+
+    def test_import_batches_writes(self):
+        """Test a whole batch is written with a single upsert query"""
+        data = 'vehicle_number,vehicle_type,vehicle_model,vehicle_description\n' + ''.join(
+            f'BATCH{i},Two,Model,Desc\n' for i in range(50)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            import_vehicles(StringIO(data), 'csv', batch_size=100)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "vehicles_vehicle"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Vehicle.objects.filter(vehicle_number__startswith='BATCH').count(), 50)
+
+    def test_batch_is_stamped_inside_its_transaction(self):
+        """Test a batch's timestamps are taken after its transaction began, not while it waited for the lock"""
+        began = []
+
+        def record_savepoint(execute, sql, params, many, context):
+            if sql.startswith('SAVEPOINT') and not began:
+                began.append(timezone.now())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record_savepoint), self.captureOnCommitCallbacks(execute=True):
+            import_vehicles(StringIO(
+                'vehicle_number,vehicle_type,vehicle_model,vehicle_description\nSTAMP1,Two,Model,Desc\n'
+            ), 'csv')
+        vehicle = Vehicle.objects.get(vehicle_number='STAMP1')
+        self.assertGreaterEqual(vehicle.updated_at, began[0])
+        self.assertGreaterEqual(VehicleChange.objects.get(vehicle_id=vehicle.pk).changed_at, began[0])
+
+    def test_upload_view_superadmin_only(self):
+        """Test the upload page imports for superadmins and redirects admins"""
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('vehicle_import'))
+        self.assertRedirects(response, reverse('vehicle_list'))
+
+        self.client.force_login(self.superadmin)
+        upload = SimpleUploadedFile(
+            'fleet.csv',
+            b'vehicle_number,vehicle_type,vehicle_model,vehicle_description\nUP1,Two,Upload,From view\nUP2,Bad,Upload,Oops\n',
+            content_type='text/csv',
+        )
+        response = self.client.post(reverse('vehicle_import'), {'file': upload, 'file_format': 'auto'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report'].imported, 1)
+        self.assertEqual(response.context['report'].error_count, 1)
+        self.assertTrue(Vehicle.objects.filter(vehicle_number='UP1').exists())
+
+    def test_non_utf8_file_is_rejected(self):
+        """Test a Latin-1 upload is a form error in the view and a CommandError in the command"""
+        content = 'vehicle_number,vehicle_type,vehicle_model,vehicle_description\nLAT1,Two,Citroën,Accent\n'.encode('latin-1')
+        self.client.force_login(self.superadmin)
+        upload = SimpleUploadedFile('fleet.csv', content, content_type='text/csv')
+        response = self.client.post(reverse('vehicle_import'), {'file': upload, 'file_format': 'auto'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("isn't UTF-8", response.context['form'].errors['file'][0])
+        self.assertFalse(Vehicle.objects.filter(vehicle_number='LAT1').exists())
+
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        with self.assertRaisesMessage(CommandError, "isn't UTF-8"):
+            call_command('import_vehicles', handle.name, stdout=StringIO(), stderr=StringIO())
+
+    def test_import_command(self):
+        """Test the management command imports a file from disk"""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('vehicle_number,vehicle_type,vehicle_model,vehicle_description\nCMD1,Three,Cmd,From command\n')
+        self.addCleanup(os.remove, handle.name)
+
+        out = StringIO()
+        call_command('import_vehicles', handle.name, stdout=out, stderr=StringIO())
+        self.assertIn('Imported 1 vehicles', out.getvalue())
+        self.assertTrue(Vehicle.objects.filter(vehicle_number='CMD1').exists())
+
+class VehicleApiTest(TestCase):
+    """Test the JSON API, its role checks and conditional GET support"""
+
+    def setUp(self):
+        """Create users for every role and two vehicles"""
+        self.client = Client()
+        self.superadmin = CustomUser.objects.create_user(
+            username='api_superadmin', email='apisuper@test.com',
+            password='testpass123', role='superadmin', is_active=True
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='api_admin', email='apiadmin@test.com',
+            password='testpass123', role='admin', is_active=True
+        )
+        self.user = CustomUser.objects.create_user(
+            username='api_user', email='apiuser@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        self.vehicle = Vehicle.objects.create(
+            vehicle_number='API1', vehicle_type='Two',
+            vehicle_model='Api Model', vehicle_description='Api test'
+        )
+        Vehicle.objects.create(
+            vehicle_number='API2', vehicle_type='Four',
+            vehicle_model='Api Car', vehicle_description='Api test'
+        )
+        self.detail_url = reverse('vehicle_api_detail', kwargs={'pk': self.vehicle.pk})
+
+    def test_requires_authentication(self):
+        """Test anonymous requests get a JSON 401"""
+        response = self.client.get(reverse('vehicle_api_list'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_list_with_sparse_fields_and_cursor(self):
+        """Test the list honours ?fields= and pages with cursors"""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('vehicle_api_list'), {'fields': 'vehicle_number', 'page_size': 1})
+
+        data = response.json()
+        self.assertEqual(data['results'], [{'id': Vehicle.objects.get(vehicle_number='API2').pk, 'vehicle_number': 'API2'}])
+        self.assertIsNotNone(data['next'])
+
+        response = self.client.get(reverse('vehicle_api_list'), {
+            'fields': 'vehicle_number', 'page_size': 1, 'after': data['next']
+        })
+        self.assertEqual([r['vehicle_number'] for r in response.json()['results']], ['API1'])
+
+    def test_detail_conditional_get(self):
+        """Test an unchanged vehicle answers 304 to If-None-Match and If-Modified-Since"""
+        self.client.force_login(self.user)
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(3):  # session, user, then the single vehicle lookup
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        self.vehicle.vehicle_model = 'Changed'
+        self.vehicle.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['vehicle_model'], 'Changed')
+
+    def test_list_conditional_get(self):
+        """Test an unchanged page answers 304, and a change on the page invalidates it"""
+        self.client.force_login(self.user)
+        etag = self.client.get(reverse('vehicle_api_list'))['ETag']
+
+        response = self.client.get(reverse('vehicle_api_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Vehicle.objects.get(vehicle_number='API2').delete()
+        response = self.client.get(reverse('vehicle_api_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_superadmin_only(self):
+        """Test only superadmins can create vehicles through the API"""
+        payload = json.dumps({
+            'vehicle_number': 'API3', 'vehicle_type': 'Three',
+            'vehicle_model': 'Api Auto', 'vehicle_description': 'Created over the API'
+        })
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('vehicle_api_list'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.superadmin)
+        response = self.client.post(reverse('vehicle_api_list'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['vehicle_number'], 'API3')
+        self.assertIn('/vehicles/api/', response['Location'])
+
+        response = self.client.post(reverse('vehicle_api_list'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('vehicle_number', response.json()['errors'])
+
+    def test_patch_with_if_match(self):
+        """Test admins can patch, and a stale If-Match is refused with 412"""
+        self.client.force_login(self.admin)
+        etag = self.client.get(self.detail_url)['ETag']
+
+        response = self.client.patch(
+            self.detail_url, json.dumps({'vehicle_model': 'Patched'}),
+            content_type='application/json', HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['vehicle_model'], 'Patched')
+        self.assertEqual(response.json()['vehicle_type'], 'Two')
+
+        response = self.client.patch(
+            self.detail_url, json.dumps({'vehicle_model': 'Lost update'}),
+            content_type='application/json', HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 412)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.vehicle_model, 'Patched')
+
+    def test_sparse_etag_validates_writes(self):
+        """Test an ETag from a ?fields= GET is accepted by If-Match until the vehicle changes"""
+        self.client.force_login(self.superadmin)
+        etag = self.client.get(self.detail_url, {'fields': 'vehicle_model'})['ETag']
+        self.assertNotEqual(etag, self.client.get(self.detail_url)['ETag'])
+
+        response = self.client.patch(
+            self.detail_url, json.dumps({'vehicle_model': 'Patched'}),
+            content_type='application/json', HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.delete(self.detail_url, HTTP_IF_MATCH=etag).status_code, 412)
+        self.assertEqual(self.client.delete(self.detail_url, HTTP_IF_MATCH=f"W/{response['ETag']}").status_code, 412)
+        self.assertEqual(self.client.delete(self.detail_url, HTTP_IF_MATCH=response['ETag']).status_code, 204)
+
+    def test_delete_roles(self):
+        """Test users cannot delete and superadmins can"""
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.delete(self.detail_url).status_code, 403)
+
+        self.client.force_login(self.superadmin)
+        self.assertEqual(self.client.delete(self.detail_url).status_code, 204)
+        self.assertFalse(Vehicle.objects.filter(pk=self.vehicle.pk).exists())
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+
+
+class VehicleListCacheTest(TestCase):
+    """Test the rendered-row and page caches behind the vehicle list"""
+
+    def setUp(self):
+        """Start from an empty cache with a user and two vehicles"""
+        cache.clear()
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(
+            username='cache_user', email='cacheuser@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        self.client.force_login(self.user)
+        self.vehicle = Vehicle.objects.create(
+            vehicle_number='CACHE1', vehicle_type='Two',
+            vehicle_model='Cached Scooter', vehicle_description='Cache test'
+        )
+        Vehicle.objects.create(
+            vehicle_number='CACHE2', vehicle_type='Three',
+            vehicle_model='Cached Auto', vehicle_description='Cache test'
+        )
+
+    def test_rows_are_cached_per_version(self):
+        """Test a row fragment is stored under (pk, updated_at) and an edit drops it"""
+        html = render_vehicle_rows(Vehicle.objects.all())
+        self.assertIn('CACHE1', html)
+        key = row_cache_key(self.vehicle.pk, self.vehicle.updated_at)
+        self.assertIn('Cached Scooter', cache.get(key))
+
+        vehicle = Vehicle.objects.get(pk=self.vehicle.pk)
+        vehicle.vehicle_model = 'Edited Scooter'
+        vehicle.save()
+        self.assertIsNone(cache.get(key))
+        self.assertIn('Edited Scooter', render_vehicle_rows([vehicle]))
+
+    def test_warm_page_skips_the_page_query(self):
+        """Test a repeated list request is served from the page cache"""
+        url = reverse('vehicle_list')
+        with CaptureQueriesContext(connection) as cold:
+            first = self.client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            second = self.client.get(url)
+
+        self.assertEqual(len(warm), len(cold) - 1)
+        self.assertFalse(any('FROM "vehicles_vehicle"' in q['sql'] for q in warm.captured_queries))
+        self.assertEqual(first.context['rows_html'], second.context['rows_html'])
+        self.assertContains(second, 'CACHE1')
+
+    def test_writes_invalidate_the_page(self):
+        """Test edits, deletes and creates show up on the next list request"""
+        url = reverse('vehicle_list')
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicle.vehicle_model = 'Renamed Scooter'
+            self.vehicle.save()
+        self.assertContains(self.client.get(url), 'Renamed Scooter')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicle.delete()
+        self.assertNotContains(self.client.get(url), 'CACHE1')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Vehicle.objects.create(
+                vehicle_number='CACHE3', vehicle_type='Four',
+                vehicle_model='Cached Car', vehicle_description='Cache test'
+            )
+        self.assertContains(self.client.get(url), 'CACHE3')
+
+    def test_page_generation_moves_on_commit(self):
+        """Test a write retires the cached pages only once it commits"""
+        before = page_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicle.save()
+            self.assertEqual(page_generation(), before)
+        self.assertNotEqual(page_generation(), before)
+
+    def test_bulk_import_invalidates_the_page(self):
+        """Test a bulk import, which skips per-row signals, still refreshes the list"""
+        url = reverse('vehicle_list')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            import_vehicles(StringIO(
+                'vehicle_number,vehicle_type,vehicle_model,vehicle_description\n'
+                'CACHE9,Four,Imported Car,Imported\n'
+            ), 'csv')
+        self.assertContains(self.client.get(url), 'CACHE9')
+
+    def test_filters_have_their_own_pages(self):
+        """Test pages for different filters do not share a cache entry"""
+        url = reverse('vehicle_list')
+        self.client.get(url)
+        response = self.client.get(url, {'type': 'Three'})
+        self.assertContains(response, 'CACHE2')
+        self.assertNotContains(response, 'CACHE1')
+
+
+@override_settings(ROOT_URLCONF='vehicle_mgmt.async_urls')
+class AsyncVehicleViewsTest(TestCase):
+    """Test the async vehicle views served when VEHICLE_ASYNC_VIEWS is on"""
+
+    def setUp(self):
+        """Create a user per role and a vehicle"""
+        cache.clear()
+        self.client = AsyncClient()
+        self.superadmin = CustomUser.objects.create_user(
+            username='async_superadmin', email='asyncsuper@test.com',
+            password='testpass123', role='superadmin', is_active=True
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='async_admin', email='asyncadmin@test.com',
+            password='testpass123', role='admin', is_active=True
+        )
+        self.user = CustomUser.objects.create_user(
+            username='async_user', email='asyncuser@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        self.vehicle = Vehicle.objects.create(
+            vehicle_number='ASYNC1', vehicle_type='Two',
+            vehicle_model='Async Scooter', vehicle_description='Async test'
+        )
+
+    async def test_routes_use_async_views(self):
+        """Test the async urlconf routes the vehicle pages to coroutine views"""
+        for name, args in [('vehicle_list', []), ('vehicle_detail', [self.vehicle.pk]), ('vehicle_add', [])]:
+            self.assertTrue(iscoroutinefunction(resolve(reverse(name, args=args)).func))
+
+    async def test_anonymous_redirected_to_login(self):
+        """Test anonymous users are sent to the login page"""
+        response = await self.client.get(reverse('vehicle_list'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+    async def test_list_and_detail(self):
+        """Test the list and detail pages render from the async ORM"""
+        await self.client.aforce_login(self.user)
+        response = await self.client.get(reverse('vehicle_list'))
+        self.assertContains(response, 'ASYNC1')
+        self.assertEqual(response.context['total_vehicle_count'], 1)
+
+        response = await self.client.get(reverse('vehicle_detail', kwargs={'pk': self.vehicle.pk}))
+        self.assertContains(response, 'Async Scooter')
+
+        response = await self.client.get(reverse('vehicle_detail', kwargs={'pk': 999999}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_role_checks(self):
+        """Test users without the role are redirected to the list with a message"""
+        await self.client.aforce_login(self.user)
+        response = await self.client.get(reverse('vehicle_add'))
+        self.assertRedirects(response, reverse('vehicle_list'), fetch_redirect_response=False)
+
+        await self.client.aforce_login(self.admin)
+        response = await self.client.post(reverse('vehicle_delete', kwargs={'pk': self.vehicle.pk}))
+        self.assertRedirects(response, reverse('vehicle_list'), fetch_redirect_response=False)
+        self.assertTrue(await Vehicle.objects.filter(pk=self.vehicle.pk).aexists())
+
+    async def test_create_edit_delete(self):
+        """Test the write paths, including the async uniqueness check"""
+        await self.client.aforce_login(self.superadmin)
+        data = {
+            'vehicle_number': 'ASYNC2', 'vehicle_type': 'Four',
+            'vehicle_model': 'Async Car', 'vehicle_description': 'Created async'
+        }
+        response = await self.client.post(reverse('vehicle_add'), data)
+        self.assertRedirects(response, reverse('vehicle_list'), fetch_redirect_response=False)
+        created = await Vehicle.objects.aget(vehicle_number='ASYNC2')
+
+        response = await self.client.post(reverse('vehicle_add'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('vehicle_number', response.context['form'].errors)
+        self.assertEqual(await Vehicle.objects.acount(), 2)
+
+        response = await self.client.post(
+            reverse('vehicle_edit', kwargs={'pk': created.pk}), {**data, 'vehicle_model': 'Edited Car'}
+        )
+        self.assertRedirects(response, reverse('vehicle_list'), fetch_redirect_response=False)
+        self.assertEqual((await Vehicle.objects.aget(pk=created.pk)).vehicle_model, 'Edited Car')
+
+        response = await self.client.post(reverse('vehicle_delete', kwargs={'pk': created.pk}))
+        self.assertRedirects(response, reverse('vehicle_list'), fetch_redirect_response=False)
+        self.assertFalse(await Vehicle.objects.filter(pk=created.pk).aexists())
+        self.assertEqual((await aread_vehicle_counters())['total'], 1)
+
+
+class VehicleBulkOperationsTest(TestCase):
+    """Test bulk edit and bulk delete from the list page and the admin"""
+
+    def setUp(self):
+        """Create users and a mixed fleet"""
+        cache.clear()
+        self.client = Client()
+        self.superadmin = CustomUser.objects.create_user(
+            username='bulk_superadmin', email='bulksuper@test.com',
+            password='testpass123', role='superadmin', is_active=True,
+            is_staff=True, is_superuser=True
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='bulk_admin', email='bulkadmin@test.com',
+            password='testpass123', role='admin', is_active=True
+        )
+        self.user = CustomUser.objects.create_user(
+            username='bulk_user', email='bulkuser@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        for number, vehicle_type in [('BLK1', 'Two'), ('BLK2', 'Two'), ('BLK3', 'Three'), ('BLK4', 'Four')]:
+            Vehicle.objects.create(
+                vehicle_number=number, vehicle_type=vehicle_type,
+                vehicle_model='Bulk Model', vehicle_description='Bulk test'
+            )
+
+    def bulk_sql(self, context, statement):
+        return [q['sql'] for q in context.captured_queries if q['sql'].startswith(statement)]
+
+    def test_bulk_update_is_one_statement(self):
+        """Test a bulk edit is a single UPDATE that bumps updated_at and fixes the counters"""
+        before = dict(Vehicle.objects.values_list('vehicle_number', 'updated_at'))
+        with CaptureQueriesContext(connection) as queries:
+            count = bulk_update_vehicles(Vehicle.objects.filter(vehicle_type='Two'), {'vehicle_type': 'Four'})
+
+        self.assertEqual(count, 2)
+        self.assertEqual(len(self.bulk_sql(queries, 'UPDATE "vehicles_vehicle"')), 1)
+        for vehicle in Vehicle.objects.filter(vehicle_number__in=['BLK1', 'BLK2']):
+            self.assertEqual(vehicle.vehicle_type, 'Four')
+            self.assertGreater(vehicle.updated_at, before[vehicle.vehicle_number])
+        self.assertEqual(Vehicle.objects.get(vehicle_number='BLK3').updated_at, before['BLK3'])
+        self.assertEqual(read_vehicle_counters(), count_vehicles_by_type())
+
+    def test_bulk_update_validates_changes(self):
+        """Test invalid values and non-editable fields are rejected before any write"""
+        with self.assertRaises(ValidationError):
+            bulk_update_vehicles(Vehicle.objects.all(), {'vehicle_type': 'Six'})
+        with self.assertRaises(ValidationError):
+            bulk_update_vehicles(Vehicle.objects.all(), {'vehicle_number': 'SAME'})
+        self.assertEqual(Vehicle.objects.filter(vehicle_type='Two').count(), 2)
+
+    def test_bulk_delete_is_one_statement(self):
+        """Test a bulk delete issues one DELETE and keeps the counters right"""
+        with CaptureQueriesContext(connection) as queries:
+            count = bulk_delete_vehicles(Vehicle.objects.exclude(vehicle_type='Four'))
+
+        self.assertEqual(count, 3)
+        self.assertEqual(len(self.bulk_sql(queries, 'DELETE FROM "vehicles_vehicle"')), 1)
+        self.assertEqual(list(Vehicle.objects.values_list('vehicle_number', flat=True)), ['BLK4'])
+        self.assertEqual(read_vehicle_counters(), count_vehicles_by_type())
+
+    def test_list_bulk_update_selected(self):
+        """Test admins can change the model of the ticked vehicles and the list shows it"""
+        self.client.force_login(self.admin)
+        self.client.get(reverse('vehicle_list'))
+        ids = list(Vehicle.objects.filter(vehicle_number__in=['BLK1', 'BLK3']).values_list('pk', flat=True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('vehicle_bulk'), {
+                'action': 'update', 'scope': 'selected', 'ids': ids, 'vehicle_model': 'Fleet Renamed'
+            })
+        self.assertRedirects(response, reverse('vehicle_list'))
+        self.assertEqual(
+            set(Vehicle.objects.filter(vehicle_model='Fleet Renamed').values_list('vehicle_number', flat=True)),
+            {'BLK1', 'BLK3'}
+        )
+        self.assertContains(self.client.get(reverse('vehicle_list')), 'Fleet Renamed', count=2)
+
+    def test_list_bulk_update_filtered(self):
+        """Test the filtered scope applies to every vehicle matching ?type="""
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('vehicle_bulk') + '?type=Two', {
+            'action': 'update', 'scope': 'filtered', 'vehicle_type': 'Three'
+        })
+        self.assertRedirects(response, reverse('vehicle_list') + '?type=Two')
+        self.assertEqual(Vehicle.objects.filter(vehicle_type='Three').count(), 3)
+
+    def test_list_bulk_delete_roles(self):
+        """Test only superadmins can bulk delete and users cannot bulk edit"""
+        ids = list(Vehicle.objects.values_list('pk', flat=True))
+        data = {'action': 'delete', 'scope': 'selected', 'ids': ids}
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('vehicle_bulk'), {**data, 'action': 'update', 'vehicle_model': 'X'})
+        self.client.force_login(self.admin)
+        self.client.post(reverse('vehicle_bulk'), data)
+        self.assertEqual(Vehicle.objects.count(), 4)
+        self.assertFalse(Vehicle.objects.filter(vehicle_model='X').exists())
+
+        self.client.force_login(self.superadmin)
+        self.client.post(reverse('vehicle_bulk'), data)
+        self.assertEqual(Vehicle.objects.count(), 0)
+
+    def test_list_bulk_requires_selection(self):
+        """Test an empty selection writes nothing and explains why"""
+        self.client.force_login(self.superadmin)
+        response = self.client.post(
+            reverse('vehicle_bulk'), {'action': 'delete', 'scope': 'selected'}, follow=True
+        )
+        self.assertContains(response, 'Select at least one vehicle.')
+        self.assertEqual(Vehicle.objects.count(), 4)
+
+    def test_admin_actions(self):
+        """Test the admin set-type action and delete selected use the bulk paths"""
+        self.client.force_login(self.superadmin)
+        url = reverse('admin:vehicles_vehicle_changelist')
+        ids = list(Vehicle.objects.filter(vehicle_type='Two').values_list('pk', flat=True))
+
+        self.client.post(url, {'action': 'set_type_three', '_selected_action': ids})
+        self.assertEqual(Vehicle.objects.filter(vehicle_type='Three').count(), 3)
+
+        self.client.post(url, {'action': 'delete_selected', '_selected_action': ids, 'post': 'yes'})
+        self.assertEqual(Vehicle.objects.count(), 2)
+        self.assertEqual(read_vehicle_counters(), count_vehicles_by_type())
+
+
+class VehiclePlateLookupTest(TestCase):
+    """Test the normalized vehicle number and the lookup-by-plate endpoint"""
+
+    def setUp(self):
+        """Create a user and a vehicle stored with spaces and lowercase letters"""
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(
+            username='plate_user', email='plateuser@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        self.vehicle = Vehicle.objects.create(
+            vehicle_number='mh 12-ab 1234', vehicle_type='Four',
+            vehicle_model='Plate Car', vehicle_description='Plate test'
+        )
+
+    def test_normalize_vehicle_number(self):
+        """Test whitespace and punctuation are stripped and letters uppercased"""
+        self.assertEqual(normalize_vehicle_number('MH 12 AB 1234'), 'MH12AB1234')
+        self.assertEqual(normalize_vehicle_number(' mh-12.ab_1234 '), 'MH12AB1234')
+        self.assertEqual(normalize_vehicle_number('--'), '')
+
+    def test_save_maintains_normalized_number(self):
+        """Test save() keeps the canonical column in step, including with update_fields"""
+        self.assertEqual(self.vehicle.vehicle_number_normalized, 'MH12AB1234')
+        self.vehicle.vehicle_number = 'ka 01 xy 9999'
+        self.vehicle.save(update_fields=['vehicle_number'])
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.vehicle_number_normalized, 'KA01XY9999')
+
+    def test_form_rejects_other_spellings_of_a_plate(self):
+        """Test the form treats differently written numbers of one plate as duplicates"""
+        form = VehicleForm(data={
+            'vehicle_number': 'MH12AB1234', 'vehicle_type': 'Two',
+            'vehicle_model': 'Other', 'vehicle_description': 'Duplicate plate'
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('vehicle_number', form.errors)
+
+        form = VehicleForm(instance=self.vehicle, data={
+            'vehicle_number': 'MH12AB1234', 'vehicle_type': 'Four',
+            'vehicle_model': 'Plate Car', 'vehicle_description': 'Same vehicle, tidied number'
+        })
+        self.assertTrue(form.is_valid())
+
+        form = VehicleForm(data={
+            'vehicle_number': '- -', 'vehicle_type': 'Two',
+            'vehicle_model': 'Other', 'vehicle_description': 'No plate'
+        })
+        self.assertFalse(form.is_valid())
+
+    def test_lookup_by_any_spelling(self):
+        """Test the endpoint finds the vehicle however the plate is written"""
+        self.client.force_login(self.user)
+        for plate in ['MH12AB1234', 'mh 12 ab 1234', 'MH-12-AB-1234']:
+            response = self.client.get(reverse('vehicle_api_plate', kwargs={'plate': plate}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['id'], self.vehicle.pk)
+        self.assertIn('ETag', response)
+
+        response = self.client.get(reverse('vehicle_api_plate', kwargs={'plate': 'MH12AB9999'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_lookup_requires_login(self):
+        """Test anonymous lookups are refused"""
+        response = self.client.get(reverse('vehicle_api_plate', kwargs={'plate': 'MH12AB1234'}))
+        self.assertEqual(response.status_code, 401)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_lookup_uses_unique_index(self):
+        """Test the lookup is an index seek, not a table scan"""
+        queryset = Vehicle.objects.filter(vehicle_number_normalized='MH12AB1234')
+        plan = queryset.explain()
+        self.assertIn('USING INDEX', plan)
+        self.assertNotIn('SCAN vehicles_vehicle', plan)
+
+    def test_import_upserts_other_spellings(self):
+        """Test importing a differently written plate updates the existing vehicle"""
+        report = import_vehicles(StringIO(
+            'vehicle_number,vehicle_type,vehicle_model,vehicle_description\n'
+            'MH12AB1234,Four,Imported Car,Updated by import\n'
+        ), 'csv')
+        self.assertEqual(report.imported, 1)
+        self.assertEqual(Vehicle.objects.count(), 1)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.vehicle_model, 'Imported Car')
+
+
+class VehicleTypeaheadTest(TestCase):
+    """Test the in-memory plate / model prefix index and the autocomplete endpoint"""
+
+    def setUp(self):
+        """Start from an unbuilt index with a few vehicles"""
+        vehicle_typeahead.invalidate()
+        self.addCleanup(vehicle_typeahead.invalidate)
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(
+            username='typeahead_user', email='typeahead@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        self.activa = Vehicle.objects.create(
+            vehicle_number='MH 12 AB 1234', vehicle_type='Two',
+            vehicle_model='Honda Activa', vehicle_description='Typeahead test'
+        )
+        Vehicle.objects.create(
+            vehicle_number='MH 14 CD 5678', vehicle_type='Four',
+            vehicle_model='Tata Nexon', vehicle_description='Typeahead test'
+        )
+        Vehicle.objects.create(
+            vehicle_number='KA 01 EF 9012', vehicle_type='Three',
+            vehicle_model='Bajaj RE', vehicle_description='Typeahead test'
+        )
+
+    def numbers(self, query, **kwargs):
+        return [row[1] for row in vehicle_typeahead.suggest(query, **kwargs)]
+
+    def test_sorted_prefix_index(self):
+        """Test prefix search, ordering and removal on the sorted array"""
+        index = SortedPrefixIndex()
+        for key, pk in [('MH12', 1), ('MH14', 2), ('KA01', 3), ('MH1', 4)]:
+            index.add(key, pk)
+        self.assertEqual(index.search('MH1', 10), [4, 1, 2])
+        self.assertEqual(index.search('MH1', 2), [4, 1])
+        index.remove('MH12', 1)
+        self.assertEqual(index.search('MH1', 10), [4, 2])
+        self.assertEqual(index.search('X', 10), [])
+        self.assertEqual(model_keys('Honda Activa 125'), ['honda activa 125', 'activa 125', '125'])
+
+    def test_plate_and_model_prefixes(self):
+        """Test plates match in any spelling and models match on any word"""
+        self.assertEqual(self.numbers('mh1'), ['MH 12 AB 1234', 'MH 14 CD 5678'])
+        self.assertEqual(self.numbers('MH 12-a'), ['MH 12 AB 1234'])
+        self.assertEqual(self.numbers('acti'), ['MH 12 AB 1234'])
+        self.assertEqual(self.numbers('tata ne'), ['MH 14 CD 5678'])
+        self.assertEqual(self.numbers('mh', limit=1), ['MH 12 AB 1234'])
+        self.assertEqual(self.numbers('  '), [])
+
+    def test_built_lazily_then_updated_from_signals(self):
+        """Test the index loads once and then follows saves and deletes without queries"""
+        self.assertFalse(vehicle_typeahead.ready)
+        self.numbers('mh')
+        self.assertTrue(vehicle_typeahead.ready)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created = Vehicle.objects.create(
+                vehicle_number='MH 15 GH 3456', vehicle_type='Two',
+                vehicle_model='TVS Jupiter', vehicle_description='Typeahead test'
+            )
+            self.activa.vehicle_model = 'Honda Dio'
+            self.activa.save()
+            Vehicle.objects.get(vehicle_number='KA 01 EF 9012').delete()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.numbers('jup'), [created.vehicle_number])
+            self.assertEqual(self.numbers('acti'), [])
+            self.assertEqual(self.numbers('dio'), ['MH 12 AB 1234'])
+            self.assertEqual(self.numbers('ka'), [])
+
+    def test_bulk_changes_reset_the_index(self):
+        """Test a bulk update drops the index so the next query reloads it"""
+        self.numbers('mh')
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_vehicles(Vehicle.objects.all(), {'vehicle_model': 'Renamed'})
+        self.assertFalse(vehicle_typeahead.ready)
+        self.assertEqual(len(self.numbers('renamed')), 3)
+
+    def test_rolled_back_writes_are_not_indexed(self):
+        """Test the index only follows writes that commit"""
+        self.numbers('mh')
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            Vehicle.objects.create(
+                vehicle_number='MH 16 ZZ 0001', vehicle_type='Two',
+                vehicle_model='Phantom Scooter', vehicle_description='Rolled back'
+            )
+            self.activa.delete()
+            transaction.set_rollback(True)
+        self.assertEqual(self.numbers('phantom'), [])
+        self.assertEqual(self.numbers('mh 12'), ['MH 12 AB 1234'])
+
+    @override_settings(VEHICLE_TYPEAHEAD_BACKGROUND_BUILD=True)
+    def test_loads_once_in_the_background(self):
+        """Test queries don't wait for a load: the database answers until it is done, and only one runs"""
+        typeahead = VehicleTypeahead()
+        release = threading.Event()
+        loads = []
+        snapshot = list(Vehicle.objects.values_list('pk', 'vehicle_number', 'vehicle_model', 'vehicle_type'))
+
+        def rows():
+            loads.append(threading.current_thread().name)
+            release.wait(5)
+            yield from snapshot
+
+        typeahead.build = lambda: VehicleTypeahead.build(typeahead, rows())
+        # MODELS NEED THE INDEX; PLATES COME FROM THE DATABASE MEANWHILE
+        self.assertEqual([row[1] for row in typeahead.suggest('mh 12')], ['MH 12 AB 1234'])
+        self.assertEqual(typeahead.suggest('acti'), [])
+        refresher = typeahead._refresher
+        while not loads:
+            time.sleep(0.01)
+        # A WRITE COMMITTED WHILE THE TABLE IS READ IS APPLIED TO THE NEW INDEX
+        typeahead.update(999, 'GJ 01 XY 0001', 'Honda Activa', 'Two')
+        release.set()
+        refresher.join(5)
+
+        self.assertEqual(loads, ['vehicle-typeahead-build'])
+        self.assertEqual(sorted(row[1] for row in typeahead.suggest('acti')), ['GJ 01 XY 0001', 'MH 12 AB 1234'])
+
+    @override_settings(VEHICLE_TYPEAHEAD_MAX_VEHICLES=2)
+    def test_oversized_fleet_falls_back_to_the_database(self):
+        """Test the memory cap: too many vehicles means plate prefixes come from the index in the database"""
+        typeahead = VehicleTypeahead()
+        self.assertEqual([row[1] for row in typeahead.suggest('mh1')], ['MH 12 AB 1234', 'MH 14 CD 5678'])
+        self.assertTrue(typeahead.too_large)
+        self.assertEqual(typeahead.vehicles, {})
+
+    def test_autocomplete_endpoint(self):
+        """Test the JSON endpoint and its login requirement"""
+        response = self.client.get(reverse('vehicle_autocomplete'), {'q': 'mh 14'})
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('vehicle_autocomplete'), {'q': 'mh 14'})
+        self.assertEqual(response.json()['results'], [{
+            'id': Vehicle.objects.get(vehicle_number='MH 14 CD 5678').pk,
+            'vehicle_number': 'MH 14 CD 5678',
+            'vehicle_model': 'Tata Nexon',
+            'vehicle_type': 'Four',
+            'url': reverse('vehicle_detail', args=[Vehicle.objects.get(vehicle_number='MH 14 CD 5678').pk]),
+        }])
+
+
+@override_settings(VEHICLE_AUDIT_WRITE_BEHIND=False)
+class VehicleAuditLogTest(TestCase):
+    """Test the vehicle change history: what is recorded, the write-behind queue and the history page"""
+
+    def setUp(self):
+        """Create users and a vehicle"""
+        self.client = Client()
+        self.superadmin = CustomUser.objects.create_user(
+            username='audit_superadmin', email='auditsuper@test.com',
+            password='testpass123', role='superadmin', is_active=True,
+            is_staff=True, is_superuser=True
+        )
+        self.user = CustomUser.objects.create_user(
+            username='audit_user', email='audituser@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicle = Vehicle.objects.create(
+                vehicle_number='AUD1', vehicle_type='Two',
+                vehicle_model='Audit Model', vehicle_description='Audit test'
+            )
+
+    def history(self, vehicle_id=None):
+        return list(
+            VehicleChange.objects.filter(vehicle_id=vehicle_id or self.vehicle.pk)
+            .order_by('changed_at', 'id').values_list('action', 'changes', 'username')
+        )
+
+    def test_nothing_is_written_before_commit(self):
+        """Test changes are only queued once the transaction commits"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.vehicle.vehicle_model = 'Uncommitted'
+            self.vehicle.save()
+        self.assertEqual(len(self.history()), 1)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(self.history()), 2)
+
+    def test_view_edits_are_recorded_with_the_user(self):
+        """Test create, edit and delete through the pages record diffs and who made them"""
+        self.client.force_login(self.superadmin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('vehicle_edit', args=[self.vehicle.pk]), {
+                'vehicle_number': 'AUD1', 'vehicle_type': 'Four',
+                'vehicle_model': 'Audit Model', 'vehicle_description': 'Audit test',
+            })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('vehicle_delete', args=[self.vehicle.pk]))
+
+        self.assertEqual(self.history(), [
+            ('create', {
+                'vehicle_number': [None, 'AUD1'], 'vehicle_type': [None, 'Two'],
+                'vehicle_model': [None, 'Audit Model'], 'vehicle_description': [None, 'Audit test'],
+            }, ''),
+            ('update', {'vehicle_type': ['Two', 'Four']}, 'audit_superadmin'),
+            ('delete', {
+                'vehicle_number': ['AUD1', None], 'vehicle_type': ['Four', None],
+                'vehicle_model': ['Audit Model', None], 'vehicle_description': ['Audit test', None],
+            }, 'audit_superadmin'),
+        ])
+
+    def test_unchanged_save_is_not_recorded(self):
+        """Test saving without changing an audited field adds nothing"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Vehicle.objects.get(pk=self.vehicle.pk).save()
+        self.assertEqual(len(self.history()), 1)
+
+    def test_bulk_and_import_changes_are_recorded(self):
+        """Test bulk update, bulk delete and import each record one row per vehicle"""
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Vehicle.objects.create(
+                vehicle_number='AUD2', vehicle_type='Two',
+                vehicle_model='Audit Model', vehicle_description='Audit test'
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_vehicles(Vehicle.objects.all(), {'vehicle_type': 'Three'})
+        with self.captureOnCommitCallbacks(execute=True):
+            import_vehicles(StringIO(
+                'vehicle_number,vehicle_type,vehicle_model,vehicle_description\n'
+                'aud-1,Three,Imported Model,Audit test\n'
+                'AUD3,Four,New Model,Audit test\n'
+            ), 'csv')
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_delete_vehicles(Vehicle.objects.filter(pk=other.pk))
+
+        self.assertEqual([row[:2] for row in self.history()[1:]], [
+            ('update', {'vehicle_type': ['Two', 'Three']}),
+            ('import', {'vehicle_model': ['Audit Model', 'Imported Model']}),
+        ])
+        self.assertEqual([row[0] for row in self.history(other.pk)], ['create', 'update', 'delete'])
+        created = Vehicle.objects.get(vehicle_number='AUD3')
+        self.assertEqual(self.history(created.pk)[0][0], 'import')
+        self.assertEqual(self.history(created.pk)[0][1]['vehicle_number'], [None, 'AUD3'])
+
+    def test_writer_batches_in_the_background(self):
+        """Test the writer thread drains the queue in bulk batches and flush() waits for it"""
+        writer = AuditWriter()
+        batches = []
+        release = threading.Event()
+
+        def write(changes):
+            release.wait(5)
+            batches.append([change.vehicle_number for change in changes])
+
+        writer._write = write
+        self.addCleanup(writer.stop)
+        with self.settings(VEHICLE_AUDIT_WRITE_BEHIND=True, VEHICLE_AUDIT_BATCH_SIZE=2,
+                           VEHICLE_AUDIT_FLUSH_INTERVAL=0.05):
+            with self.captureOnCommitCallbacks(execute=True):
+                writer.record([build_change(self.vehicle.pk, f'Q{n}', 'update', {}) for n in range(5)])
+            self.assertEqual(batches, [])
+            release.set()
+            writer.flush()
+        self.assertEqual(sorted(number for batch in batches for number in batch), [f'Q{n}' for n in range(5)])
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+
+    def test_failed_batch_is_retried(self):
+        """Test a batch the database rejects is kept and written on a later try"""
+        writer = AuditWriter()
+        stored = []
+        failures = [DatabaseError('database table is locked')]
+
+        def write(changes):
+            if failures:
+                raise failures.pop()
+            stored.extend(change.vehicle_number for change in changes)
+
+        writer._write = write
+        self.addCleanup(writer.stop)
+        with self.settings(VEHICLE_AUDIT_WRITE_BEHIND=True, VEHICLE_AUDIT_FLUSH_INTERVAL=0.01):
+            with self.assertLogs('vehicles.audit', 'ERROR'):
+                writer._enqueue([build_change(self.vehicle.pk, f'R{n}', 'update', {}) for n in range(3)])
+                writer.flush()
+        self.assertEqual(sorted(stored), ['R0', 'R1', 'R2'])
+
+    def test_full_queue_policies(self):
+        """Test a full queue writes synchronously ("sync") or drops and counts ("drop")"""
+        for policy in ['sync', 'drop']:
+            writer = AuditWriter()
+            written = []
+            release = threading.Event()
+
+            def write(changes, written=written, release=release):
+                if threading.current_thread().name == 'vehicle-audit-writer':
+                    release.wait(5)
+                    written.extend(('thread', change.vehicle_number) for change in changes)
+                else:
+                    written.extend(('caller', change.vehicle_number) for change in changes)
+
+            writer._write = write
+            with self.settings(VEHICLE_AUDIT_WRITE_BEHIND=True, VEHICLE_AUDIT_QUEUE_SIZE=1,
+                               VEHICLE_AUDIT_BATCH_SIZE=1, VEHICLE_AUDIT_QUEUE_POLICY=policy,
+                               VEHICLE_AUDIT_FLUSH_INTERVAL=0.05):
+                # THE THREAD TAKES THE FIRST ROW AND WAITS, THE SECOND FILLS THE QUEUE
+                writer._enqueue([build_change(self.vehicle.pk, 'F0', 'update', {})])
+                while not writer._queue.empty():
+                    pass
+                with self.assertLogs('vehicles.audit', 'WARNING') if policy == 'drop' else nullcontext():
+                    writer._enqueue([build_change(self.vehicle.pk, f'F{n}', 'update', {}) for n in (1, 2, 3)])
+                release.set()
+                writer.flush()
+                writer.stop()
+
+            if policy == 'sync':
+                self.assertEqual(sorted(written), [('caller', 'F2'), ('caller', 'F3'), ('thread', 'F0'), ('thread', 'F1')])
+                self.assertEqual(writer.dropped, 0)
+            else:
+                self.assertEqual(sorted(written), [('thread', 'F0'), ('thread', 'F1')])
+                self.assertEqual(writer.dropped, 2)
+
+    def test_history_page(self):
+        """Test the history page: roles, newest first, and still readable after a delete"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicle.vehicle_model = 'Second Model'
+            self.vehicle.save()
+        url = reverse('vehicle_history', args=[self.vehicle.pk])
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.superadmin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([change.action for change in response.context['changes']], ['update', 'create'])
+        self.assertContains(response, 'Second Model')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicle.delete()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['vehicle_number'], 'AUD1')
+        self.assertEqual(self.client.get(reverse('vehicle_history', args=[999999])).status_code, 404)
+
+    def test_history_query_uses_the_index(self):
+        """Test a vehicle's history is read through the (vehicle_id, changed_at) index without sorting"""
+        queryset = VehicleChange.objects.filter(vehicle_id=self.vehicle.pk).order_by('-changed_at', '-id')
+        plan = queryset.explain()
+        self.assertIn('vehicle_change_history_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_admin_is_read_only(self):
+        """Test the audit log can be browsed but not edited in the admin"""
+        self.client.force_login(self.superadmin)
+        self.assertEqual(self.client.get(reverse('admin:vehicles_vehiclechange_changelist')).status_code, 200)
+        change = VehicleChange.objects.get(vehicle_id=self.vehicle.pk)
+        response = self.client.post(reverse('admin:vehicles_vehiclechange_delete', args=[change.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(VehicleChange.objects.filter(pk=change.pk).exists())
+
+
+@override_settings(VEHICLE_SYNC_SETTLE_SECONDS=0)
+class VehicleSyncFeedTest(TestCase):
+    """Test the changes-since sync feed and its tombstones"""
+
+    def setUp(self):
+        """Create a user and a small fleet"""
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(
+            username='sync_user', email='sync@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        self.client.force_login(self.user)
+        self.vehicles = [
+            Vehicle.objects.create(
+                vehicle_number=f'SYNC{n}', vehicle_type='Two',
+                vehicle_model='Sync Model', vehicle_description='Sync test'
+            )
+            for n in range(3)
+        ]
+        self.url = reverse('vehicle_api_changes')
+
+    def changes(self, since=None, **params):
+        if since:
+            params['since'] = since
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def sync_all(self, since=None):
+        """Follow has_more to the end; return (vehicle ids, deleted ids, cursor)"""
+        vehicles, deleted = [], []
+        while True:
+            data = self.changes(since, page_size=2)
+            vehicles += [row['id'] for row in data['vehicles']]
+            deleted += [row['id'] for row in data['deleted']]
+            since = data['cursor']
+            if not data['has_more']:
+                return vehicles, deleted, since
+
+    def test_initial_sync_then_only_changes(self):
+        """Test a full sync in pages, then nothing until something changes"""
+        vehicles, deleted, cursor = self.sync_all()
+        self.assertEqual(vehicles, [vehicle.pk for vehicle in self.vehicles])
+        self.assertEqual(deleted, [])
+        self.assertEqual(self.changes(cursor)['vehicles'], [])
+
+        self.vehicles[0].vehicle_model = 'Changed'
+        self.vehicles[0].save()
+        created = Vehicle.objects.create(
+            vehicle_number='SYNC9', vehicle_type='Four',
+            vehicle_model='Sync Model', vehicle_description='Sync test'
+        )
+        deleted_pk = self.vehicles[1].pk
+        self.vehicles[1].delete()
+
+        data = self.changes(cursor)
+        self.assertEqual([row['id'] for row in data['vehicles']], [self.vehicles[0].pk, created.pk])
+        self.assertEqual(data['vehicles'][0]['vehicle_model'], 'Changed')
+        self.assertEqual(data['deleted'][0]['id'], deleted_pk)
+        self.assertEqual(data['deleted'][0]['vehicle_number'], 'SYNC1')
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.changes(data['cursor'])['deleted'], [])
+
+    def test_bulk_changes_reach_the_feed(self):
+        """Test bulk edits bump updated_at and bulk deletes leave tombstones"""
+        _, _, cursor = self.sync_all()
+        bulk_update_vehicles(Vehicle.objects.filter(pk=self.vehicles[0].pk), {'vehicle_type': 'Four'})
+        bulk_delete_vehicles(Vehicle.objects.filter(pk__in=[self.vehicles[1].pk, self.vehicles[2].pk]))
+
+        vehicles, deleted, _ = self.sync_all(cursor)
+        self.assertEqual(vehicles, [self.vehicles[0].pk])
+        self.assertEqual(sorted(deleted), [self.vehicles[1].pk, self.vehicles[2].pk])
+
+    def test_fields_and_query_count(self):
+        """Test ?fields= and that a sync call is one indexed query per stream"""
+        _, _, cursor = self.sync_all()
+        self.vehicles[2].save()
+        with self.assertNumQueries(4):  # SESSION, USER, VEHICLES, TOMBSTONES
+            data = self.changes(cursor, fields='vehicle_number')
+        self.assertEqual(data['vehicles'], [{'id': self.vehicles[2].pk, 'vehicle_number': 'SYNC2'}])
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output checked for SQLite')
+    def test_streams_use_their_indexes(self):
+        """Test both streams are range scans on an index, without a sort"""
+        vehicles_plan = Vehicle.objects.filter(updated_at__gt=timezone.now()).order_by('updated_at', 'id').explain()
+        tombstones_plan = VehicleTombstone.objects.filter(
+            deleted_at__gt=timezone.now()
+        ).order_by('deleted_at', 'id').explain()
+        self.assertIn('vehicle_updated_idx', vehicles_plan)
+        self.assertIn('vehicle_tombstone_sync_idx', tombstones_plan)
+        self.assertNotIn('TEMP B-TREE', vehicles_plan + tombstones_plan)
+
+    def test_settle_window_holds_back_fresh_rows(self):
+        """Test rows stamped inside the settle window wait for a later call"""
+        with self.settings(VEHICLE_SYNC_SETTLE_SECONDS=60):
+            self.assertEqual(self.changes()['vehicles'], [])
+
+    def test_bad_and_expired_cursors(self):
+        """Test a malformed cursor is a 400 and one older than the tombstone retention a 410"""
+        self.assertEqual(self.client.get(self.url, {'since': 'not-a-cursor'}).status_code, 400)
+        for data in ({'v': 1, 'd': 'x'}, {'v': ['x'], 'd': 'x'}, {'v': None, 'd': 1}):
+            cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+            self.assertEqual(self.client.get(self.url, {'since': cursor}).status_code, 400, data)
+
+        paginator = KeysetPaginator(VehicleTombstone.objects.all(), TOMBSTONE_SYNC_ORDERING)
+        old = paginator.encode_cursor(VehicleTombstone(id=0, deleted_at=timezone.now() - timedelta(days=365)))
+        response = self.client.get(self.url, {'since': encode_sync_cursor(None, old)})
+        self.assertEqual(response.status_code, 410)
+
+    def test_prune_command(self):
+        """Test tombstones past the retention period are pruned"""
+        self.vehicles[0].delete()
+        VehicleTombstone.objects.create(
+            vehicle_id=999, vehicle_number='OLD', deleted_at=timezone.now() - timedelta(days=365)
+        )
+        out = StringIO()
+        call_command('prune_vehicle_tombstones', stdout=out)
+        self.assertIn('Pruned 1 tombstones', out.getvalue())
+        self.assertEqual(list(VehicleTombstone.objects.values_list('vehicle_number', flat=True)), ['SYNC0'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_a', 'replica_b'], DATABASE_REPLICA_STICKY_SECONDS=30)
+class ReplicaRouterTest(SimpleTestCase):
+    """Test primary / replica routing and read-your-writes pinning"""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def run_request(self, view, session=None):
+        """Call view through the pinning middleware with a dict session; return the session"""
+        request = RequestFactory().get('/vehicles/')
+        request.session = {} if session is None else session
+        replica_pin_middleware(lambda request: view(request) or HttpResponse())(request)
+        return request.session
+
+    def test_reads_go_to_one_replica_per_request(self):
+        """Test app reads use a replica (the same one within a request) and writes the primary"""
+        def view(request):
+            first = self.router.db_for_read(Vehicle)
+            self.assertIn(first, ['replica_a', 'replica_b'])
+            self.assertEqual({self.router.db_for_read(CustomUser) for _ in range(10)}, {first})
+            self.assertIsNone(self.router.db_for_read(Session))
+        session = self.run_request(view)
+        self.assertNotIn(SESSION_KEY, session)
+        self.assertEqual(self.router.db_for_write(Session), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_a', 'vehicles'))
+        self.assertTrue(self.router.allow_migrate('default', 'vehicles'))
+
+    def test_write_pins_the_rest_of_the_request_and_the_session(self):
+        """Test a write sends later reads in the request, and the next requests, to the primary"""
+        def writing_view(request):
+            self.assertEqual(self.router.db_for_write(Vehicle), 'default')
+            self.assertTrue(pinned_to_primary())
+            self.assertEqual(self.router.db_for_read(Vehicle), 'default')
+        session = self.run_request(writing_view)
+        self.assertIn(SESSION_KEY, session)
+
+        def reading_view(request):
+            self.assertEqual(self.router.db_for_read(Vehicle), 'default')
+        self.run_request(reading_view, session)
+
+        session[SESSION_KEY] = 0
+        def expired_view(request):
+            self.assertNotEqual(self.router.db_for_read(Vehicle), 'default')
+        self.run_request(expired_view, session)
+
+    def test_ranked_search_reads_from_the_routed_database(self):
+        """Test ranked search asks the router instead of always reading the primary"""
+        def view(request):
+            replica = self.router.db_for_read(Vehicle)
+            with self.assertRaisesMessage(ConnectionDoesNotExist, replica):
+                rank_vehicles('mh12')
+        self.run_request(view)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_means_primary(self):
+        """Test everything stays on the primary when no replica is configured"""
+        self.assertEqual(self.router.db_for_read(Vehicle), 'default')
+        session = self.run_request(lambda request: self.router.db_for_write(Vehicle))
+        self.assertNotIn(SESSION_KEY, session)
+
+
+REPLICA = 'replica_test'
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite replica files')
+class SeparateReplicaTest(TransactionTestCase):
+    """Test writes and read-your-writes against a replica in its own SQLite file, lagging the primary"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Add the replica connection (the test runner only sets up databases from settings)"""
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        cls.replica_path = os.path.join(directory.name, 'replica.sqlite3')
+        connections.settings[REPLICA] = {**connections.settings['default'], 'NAME': cls.replica_path}
+        cls.addClassCleanup(cls.remove_replica)
+        cls.databases = {*cls.databases, REPLICA}
+
+    @classmethod
+    def remove_replica(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+
+    def setUp(self):
+        """Create a user and vehicles, copy the primary to the replica file, then change one on the primary only"""
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username='replica_user', email='replica@test.com', password='testpass123', role='user', is_active=True
+        )
+        self.vehicles = [
+            Vehicle.objects.create(
+                vehicle_number=f'REP{number}', vehicle_type='Two',
+                vehicle_model='Replica', vehicle_description='Replica test'
+            )
+            for number in range(3)
+        ]
+        connections[REPLICA].close()
+        connection.ensure_connection()
+        replica = sqlite3.connect(self.replica_path)
+        connection.connection.backup(replica)
+        replica.close()
+
+        overrides = override_settings(DATABASE_REPLICAS=[REPLICA])
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        Vehicle.objects.filter(vehicle_number='REP0').update(vehicle_type='Three')
+
+    def in_request(self, function, session=None):
+        """function()'s result, called as a request through the pinning middleware would call it"""
+        request = RequestFactory().get('/vehicles/')
+        request.session = {} if session is None else session
+        results = []
+        replica_pin_middleware(lambda request: results.append(function()) or HttpResponse())(request)
+        return results[0]
+
+    def test_bulk_delete_runs_on_the_primary(self):
+        """Test a bulk delete removes the rows from the primary, not from the replica it would read"""
+        count = self.in_request(
+            lambda: bulk_delete_vehicles(Vehicle.objects.filter(vehicle_number__in=['REP0', 'REP1']))
+        )
+
+        self.assertEqual(count, 2)
+        self.assertEqual(list(Vehicle.objects.using('default').values_list('vehicle_number', flat=True)), ['REP2'])
+        self.assertEqual(Vehicle.objects.using(REPLICA).count(), 3)
+        self.assertEqual(VehicleTombstone.objects.using('default').count(), 2)
+
+    def test_bulk_update_reads_old_values_from_the_primary(self):
+        """Test a bulk update records the primary's old values, not the replica's stale ones"""
+        count = self.in_request(
+            lambda: bulk_update_vehicles(Vehicle.objects.filter(vehicle_number='REP0'), {'vehicle_type': 'Four'})
+        )
+
+        self.assertEqual(count, 1)
+        self.assertEqual(Vehicle.objects.using('default').get(vehicle_number='REP0').vehicle_type, 'Four')
+        self.assertEqual(Vehicle.objects.using(REPLICA).get(vehicle_number='REP0').vehicle_type, 'Two')
+        change = VehicleChange.objects.using('default').get(vehicle_id=self.vehicles[0].pk, action='update')
+        self.assertEqual(change.changes, {'vehicle_type': ['Three', 'Four']})
+
+    def test_pinned_session_skips_pages_cached_from_the_replica(self):
+        """Test a session that just wrote sees its write even after a page was cached from the replica"""
+        vehicle = self.vehicles[1]
+        vehicle.vehicle_model = 'Written'
+        vehicle.save()
+
+        reader = Client()
+        reader.force_login(self.user)
+        self.assertNotContains(reader.get(reverse('vehicle_list')), 'Written')
+
+        self.client.force_login(self.user)
+        session = self.client.session
+        session[SESSION_KEY] = time.time() + 30
+        session.save()
+        self.assertContains(self.client.get(reverse('vehicle_list')), 'Written')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite connection tuning')
+class SQLiteTuningTest(TestCase):
+    """Test every connection is opened with the configured pragmas"""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """Test busy_timeout, synchronous, cache_size and temp_store come from SQLITE_PRAGMAS"""
+        pragmas = settings.SQLITE_PRAGMAS
+        self.assertEqual(self.pragma('busy_timeout'), pragmas['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'), pragmas['cache_size'])
+        self.assertEqual(self.pragma('synchronous'), {'off': 0, 'normal': 1, 'full': 2, 'extra': 3}[pragmas['synchronous']])
+        self.assertEqual(self.pragma('temp_store'), {'default': 0, 'file': 1, 'memory': 2}[pragmas['temp_store']])
+        self.assertEqual(connection.settings_dict['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertTrue(connection.settings_dict['CONN_HEALTH_CHECKS'])
+
+
+@override_settings(VEHICLE_AUDIT_WRITE_BEHIND=False)
+class LoadTestingCommandsTest(TestCase):
+    """Test the seed_data and benchmark management commands"""
+
+    def test_seed_data(self):
+        """Test seeding vehicles and users across roles, and that a re-run adds more"""
+        call_command('seed_data', vehicles=120, users=40, batch_size=50, stdout=StringIO())
+        self.assertEqual(Vehicle.objects.count(), 120)
+        self.assertEqual(Vehicle.objects.values('vehicle_number_normalized').distinct().count(), 120)
+        self.assertEqual(read_vehicle_counters(), count_vehicles_by_type())
+        roles = dict(CustomUser.objects.values_list('role').annotate(total=Count('id')))
+        self.assertEqual(roles, {'superadmin': 2, 'admin': 8, 'user': 30})
+        self.assertTrue(self.client.login(username='seed_user0', password='seedpass123'))
+
+        call_command('seed_data', vehicles=30, users=5, stdout=StringIO())
+        self.assertEqual(Vehicle.objects.count(), 150)
+        self.assertEqual(CustomUser.objects.count(), 45)
+
+    def test_benchmark_report(self):
+        """Test the benchmark measures each scenario, writes JSON and removes what it created"""
+        call_command('seed_data', vehicles=30, users=0, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command(
+                'benchmark', requests=3, memory_requests=1, output=output,
+                scenarios=['home', 'list', 'detail', 'create', 'edit', 'verify_otp'], stdout=StringIO(),
+            )
+            with open(output) as handle:
+                report = json.load(handle)
+
+        self.assertEqual(
+            list(report['scenarios']), ['home', 'list', 'detail', 'create', 'edit', 'register', 'verify_otp']
+        )
+        for name, result in report['scenarios'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['requests'], 3, name)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+        self.assertEqual(report['scenarios']['home']['queries_mean'], 0)
+        self.assertGreater(report['scenarios']['list']['peak_memory_kb'], 0)
+        self.assertEqual(Vehicle.objects.count(), 30)
+        self.assertFalse(CustomUser.objects.filter(username__startswith='bench_').exists())
+
+
+class QueryBudgetFrameworkTest(TestCase):
+    """Test the @query_budget declarations and the test runner that enforces them"""
+
+    def test_budget_lookup(self):
+        """Test budgets per method, the bare-limit fallback, and lookups through as_view()"""
+        @query_budget(2, post=5)
+        def view(request):
+            return HttpResponse()
+
+        self.assertEqual(budget_for(view, 'post'), 5)
+        self.assertEqual(budget_for(view, 'GET'), 2)
+        self.assertEqual(budget_for(resolve(reverse('vehicle_bulk')).func, 'POST'), 9)
+        self.assertIsNone(budget_for(resolve(reverse('vehicle_bulk')).func, 'GET'))
+        self.assertIsNone(budget_for(lambda request: None, 'GET'))
+
+    def test_every_route_is_budgeted(self):
+        """Test every named route of vehicles.urls and users.urls declares a budget"""
+        routes = budgeted_routes()
+        self.assertIn('vehicle_api_changes', routes)
+        self.assertIn('verify_otp', routes)
+        self.assertEqual(
+            [name for name, view in routes.items() if not getattr(view, 'view_class', view).__dict__.get('query_budgets')],
+            [],
+        )
+
+    def test_runner_adds_budget_check_to_full_runs(self):
+        """Test the budget check joins full runs and --query-budgets / --no-query-budgets override it"""
+        def labels(runner, test_labels):
+            suite = runner.build_suite(test_labels)
+            return {test.id() for test in suite}
+
+        budget_test = f"{QUERY_BUDGET_TEST}.test_routes_stay_within_their_query_budgets"
+        self.assertNotIn(budget_test, labels(VehicleTestRunner(verbosity=0), ['users.tests.UserFormsTest']))
+        self.assertNotIn(budget_test, labels(VehicleTestRunner(verbosity=0), ['vehicles.tests.SQLiteTuningTest']))
+        self.assertIn(budget_test, labels(VehicleTestRunner(verbosity=0), [QUERY_BUDGET_TEST]))
+        self.assertIn(budget_test, labels(VehicleTestRunner(verbosity=0), []))
+        self.assertIn(budget_test, labels(VehicleTestRunner(verbosity=0, query_budgets=True), ['users.tests.UserFormsTest']))
+        self.assertNotIn(budget_test, labels(VehicleTestRunner(verbosity=0, query_budgets=False), []))
+
+    def test_bulk_delete_query_count_is_flat(self):
+        """Test deleting hundreds of vehicles in bulk runs as many queries as deleting a handful"""
+        call_command('seed_data', vehicles=250, users=0, stdout=StringIO())
+        first_five = list(Vehicle.objects.order_by('pk').values_list('pk', flat=True)[:5])
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(bulk_delete_vehicles(Vehicle.objects.filter(pk__in=first_five)), 5)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(bulk_delete_vehicles(Vehicle.objects.all()), 245)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(read_vehicle_counters()['total'], 0)
+        self.assertEqual(VehicleTombstone.objects.count(), 250)
+
+
+# ONE REQUEST OF A ROUTE: WHO MAKES IT, WITH WHAT, AND THE STATUS THAT SHOWS IT TOOK THE REAL PATH.
+# data MAY BE A CALLABLE (BUILT AFTER prepare RUNS); json SENDS IT AS A JSON BODY
+Call = namedtuple('Call', 'method role path data status prepare json', defaults=(None, 200, None, False))
+
+BUDGET_PASSWORD = 'budget-pass-123'
+
+
+@contextmanager
+def rolled_back():
+    """Undo everything done inside the block (a savepoint in the test transaction)"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@tag(QUERY_BUDGET_TAG)
+class QueryBudgetTest(TestCase):
+    """Test every route of vehicles.urls and users.urls stays within its query budget at any fleet size"""
+
+    # FLEET SIZES EACH ROUTE IS REQUESTED AT; THE QUERY COUNT MUST NOT GROW FROM THE FIRST TO THE LAST
+    data_sizes = (20, 400)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            role: CustomUser.objects.create(username=f'budget_{role}', email=f'budget_{role}@example.com',
+                                            role=role, is_active=True)
+            for role in ('superadmin', 'admin', 'user')
+        }
+        cls.users['user'].set_password(BUDGET_PASSWORD)
+        cls.users['user'].save()
+
+    def seed(self, size):
+        """size vehicles and size / 10 users, plus change history and tombstones of the same size"""
+        call_command('seed_data', vehicles=size, users=size // 10, stdout=StringIO())
+        fleet = list(Vehicle.objects.order_by('pk'))
+        now = timezone.now()
+        VehicleChange.objects.bulk_create(
+            build_change(fleet[0].pk, fleet[0].vehicle_number, 'update', {'vehicle_model': ['Old', 'New']},
+                         user=self.users['admin'], changed_at=now - timedelta(seconds=number))
+            for number in range(size)
+        )
+        VehicleTombstone.objects.bulk_create(
+            VehicleTombstone(vehicle_id=10_000_000 + number, vehicle_number=f'GONE {number}',
+                             deleted_at=now - timedelta(minutes=1, seconds=number))
+            for number in range(size)
+        )
+        return fleet
+
+    def register_pending_user(self):
+        # THE OTP EMAIL GOES OUT ON COMMIT
+        with self.captureOnCommitCallbacks(execute=True):
+            Client().post(reverse('register'), self.registration('budget_pending'))
+
+    def registration(self, username):
+        return {
+            'username': username,
+            'email': f'{username}@example.com',
+            'role': 'user',
+            'password1': 'Budget-pass-987',
+            'password2': 'Budget-pass-987',
+        }
+
+    def last_otp(self):
+        return re.search(r'verification code is: (\d{6})', mail.outbox[-1].body).group(1)
+
+    def import_upload(self, fleet):
+        rows = [
+            'vehicle_number,vehicle_type,vehicle_model,vehicle_description',
+            'ZZ 01 AB 0001,Two,Budget Scooter,New',
+            f'{fleet[0].vehicle_number},Four,Budget Sedan,Updated',
+            'not a plate,Seven,,Invalid',
+        ]
+        return {
+            'file': SimpleUploadedFile('budget.csv', '\n'.join(rows).encode(), content_type='text/csv'),
+            'file_format': 'csv',
+        }
+
+    def route_calls(self, fleet):
+        """{url name: [Call]} covering every method of every budgeted route"""
+        vehicle = fleet[0]
+        selected = [other.pk for other in fleet[1:6]]
+        detail = [vehicle.pk]
+        vehicle_data = {
+            'vehicle_number': 'ZZ 09 BG 0009',
+            'vehicle_type': 'Four',
+            'vehicle_model': 'Budget Sedan',
+            'vehicle_description': 'Added by the query budget test',
+        }
+        url = reverse
+        return {
+            'vehicle_list': [
+                Call('get', 'user', url('vehicle_list')),
+                Call('get', 'user', url('vehicle_list') + '?q=Honda&type=Two'),
+                Call('get', 'user', url('vehicle_list') + '?ordering=-vehicle_number&page_size=50'),
+            ],
+            'vehicle_search': [Call('get', 'user', url('vehicle_search') + '?q=Honda')],
+            'vehicle_autocomplete': [Call('get', 'user', url('vehicle_autocomplete') + '?q=MH')],
+            'vehicle_export': [
+                Call('get', 'admin', url('vehicle_export') + '?format=csv'),
+                Call('get', 'admin', url('vehicle_export') + '?format=ndjson&type=Four'),
+            ],
+            'vehicle_import': [
+                Call('get', 'superadmin', url('vehicle_import')),
+                Call('post', 'superadmin', url('vehicle_import'), lambda: self.import_upload(fleet)),
+            ],
+            'vehicle_bulk': [
+                Call('post', 'admin', url('vehicle_bulk'),
+                     {'action': 'update', 'scope': 'selected', 'ids': selected, 'vehicle_model': 'Budget'}, 302),
+                Call('post', 'admin', url('vehicle_bulk') + '?type=Two',
+                     {'action': 'update', 'scope': 'filtered', 'vehicle_type': 'Four'}, 302),
+                Call('post', 'superadmin', url('vehicle_bulk'),
+                     {'action': 'delete', 'scope': 'selected', 'ids': selected}, 302),
+                Call('post', 'superadmin', url('vehicle_bulk') + '?type=Three',
+                     {'action': 'delete', 'scope': 'filtered'}, 302),
+            ],
+            'vehicle_add': [
+                Call('get', 'superadmin', url('vehicle_add')),
+                Call('post', 'superadmin', url('vehicle_add'), vehicle_data, 302),
+            ],
+            'vehicle_detail': [Call('get', 'user', url('vehicle_detail', args=detail))],
+            'vehicle_edit': [
+                Call('get', 'admin', url('vehicle_edit', args=detail)),
+                Call('post', 'admin', url('vehicle_edit', args=detail), vehicle_data, 302),
+            ],
+            'vehicle_history': [Call('get', 'admin', url('vehicle_history', args=detail))],
+            'vehicle_delete': [
+                Call('get', 'superadmin', url('vehicle_delete', args=detail)),
+                Call('post', 'superadmin', url('vehicle_delete', args=detail), {}, 302),
+            ],
+            'vehicle_api_list': [
+                Call('get', 'user', url('vehicle_api_list')),
+                Call('get', 'user', url('vehicle_api_list') + '?type=Two&fields=id,vehicle_number&page_size=50'),
+                Call('post', 'superadmin', url('vehicle_api_list'), vehicle_data, 201, json=True),
+            ],
+            'vehicle_api_changes': [
+                Call('get', 'user', url('vehicle_api_changes')),
+                Call('get', 'user', url('vehicle_api_changes') + '?limit=50'),
+            ],
+            'vehicle_api_detail': [
+                Call('get', 'user', url('vehicle_api_detail', args=detail)),
+                Call('put', 'admin', url('vehicle_api_detail', args=detail), vehicle_data, json=True),
+                Call('patch', 'admin', url('vehicle_api_detail', args=detail), {'vehicle_model': 'Budget'}, json=True),
+                Call('delete', 'superadmin', url('vehicle_api_detail', args=detail), status=204),
+            ],
+            'vehicle_api_plate': [Call('get', 'user', url('vehicle_api_plate', args=[vehicle.vehicle_number_normalized]))],
+            'register': [
+                Call('get', None, url('register')),
+                Call('post', None, url('register'), self.registration('budget_new'), 302),
+            ],
+            'verify_otp': [
+                Call('get', None, url('verify_otp', args=['budget_pending'])),
+                Call('post', None, url('verify_otp', args=['budget_pending']), lambda: {'otp': self.last_otp()}, 302,
+                     prepare=self.register_pending_user),
+            ],
+            'otp_delivery_status': [
+                Call('get', None, url('otp_delivery_status', args=['budget_pending']), prepare=self.register_pending_user),
+            ],
+            'login': [
+                Call('get', None, url('login')),
+                Call('post', None, url('login'), {'login': 'budget_user', 'password': BUDGET_PASSWORD}, 302),
+            ],
+            'logout': [Call('post', 'user', url('logout'), {}, 302)],
+        }
+
+    def count_queries(self, call):
+        """The queries one request runs, on cold caches, with its writes rolled back afterwards"""
+        client = Client()
+        if call.role:
+            client.force_login(self.users[call.role])
+        with rolled_back():
+            cache.clear()
+            vehicle_typeahead.invalidate()
+            mail.outbox = []
+            if call.prepare:
+                call.prepare()
+            data = call.data() if callable(call.data) else call.data
+            extra = {'content_type': 'application/json'} if call.json else {}
+            if call.json:
+                data = json.dumps(data)
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, call.method)(call.path, data, **extra)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        cache.clear()
+        vehicle_typeahead.invalidate()
+        self.assertEqual(response.status_code, call.status, f'{call.method.upper()} {call.path}')
+        return len(queries)
+
+    def test_routes_stay_within_their_query_budgets(self):
+        """Test every route has a budget, stays within it, and doesn't run more queries on more rows"""
+        routes = budgeted_routes()
+        counts = {}
+        for size in self.data_sizes:
+            with rolled_back():
+                calls = self.route_calls(self.seed(size))
+                self.assertEqual(set(calls), set(routes), 'every route needs a Call in route_calls()')
+                for name, route_calls in calls.items():
+                    for position, call in enumerate(route_calls):
+                        label = f'{name} {call.method.upper()} {call.path}'
+                        counts.setdefault((name, position), []).append(
+                            (label, size, self.count_queries(call), budget_for(routes[name], call.method))
+                        )
+
+        problems = []
+        for results in counts.values():
+            (label, _, smallest, budget), *_ = results
+            if budget is None:
+                problems.append(f'{label}: no @query_budget (runs {smallest} queries)')
+                continue
+            for label, size, count, _ in results:
+                if count > budget:
+                    problems.append(f'{label}: {count} queries with {size} vehicles, budget is {budget}')
+                if count > smallest:
+                    problems.append(
+                        f'{label}: {count} queries with {size} vehicles but {smallest} with {self.data_sizes[0]}'
+                    )
+        if problems:
+            self.fail('Query budgets exceeded:\n  ' + '\n  '.join(problems))
+
+
+class RequestMetricsTest(TestCase):
+    """Test the request metrics middleware and the /metrics endpoint"""
+
+    def setUp(self):
+        """Create an admin, a plain user and a few vehicles"""
+        cache.clear()
+        self.admin = CustomUser.objects.create_user(
+            username='metrics_admin', email='metricsadmin@test.com',
+            password='testpass123', role='admin', is_active=True
+        )
+        self.user = CustomUser.objects.create_user(
+            username='metrics_user', email='metricsuser@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        for number in range(3):
+            Vehicle.objects.create(
+                vehicle_number=f'METRIC{number}', vehicle_type='Two',
+                vehicle_model='Metric Scooter', vehicle_description='Metrics test'
+            )
+
+    def recorded(self, before, name, **labels):
+        """How much a sample grew since the `before` snapshot"""
+        key = (name, tuple(labels.items()))
+        return registry.snapshot().get(key, 0) - before.get(key, 0)
+
+    def test_metrics_endpoint_admin_only(self):
+        """Test anonymous users and plain users can't read the metrics"""
+        self.assertRedirects(self.client.get('/metrics'), reverse('login'), fetch_redirect_response=False)
+        self.client.force_login(self.user)
+        self.assertRedirects(self.client.get('/metrics'), reverse('vehicle_list'), fetch_redirect_response=False)
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE vehicle_http_request_duration_seconds histogram', response.content.decode())
+
+    def test_requests_recorded_per_url_name(self):
+        """Test counts, queries, template time and sizes are recorded under the URL name"""
+        self.client.force_login(self.user)
+        before = registry.snapshot()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('vehicle_list'))
+        query_count = len(queries)
+        self.client.get('/no-such-page/')
+
+        view = {'view': 'vehicle_list'}
+        self.assertEqual(self.recorded(before, 'vehicle_http_requests_total', **view, method='GET', status='200'), 1)
+        self.assertEqual(self.recorded(before, 'vehicle_http_db_queries_total', **view), query_count)
+        self.assertGreater(self.recorded(before, 'vehicle_http_db_query_seconds_total', **view), 0)
+        self.assertGreater(self.recorded(before, 'vehicle_http_template_render_seconds_sum', **view), 0)
+        self.assertEqual(self.recorded(before, 'vehicle_http_response_size_bytes_sum', **view), len(response.content))
+        self.assertEqual(self.recorded(before, 'vehicle_http_request_duration_seconds_count', **view), 1)
+        self.assertEqual(
+            self.recorded(before, 'vehicle_http_requests_total', view='unmatched', method='GET', status='404'), 1
+        )
+
+    def test_streamed_export_measured_as_it_is_sent(self):
+        """Test the queries run and bytes sent by a streamed export are recorded once the stream ends"""
+        self.client.force_login(self.admin)
+        before = registry.snapshot()
+        response = self.client.get(reverse('vehicle_export'), {'format': 'csv'})
+        self.assertEqual(self.recorded(before, 'vehicle_http_response_size_bytes_count', view='vehicle_export'), 0)
+        body = b''.join(response.streaming_content)
+        self.assertIn(b'METRIC2', body)
+        self.assertEqual(self.recorded(before, 'vehicle_http_response_size_bytes_sum', view='vehicle_export'), len(body))
+        self.assertGreaterEqual(self.recorded(before, 'vehicle_http_db_queries_total', view='vehicle_export'), 3)
+
+    @override_settings(ROOT_URLCONF='vehicle_mgmt.async_urls')
+    async def test_async_requests_recorded(self):
+        """Test the async views record their queries too"""
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        before = registry.snapshot()
+        response = await client.get(reverse('vehicle_list'))
+        self.assertContains(response, 'METRIC1')
+        self.assertGreater(self.recorded(before, 'vehicle_http_db_queries_total', view='vehicle_list'), 0)
+
+    def test_histograms_are_cumulative(self):
+        """Test the text format: buckets add up, +Inf equals the count, sums and counts follow"""
+        metrics = MetricsRegistry()
+        labels = (('view', 'vehicle_list'),)
+        for seconds in (0.003, 0.2, 0.2, 30):
+            metrics.observe('vehicle_http_request_duration_seconds', labels, seconds)
+        metrics.inc('vehicle_http_requests_total', labels + (('method', 'GET'), ('status', '200')), 4)
+        text = render_metrics(metrics.snapshot())
+        self.assertIn('vehicle_http_requests_total{view="vehicle_list",method="GET",status="200"} 4', text)
+        self.assertIn('vehicle_http_request_duration_seconds_bucket{view="vehicle_list",le="0.005"} 1', text)
+        self.assertIn('vehicle_http_request_duration_seconds_bucket{view="vehicle_list",le="0.1"} 1', text)
+        self.assertIn('vehicle_http_request_duration_seconds_bucket{view="vehicle_list",le="0.25"} 3', text)
+        self.assertIn('vehicle_http_request_duration_seconds_bucket{view="vehicle_list",le="10"} 3', text)
+        self.assertIn('vehicle_http_request_duration_seconds_bucket{view="vehicle_list",le="+Inf"} 4', text)
+        self.assertIn('vehicle_http_request_duration_seconds_count{view="vehicle_list"} 4', text)
+
+    def test_threads_record_without_losing_counts(self):
+        """Test per-thread shards add up to every increment"""
+        metrics = MetricsRegistry()
+        labels = (('view', 'vehicle_list'),)
+
+        def work():
+            for _ in range(1000):
+                metrics.inc('vehicle_http_db_queries_total', labels)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.snapshot()[('vehicle_http_db_queries_total', labels)], 8000)
+
+    def test_exited_threads_shards_are_retired(self):
+        """Test a thread per request doesn't leave a shard per thread, and keeps its counts"""
+        metrics = MetricsRegistry()
+        labels = (('view', 'vehicle_list'),)
+        for _ in range(50):
+            thread = threading.Thread(target=metrics.inc, args=('vehicle_http_requests_total', labels))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(metrics.snapshot()[('vehicle_http_requests_total', labels)], 50)
+        self.assertEqual(metrics._shards, [])
+        metrics.inc('vehicle_http_requests_total', labels)
+        self.assertEqual(len(metrics._shards), 1)
+        self.assertEqual(metrics.snapshot()[('vehicle_http_requests_total', labels)], 51)
+
+    def test_multiprocess_file_adds_up_workers(self):
+        """Test workers flush only what is new to the shared file and any worker reports the total"""
+        labels = (('view', 'vehicle_list'),)
+        key = ('vehicle_http_db_queries_total', labels)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.json')
+            with override_settings(VEHICLE_METRICS_MULTIPROCESS_FILE=path):
+                first, second = MetricsRegistry(), MetricsRegistry()
+                first.inc(*key, 5)
+                second.inc(*key, 2)
+                first.flush(path, force=True)
+                self.assertEqual(second.collect()[key], 7)
+                first.inc(*key, 1)
+                self.assertEqual(first.collect()[key], 8)
+                self.assertEqual(SharedMetricsFile(path).read()[key], 8)
+
+
+# A THRESHOLD EVERY QUERY GOES OVER
+@override_settings(VEHICLE_SLOW_QUERY_MS=0.000001)
+class SlowQueryLogTest(TestCase):
+    """Test the slow-query log: what is recorded, where it came from, and the admin page"""
+
+    def setUp(self):
+        """Start from an empty log with a user and a vehicle"""
+        cache.clear()
+        slow_query_log.clear()
+        self.user = CustomUser.objects.create_user(
+            username='slow_user', email='slowuser@test.com',
+            password='testpass123', role='user', is_active=True
+        )
+        self.vehicle = Vehicle.objects.create(
+            vehicle_number='SLOW1', vehicle_type='Four',
+            vehicle_model='Slow Sedan', vehicle_description='Slow query test'
+        )
+
+    def test_records_view_sql_params_and_call_site(self):
+        """Test a request's slow queries carry the view and the app frame that issued them"""
+        self.client.force_login(self.user)
+        with self.assertLogs('vehicles.slow_queries', 'WARNING'):
+            self.client.get(reverse('vehicle_detail', args=[self.vehicle.pk]))
+
+        records = slow_query_log.records()
+        self.assertTrue(records)
+        self.assertEqual({record.view for record in records}, {'vehicle_detail'})
+        vehicle_query = next(record for record in records if 'vehicles_vehicle' in record.sql)
+        self.assertIn(str(self.vehicle.pk), vehicle_query.params)
+        self.assertEqual(vehicle_query.alias, 'default')
+        self.assertGreater(vehicle_query.duration_ms, 0)
+
+    def test_call_site_is_the_app_code(self):
+        """Test the innermost frame in vehicles/ or users/ is named, with its source line"""
+        self.client.force_login(self.user)
+        with self.assertLogs('vehicles.slow_queries', 'WARNING'):
+            self.client.get(reverse('vehicle_list'))
+        stats_query = next(record for record in slow_query_log.records() if 'vehicletypecounter' in record.sql)
+        self.assertTrue(stats_query.call_site.startswith(os.path.join('vehicles', 'stats.py') + ':'))
+        self.assertTrue(stats_query.function)
+        self.assertTrue(stats_query.code)
+
+    def test_fast_queries_are_not_recorded(self):
+        """Test queries under the threshold leave nothing behind"""
+        with connection.execute_wrapper(SlowQueryRecorder(None, 'default', threshold_ms=60_000)):
+            list(Vehicle.objects.all())
+        self.assertEqual(slow_query_log.records(), [])
+
+    def test_nothing_goes_to_stderr_without_a_log_file(self):
+        """Test the slow-query logger has a handler of its own, so records never reach logging.lastResort"""
+        stderr = StringIO()
+        last_resort, logging.lastResort = logging.lastResort, logging.StreamHandler(stderr)
+        try:
+            with connection.execute_wrapper(SlowQueryRecorder(None, 'default')):
+                list(Vehicle.objects.all())
+        finally:
+            logging.lastResort = last_resort
+        self.assertTrue(slow_query_log.records())
+        self.assertEqual(stderr.getvalue(), '')
+
+    def test_ring_buffer_keeps_the_newest(self):
+        """Test the buffer is bounded and lists the newest query first"""
+        log = type(slow_query_log)(2)
+        for number in range(3):
+            log.add(number)
+        self.assertEqual(log.records(), [2, 1])
+
+    @override_settings(ROOT_URLCONF='vehicle_mgmt.async_urls')
+    async def test_async_views_are_recorded(self):
+        """Test the wrappers reach the thread the async ORM runs in"""
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with self.assertLogs('vehicles.slow_queries', 'WARNING'):
+            response = await client.get(reverse('vehicle_detail', args=[self.vehicle.pk]))
+        self.assertContains(response, 'SLOW1')
+        self.assertIn('vehicle_detail', {record.view for record in slow_query_log.records()})
+
+    def test_admin_page_superuser_only(self):
+        """Test superusers can read and clear the log; other staff can't"""
+        staff = CustomUser.objects.create_user(
+            username='slow_staff', email='slowstaff@test.com', password='testpass123', is_staff=True
+        )
+        superuser = CustomUser.objects.create_superuser(
+            username='slow_super', email='slowsuper@test.com', password='testpass123'
+        )
+        url = reverse('admin:vehicles_slow_queries')
+        self.client.force_login(staff)
+        with self.assertLogs('vehicles.slow_queries', 'WARNING'):
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(superuser)
+        with self.assertLogs('vehicles.slow_queries', 'WARNING'):
+            self.client.get(reverse('vehicle_detail', args=[self.vehicle.pk]))
+            response = self.client.get(url)
+        self.assertContains(response, 'vehicles_vehicle')
+        self.assertContains(response, 'vehicle_detail')
+
+        with override_settings(VEHICLE_SLOW_QUERY_MS=60_000):
+            response = self.client.post(url)
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual(slow_query_log.records(), [])
+
+
+class RequestProfilingTest(TestCase):
+    """Test on-demand and sampled request profiling and the admin pages for the profiles"""
+
+    def setUp(self):
+        """Create a superadmin (also staff, for the admin), an admin and a vehicle"""
+        cache.clear()
+        self.superadmin = CustomUser.objects.create_user(
+            username='profiler', email='profiler@test.com', password='testpass123',
+            role='superadmin', is_staff=True, is_active=True
+        )
+        self.admin_user = CustomUser.objects.create_user(
+            username='profile_admin', email='profileadmin@test.com', password='testpass123',
+            role='admin', is_staff=True, is_active=True
+        )
+        Vehicle.objects.create(
+            vehicle_number='PROF1', vehicle_type='Two',
+            vehicle_model='Profiled Bike', vehicle_description='Profiling test'
+        )
+
+    def profile(self, path, **extra):
+        response = self.client.get(path, **extra)
+        self.assertEqual(response.status_code, 200)
+        return RequestProfile.objects.get(pk=response['X-Profile-Id'])
+
+    def test_superadmin_flag_profiles_the_request(self):
+        """Test ?profile=1 stores the hot functions, the SQL and loadable pstats data"""
+        self.client.force_login(self.superadmin)
+        profile = self.profile(reverse('vehicle_list') + '?profile=1')
+
+        self.assertEqual(profile.view_name, 'vehicle_list')
+        self.assertEqual(profile.user, self.superadmin)
+        self.assertFalse(profile.sampled)
+        self.assertGreater(profile.query_count, 0)
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertTrue(any('vehicles_vehicle' in query['sql'] for query in profile.queries))
+        self.assertIn('cumulative', profile.summary)
+        functions = {function for _, _, function in load_stats(profile.stats).stats}
+        self.assertIn('get', functions)
+
+    def test_header_flag(self):
+        """Test the X-Profile header works like the query flag"""
+        self.client.force_login(self.superadmin)
+        profile = self.profile(reverse('vehicle_list'), HTTP_X_PROFILE='1')
+        self.assertEqual(profile.method, 'GET')
+
+    def test_flag_ignored_for_other_roles(self):
+        """Test only superadmins can ask for a profile"""
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('vehicle_list') + '?profile=1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(VEHICLE_PROFILE_SAMPLE_EVERY=3)
+    def test_sampling_profiles_one_in_n(self):
+        """Test sampling profiles every Nth request, whoever makes it"""
+        for _ in range(6):
+            self.client.get(reverse('about'))
+        self.assertEqual(RequestProfile.objects.filter(sampled=True).count(), 2)
+
+    @override_settings(VEHICLE_PROFILE_SAMPLE_EVERY=1)
+    def test_sampled_login_stores_no_secrets(self):
+        """Test profiled SQL keeps its placeholders, never the passwords, hashes or session data it ran with"""
+        self.client.post(reverse('login'), {'login': 'profile_admin', 'password': 'testpass123'})
+        queries = [query for profile in RequestProfile.objects.all() for query in profile.queries]
+        self.assertTrue(any('users_customuser' in query['sql'] for query in queries))
+        self.assertTrue(all(set(query) == {'alias', 'sql', 'ms'} for query in queries))
+        stored = json.dumps(queries)
+        self.assertNotIn(self.admin_user.password, stored)
+        self.assertNotIn(self.client.session.session_key, stored)
+
+    @override_settings(VEHICLE_PROFILE_SAMPLE_EVERY=1, DATABASE_REPLICAS=['default'])
+    def test_storing_a_profile_does_not_pin_the_session(self):
+        """Test a read-only request stays off the primary after its profile is written"""
+        self.client.force_login(self.superadmin)
+        response = self.client.get(reverse('vehicle_list'))
+        self.assertIn('X-Profile-Id', response)
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+    def test_unstored_profile_keeps_the_response(self):
+        """Test a profile the database rejects is logged and the view's response still goes out"""
+        def fail(**kwargs):
+            raise DatabaseError('database is locked')
+
+        self.client.force_login(self.superadmin)
+        pre_save.connect(fail, sender=RequestProfile)
+        try:
+            with self.assertLogs('vehicles.profiling', 'ERROR'):
+                response = self.client.get(reverse('vehicle_list') + '?profile=1')
+        finally:
+            pre_save.disconnect(fail, sender=RequestProfile)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+
+    @override_settings(VEHICLE_PROFILE_KEEP_DAYS=7)
+    def test_prune_request_profiles(self):
+        """Test the prune command deletes profiles past the retention period"""
+        self.client.force_login(self.superadmin)
+        old = self.profile(reverse('about') + '?profile=1')
+        recent = self.profile(reverse('about') + '?profile=1')
+        RequestProfile.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=8))
+
+        out = StringIO()
+        call_command('prune_request_profiles', stdout=out)
+        self.assertIn('Pruned 1 request profiles', out.getvalue())
+        self.assertEqual(list(RequestProfile.objects.values_list('pk', flat=True)), [recent.pk])
+
+    @override_settings(ROOT_URLCONF='vehicle_mgmt.async_urls')
+    async def test_async_request(self):
+        """Test async views are profiled, with the SQL their ORM thread ran"""
+        client = AsyncClient()
+        await client.aforce_login(self.superadmin)
+        response = await client.get(reverse('vehicle_list') + '?profile=1')
+        profile = await RequestProfile.objects.aget(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.view_name, 'vehicle_list')
+        self.assertTrue(any('vehicles_vehicle' in query['sql'] for query in profile.queries))
+
+    def test_admin_browse_download_and_compare(self):
+        """Test superadmins can list, open, download and compare profiles"""
+        self.client.force_login(self.superadmin)
+        first = self.profile(reverse('vehicle_list') + '?profile=1')
+        second = self.profile(reverse('about') + '?profile=1')
+
+        response = self.client.get(reverse('admin:vehicles_requestprofile_changelist'))
+        self.assertContains(response, 'vehicle_list')
+        response = self.client.get(reverse('admin:vehicles_requestprofile_change', args=[first.pk]))
+        self.assertContains(response, 'vehicles_vehicle')
+
+        response = self.client.get(reverse('admin:vehicles_requestprofile_pstats', args=[first.pk]))
+        self.assertEqual(marshal.loads(response.content), load_stats(first.stats).stats)
+
+        response = self.client.post(reverse('admin:vehicles_requestprofile_changelist'), {
+            'action': 'compare_profiles', '_selected_action': [first.pk, second.pk],
+        })
+        compare = reverse('admin:vehicles_requestprofile_compare')
+        self.assertRedirects(response, f'{compare}?before={first.pk}&after={second.pk}', fetch_redirect_response=False)
+        response = self.client.get(response['Location'])
+        self.assertContains(response, 'Compare profiles')
+        self.assertEqual(len(response.context['rows']), len(diff_stats(
+            load_stats(first.stats), load_stats(second.stats)
+        )))
+
+    def test_admin_is_superadmin_only(self):
+        """Test other staff can't reach the stored profiles"""
+        self.client.force_login(self.superadmin)
+        profile = self.profile(reverse('vehicle_list') + '?profile=1')
+
+        self.client.force_login(self.admin_user)
+        self.assertEqual(self.client.get(reverse('admin:vehicles_requestprofile_changelist')).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('admin:vehicles_requestprofile_pstats', args=[profile.pk])).status_code, 403
+        )
+
+    def test_diff_stats(self):
+        """Test the diff lists the biggest cumulative change first"""
+        before = load_stats(marshal.dumps(
+            {('a.py', 1, 'slow'): (1, 1, 0.1, 0.5, {}), ('a.py', 2, 'same'): (1, 1, 0.1, 0.1, {})}
+        ))
+        after = load_stats(marshal.dumps(
+            {('a.py', 1, 'slow'): (2, 2, 0.2, 1.5, {}), ('a.py', 2, 'same'): (1, 1, 0.1, 0.1, {})}
+        ))
+        rows = diff_stats(before, after)
+        self.assertEqual(rows[0]['function'], 'slow (a.py:1)')
+        self.assertEqual(rows[0]['calls'], (1, 2))
+        self.assertAlmostEqual(rows[0]['delta'], 1.0)
+
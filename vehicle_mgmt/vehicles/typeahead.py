@@ -0,0 +1,240 @@
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Vehicle, normalize_vehicle_number
+
+logger = logging.getLogger(__name__)
+
+# IN-PROCESS PREFIX INDEX FOR PLATE / MODEL SUGGESTIONS
+#
+# Each worker keeps two sorted lists of "key\0pk" strings: canonical plate
+# numbers, and model names (whole name plus each later word, casefolded).
+# A prefix query is a bisect to the first candidate followed by a short
+# forward walk, so it doesn't depend on fleet size. The index is loaded on
+# first use and patched from this worker's committed saves and deletes (see
+# vehicles/signals.py); writes made by other workers show up when it is
+# reloaded after VEHICLE_TYPEAHEAD_MAX_AGE seconds. Loads run one at a
+# time on a background thread (VEHICLE_TYPEAHEAD_BACKGROUND_BUILD) while
+# queries keep using the old index, or the database until the first load
+# is done, so no request waits for the table scan. Fleets larger than
+# VEHICLE_TYPEAHEAD_MAX_VEHICLES are not held in memory; queries then
+# fall back to a range scan on the unique normalized-plate index.
+SEPARATOR = "\0"
+
+
+def model_keys(vehicle_model):
+    """The whole model name and every later word, so "acti" finds "Honda Activa" """
+    words = re.findall(r"\w+", (vehicle_model or "").casefold())
+    if not words:
+        return []
+    return [" ".join(words[position:]) for position in range(len(words))]
+
+
+class SortedPrefixIndex:
+    """Sorted "key\\0pk" strings; bisect finds the first key with a prefix"""
+
+    def __init__(self, entries=()):
+        self.entries = sorted(entries)
+
+    def add(self, key, pk):
+        insort(self.entries, f"{key}{SEPARATOR}{pk}")
+
+    def remove(self, key, pk):
+        entry = f"{key}{SEPARATOR}{pk}"
+        position = bisect_left(self.entries, entry)
+        if position < len(self.entries) and self.entries[position] == entry:
+            del self.entries[position]
+
+    def search(self, prefix, limit):
+        """Primary keys of up to `limit` entries whose key starts with prefix, in key order"""
+        pks = []
+        position = bisect_left(self.entries, prefix)
+        while position < len(self.entries) and len(pks) < limit:
+            key, _, pk = self.entries[position].rpartition(SEPARATOR)
+            if not key.startswith(prefix):
+                break
+            pk = int(pk)
+            if pk not in pks:
+                pks.append(pk)
+            position += 1
+        return pks
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class VehicleTypeahead:
+    """Per-worker plate / model suggestion index, built lazily and kept current by signals"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # ONE LOAD AT A TIME (THE THREAD RUNNING IT, WHEN IN THE BACKGROUND)
+        self._build_lock = threading.Lock()
+        self._refresher = None
+        # BUMPED BY invalidate(), SO A LOAD STARTED BEFORE A BULK WRITE IS THROWN AWAY
+        self._generation = 0
+        # UPDATES MADE WHILE A LOAD READS THE TABLE, REPLAYED ON THE NEW INDEX
+        self._missed = None
+        self._reset()
+
+    def _reset(self):
+        self.built_at = None
+        self.too_large = False
+        self.numbers = SortedPrefixIndex()
+        self.models = SortedPrefixIndex()
+        # pk -> (vehicle_number, vehicle_model, vehicle_type)
+        self.vehicles = {}
+
+    @property
+    def ready(self):
+        return self.built_at is not None and not self.too_large
+
+    def build(self, rows=None):
+        """(Re)build from (pk, vehicle_number, vehicle_model, vehicle_type) rows, or the database"""
+        with self._lock:
+            generation = self._generation
+            self._missed = []
+        if rows is None:
+            rows = Vehicle.objects.values_list(
+                "pk", "vehicle_number", "vehicle_model", "vehicle_type"
+            ).iterator(chunk_size=5000)
+        vehicles, numbers, models = {}, [], []
+        limit = settings.VEHICLE_TYPEAHEAD_MAX_VEHICLES
+        for pk, vehicle_number, vehicle_model, vehicle_type in rows:
+            if len(vehicles) >= limit:
+                with self._lock:
+                    self._missed = None
+                    if generation == self._generation:
+                        self._reset()
+                        self.too_large = True
+                        self.built_at = time.monotonic()
+                return
+            vehicles[pk] = (vehicle_number, vehicle_model, vehicle_type)
+            numbers.append(f"{normalize_vehicle_number(vehicle_number)}{SEPARATOR}{pk}")
+            models.extend(f"{key}{SEPARATOR}{pk}" for key in model_keys(vehicle_model))
+        with self._lock:
+            missed, self._missed = self._missed, None
+            if generation != self._generation:
+                return
+            self.vehicles = vehicles
+            self.numbers = SortedPrefixIndex(numbers)
+            self.models = SortedPrefixIndex(models)
+            self.too_large = False
+            self.built_at = time.monotonic()
+            for row in missed:
+                self._apply(*row)
+
+    @property
+    def stale(self):
+        max_age = settings.VEHICLE_TYPEAHEAD_MAX_AGE
+        return self.built_at is None or bool(max_age and time.monotonic() - self.built_at > max_age)
+
+    def _ensure_built(self):
+        if not self.stale:
+            return
+        if settings.VEHICLE_TYPEAHEAD_BACKGROUND_BUILD:
+            self._start_refresh()
+            return
+        # INLINE (THE TEST RUNNER): STILL ONE LOAD AT A TIME, THE OTHERS WAIT FOR IT
+        with self._build_lock:
+            if self.stale:
+                self.build()
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh, name="vehicle-typeahead-build", daemon=True)
+            self._refresher.start()
+
+    def _refresh(self):
+        try:
+            with self._build_lock:
+                self.build()
+        except Exception:
+            logger.exception("Could not load the vehicle typeahead index")
+        finally:
+            with self._lock:
+                self._refresher = None
+            connection.close()
+
+    def invalidate(self):
+        """Drop the index; the next query reloads it (after bulk writes)"""
+        with self._lock:
+            self._generation += 1
+            self._reset()
+
+    # INCREMENTAL UPDATES FROM SIGNALS, AFTER COMMIT (ONLY WHILE AN INDEX IS LOADED OR LOADING)
+    def update(self, pk, vehicle_number, vehicle_model, vehicle_type):
+        self._apply(pk, vehicle_number, vehicle_model, vehicle_type)
+
+    def remove(self, pk):
+        self._apply(pk)
+
+    def _apply(self, pk, *values):
+        """Index (vehicle_number, vehicle_model, vehicle_type) under pk, or drop pk without values"""
+        with self._lock:
+            if self._missed is not None:
+                self._missed.append((pk, *values))
+            if not self.ready:
+                return
+            self._remove(pk)
+            if not values:
+                return
+            if len(self.vehicles) >= settings.VEHICLE_TYPEAHEAD_MAX_VEHICLES:
+                self._reset()
+                return
+            vehicle_number, vehicle_model, vehicle_type = values
+            self.vehicles[pk] = (vehicle_number, vehicle_model, vehicle_type)
+            self.numbers.add(normalize_vehicle_number(vehicle_number), pk)
+            for key in model_keys(vehicle_model):
+                self.models.add(key, pk)
+
+    def _remove(self, pk):
+        known = self.vehicles.pop(pk, None)
+        if known is None:
+            return
+        vehicle_number, vehicle_model, _ = known
+        self.numbers.remove(normalize_vehicle_number(vehicle_number), pk)
+        for key in model_keys(vehicle_model):
+            self.models.remove(key, pk)
+
+    # QUERIES
+    def suggest(self, query, limit=10):
+        """[(pk, vehicle_number, vehicle_model, vehicle_type)] for plates, then models, starting with query"""
+        plate_prefix = normalize_vehicle_number(query)
+        model_prefix = " ".join(re.findall(r"\w+", (query or "").casefold()))
+        if not model_prefix:
+            return []
+        self._ensure_built()
+        with self._lock:
+            if self.ready:
+                pks = self.numbers.search(plate_prefix, limit) if plate_prefix else []
+                if len(pks) < limit:
+                    pks += [pk for pk in self.models.search(model_prefix, limit) if pk not in pks]
+                return [(pk, *self.vehicles[pk]) for pk in pks[:limit]]
+        # TOO LARGE, OR THE FIRST LOAD IS STILL RUNNING
+        return self._suggest_from_database(plate_prefix, limit)
+
+    def _suggest_from_database(self, plate_prefix, limit):
+        # RANGE SCAN ON THE UNIQUE INDEX (A startswith LIKE CAN'T USE IT ON SQLITE)
+        if not plate_prefix:
+            return []
+        return list(
+            Vehicle.objects.filter(
+                vehicle_number_normalized__gte=plate_prefix,
+                vehicle_number_normalized__lt=plate_prefix + "\uffff",
+            )
+            .order_by("vehicle_number_normalized")
+            .values_list("pk", "vehicle_number", "vehicle_model", "vehicle_type")[:limit]
+        )
+
+
+# ONE INDEX PER WORKER PROCESS
+vehicle_typeahead = VehicleTypeahead()
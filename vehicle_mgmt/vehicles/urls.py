@@ -1,10 +1,20 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("",views.vehicle_list,name="vehicle_list"),
+    path("search/",views.VehicleSearchView.as_view(),name="vehicle_search"),
+    path("autocomplete/",views.VehicleAutocompleteView.as_view(),name="vehicle_autocomplete"),
+    path("export/",views.VehicleExportView.as_view(),name="vehicle_export"),
+    path("import/",views.VehicleImportView.as_view(),name="vehicle_import"),
+    path("bulk/",views.VehicleBulkView.as_view(),name="vehicle_bulk"),
     path("add/",views.VehicleCreateView.as_view(),name="vehicle_add"),
     path("<int:pk>/",views.VehicleDetailView.as_view(),name="vehicle_detail"),
     path("<int:pk>/edit",views.VehicleUpdateView.as_view(),name="vehicle_edit"),
+    path("<int:pk>/history/",views.VehicleHistoryView.as_view(),name="vehicle_history"),
     path("<int:pk>/delete/",views.VehicleDeleteView.as_view(),name="vehicle_delete"),
+    path("api/",api.VehicleApiListView.as_view(),name="vehicle_api_list"),
+    path("api/changes/",api.VehicleApiChangesView.as_view(),name="vehicle_api_changes"),
+    path("api/<int:pk>/",api.VehicleApiDetailView.as_view(),name="vehicle_api_detail"),
+    path("api/plate/<str:plate>/",api.VehicleApiPlateView.as_view(),name="vehicle_api_plate"),
 ]
@@ -1,13 +1,26 @@
 from django.shortcuts import render,get_object_or_404,redirect
 from django.contrib.auth.mixins import LoginRequiredMixin,UserPassesTestMixin
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
-from .models import Vehicle
-from .forms import VehicleForm
+from django.http import Http404
+from django.views.generic import View, FormView, ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.urls import reverse, reverse_lazy
+from .models import Vehicle, VehicleChange
+from .forms import VehicleBulkForm, VehicleForm, VehicleImportForm
+from .pagination import KeysetPaginationMixin, KeysetPaginator, page_size_from_request
+from .stats import get_fleet_stats_context
+from .search import rank_vehicles
+from .typeahead import vehicle_typeahead
+from .filters import filter_vehicles, ordering_from_request
+from .exports import EXPORT_FORMATS, export_response
+from .importers import NOT_UTF8_MESSAGE, import_vehicles_from_upload
+from .fragments import cached_vehicle_page, render_vehicle_rows
+from .bulk import bulk_delete_vehicles, bulk_update_vehicles
+from .metrics import render_metrics
 from django.core.mail import send_mail
 from django.contrib import messages
 import random
 from django.conf import settings
+from vehicle_mgmt.query_budgets import query_budget
 # Create your views here.
 
 # CUSTOM ROLE-BASED ACCESS MIXIN
@@ -24,31 +37,196 @@ class RoleRequiredMixin(UserPassesTestMixin):
             return redirect('vehicle_list')
         else:
             return redirect('login')
+
 #  VEHICLE LIST VIEW (ALL ROLES CAN VIEW)
-class VehicleListView(LoginRequiredMixin,RoleRequiredMixin,ListView):
+class VehicleListView(LoginRequiredMixin,RoleRequiredMixin,KeysetPaginationMixin,ListView):
     model = Vehicle
     template_name = 'vehicles/list.html'
     context_object_name = 'vehicles'
     allowed_roles = ["superadmin", "admin", "user"]
 
+    def get_queryset(self):
+        return filter_vehicles(self.request, super().get_queryset())
+
+    def get_keyset_ordering(self):
+        return ordering_from_request(self.request)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['rows_html'] = render_vehicle_rows(context['object_list'])
+        context['bulk_form'] = VehicleBulkForm()
+        context.update(get_fleet_stats_context())
+        return context
+
 # MAPING URL TO TEMPLATE (VIEW)
+@query_budget(4)
 def vehicle_list(request):
-    vehicles = Vehicle.objects.all()
+    # ONLY ONE PAGE OF ROWS IS LOADED, THE CURSORS IN ?after= / ?before= PICK WHICH ONE
+    # ?type=, ?q= AND ?ordering= ARE APPLIED IN THE DATABASE
+    def get_page():
+        vehicles = filter_vehicles(request, Vehicle.objects.all())
+        paginator = KeysetPaginator(
+            vehicles,
+            ordering=ordering_from_request(request),
+            page_size=page_size_from_request(request),
+        )
+        return paginator.page_from_request(request)
 
-    # COUNT VEHICLES BY TYPE
-    two_wheeler_count = Vehicle.objects.filter(vehicle_type='Two').count()
-    three_wheeler_count = Vehicle.objects.filter(vehicle_type='Three').count()
-    four_wheeler_count = Vehicle.objects.filter(vehicle_type='Four').count()
+    # ON A WARM CACHE THE ROWS COME BACK PRE-RENDERED AND THE PAGE QUERY IS SKIPPED
+    page, rows_html = cached_vehicle_page(request, get_page)
 
     context = {
-        'vehicles' : vehicles,
-        'two_wheeler_count' : two_wheeler_count,
-        'three_wheeler_count' : three_wheeler_count,
-        'four_wheeler_count' : four_wheeler_count
+        'vehicles' : page,
+        'page_obj' : page,
+        'rows_html' : rows_html,
+        'bulk_form' : VehicleBulkForm(),
     }
+    # TOTAL AND PER-TYPE COUNTS FOR THE STATS CARDS
+    context.update(get_fleet_stats_context())
     return render(request,"vehicles/list.html",context)
 
+# VEHICLE SEARCH (ALL ROLES) - RANKED JSON RESULTS FROM THE FULL-TEXT INDEX
+@query_budget(3)
+class VehicleSearchView(LoginRequiredMixin,RoleRequiredMixin,View):
+    allowed_roles = ["superadmin", "admin", "user"]
+    max_results = 50
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        try:
+            limit = min(int(request.GET.get('limit', 20)), self.max_results)
+        except ValueError:
+            limit = 20
+        results = [
+            {
+                'id': vehicle.pk,
+                'vehicle_number': vehicle.vehicle_number,
+                'vehicle_type': vehicle.vehicle_type,
+                'vehicle_model': vehicle.vehicle_model,
+                'url': reverse('vehicle_detail', args=[vehicle.pk]),
+            }
+            for vehicle in rank_vehicles(query, limit=max(limit, 1))
+        ]
+        return JsonResponse({'query': query, 'results': results})
+
+# PLATE / MODEL TYPEAHEAD (ALL ROLES) - PREFIX SUGGESTIONS FROM THE IN-MEMORY INDEX
+@query_budget(3)
+class VehicleAutocompleteView(LoginRequiredMixin,RoleRequiredMixin,View):
+    allowed_roles = ["superadmin", "admin", "user"]
+    max_results = 20
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        try:
+            limit = min(int(request.GET.get('limit', 10)), self.max_results)
+        except ValueError:
+            limit = 10
+        results = [
+            {
+                'id': pk,
+                'vehicle_number': vehicle_number,
+                'vehicle_model': vehicle_model,
+                'vehicle_type': vehicle_type,
+                'url': reverse('vehicle_detail', args=[pk]),
+            }
+            for pk, vehicle_number, vehicle_model, vehicle_type
+            in vehicle_typeahead.suggest(query, limit=max(limit, 1))
+        ]
+        return JsonResponse({'query': query, 'results': results})
+
+# VEHICLE EXPORT (SUPERADMIN + ADMIN) - STREAMED CSV / NDJSON OF THE FILTERED FLEET
+@query_budget(3)
+class VehicleExportView(LoginRequiredMixin,RoleRequiredMixin,View):
+    allowed_roles = ["superadmin", "admin"]
+
+    def get(self, request):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest("Unsupported export format.")
+        vehicles = filter_vehicles(request, Vehicle.objects.all())
+        return export_response(vehicles, export_format)
+
+# VEHICLE BULK IMPORT (ONLY SUPERADMIN) - CSV / NDJSON UPLOAD WITH A PER-ROW ERROR REPORT
+@query_budget(get=2, post=8)
+class VehicleImportView(LoginRequiredMixin,RoleRequiredMixin,FormView):
+    form_class = VehicleImportForm
+    template_name = 'vehicles/import.html'
+    allowed_roles = ["superadmin"]
+
+    def form_valid(self, form):
+        try:
+            report = import_vehicles_from_upload(
+                form.cleaned_data['file'], form.cleaned_data['file_format']
+            )
+        except UnicodeDecodeError as error:
+            form.add_error('file', NOT_UTF8_MESSAGE.format(error=error.reason))
+            return self.form_invalid(form)
+        if report.ok:
+            messages.success(self.request, f"Imported {report.imported} vehicles.")
+        else:
+            messages.warning(
+                self.request,
+                f"Imported {report.imported} vehicles, skipped {report.error_count} invalid rows."
+            )
+        return self.render_to_response(self.get_context_data(form=VehicleImportForm(), report=report))
+
+# BULK EDIT (SUPERADMIN + ADMIN) / BULK DELETE (ONLY SUPERADMIN) OF THE TICKED OR FILTERED VEHICLES
+@query_budget(post=9)
+class VehicleBulkView(LoginRequiredMixin,RoleRequiredMixin,View):
+    allowed_roles = ["superadmin", "admin"]
+    delete_roles = ["superadmin"]
+
+    def post(self, request):
+        # ?type= / ?q= ON THE FORM ACTION DESCRIBE THE FILTERED SET, LIKE THE EXPORT LINKS
+        list_url = reverse('vehicle_list')
+        if request.GET:
+            list_url = f"{list_url}?{request.GET.urlencode()}"
+
+        form = VehicleBulkForm(request.POST)
+        if not form.is_valid():
+            for error in form.non_field_errors() or ["Invalid bulk action."]:
+                messages.error(request, error)
+            return redirect(list_url)
+
+        if form.cleaned_data['scope'] == 'filtered':
+            vehicles = filter_vehicles(request, Vehicle.objects.all())
+        else:
+            vehicles = Vehicle.objects.filter(pk__in=form.cleaned_data['ids'])
+
+        if form.cleaned_data['action'] == 'delete':
+            if request.user.role not in self.delete_roles:
+                messages.error(request, self.permission_denied_message)
+                return redirect(list_url)
+            count = bulk_delete_vehicles(vehicles)
+            messages.success(request, f"Deleted {count} vehicles.")
+        else:
+            count = bulk_update_vehicles(vehicles, form.changes())
+            messages.success(request, f"Updated {count} vehicles.")
+        return redirect(list_url)
+
+# VEHICLE CHANGE HISTORY (SUPERADMIN + ADMIN) - NEWEST FIRST, KEYSET PAGES OVER (vehicle_id, changed_at)
+@query_budget(4)
+class VehicleHistoryView(LoginRequiredMixin,RoleRequiredMixin,KeysetPaginationMixin,ListView):
+    template_name = 'vehicles/history.html'
+    context_object_name = 'changes'
+    allowed_roles = ["superadmin", "admin"]
+    keyset_ordering = ("-changed_at", "-id")
+
+    def get_queryset(self):
+        return VehicleChange.objects.filter(vehicle_id=self.kwargs['pk'])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # THE HISTORY OF A DELETED VEHICLE IS STILL READABLE
+        vehicle = Vehicle.objects.filter(pk=self.kwargs['pk']).first()
+        if vehicle is None and not context['changes']:
+            raise Http404("No history for this vehicle.")
+        context['vehicle'] = vehicle
+        context['vehicle_number'] = vehicle.vehicle_number if vehicle else context['changes'][0].vehicle_number
+        return context
+
 # VEHICLE DETAIL VIEW (ALL ROLES CAN VIEW)
+@query_budget(3)
 class VehicleDetailView(LoginRequiredMixin,RoleRequiredMixin,DetailView):
     model = Vehicle
     template_name = 'vehicles/detail.html'
@@ -61,6 +239,7 @@ def vehicle_detail(request,pk):
     return render(request,"vehicles/detail.html",{"vehicle":vehicle})
 
 # VEHICLE CREATE VIEW (ONLY SUPERADMIN)
+@query_budget(get=2, post=5)
 class VehicleCreateView(LoginRequiredMixin,RoleRequiredMixin,CreateView):
     model = Vehicle
     template_name = 'vehicles/form.html'
@@ -81,6 +260,7 @@ def vehicle_create(request):
     
 
 # VEHICLE UPDATE VIEW (ONLY SUPERADMIN + ADMIN)
+@query_budget(get=3, post=9)
 class VehicleUpdateView(LoginRequiredMixin,RoleRequiredMixin,UpdateView):
     model = Vehicle
     fields = ["vehicle_number","vehicle_type","vehicle_model","vehicle_description"]
@@ -101,6 +281,7 @@ def vehicle_edit(request, pk):
     return render(request, "vehicles/form.html", {"form": form, "form_title": "Edit Vehicle"})
 
 # VEHICLE DELETE VIEW (ONLY SUPERADMIN)
+@query_budget(get=3, post=6)
 class VehicleDeleteView(LoginRequiredMixin,RoleRequiredMixin,DeleteView):
     model = Vehicle
     template_name = 'vehicles/delete.html'
@@ -115,3 +296,9 @@ def vehicle_delete(request, pk):
         return redirect("vehicle_list")
     return render(request, "vehicles/delete.html", {"vehicle": vehicle})
 
+# REQUEST METRICS (SUPERADMIN + ADMIN) - PROMETHEUS TEXT FORMAT, SERVED AT /metrics
+class MetricsView(LoginRequiredMixin,RoleRequiredMixin,View):
+    allowed_roles = ["superadmin", "admin"]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")